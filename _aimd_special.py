@@ -0,0 +1,149 @@
+# -----------------------------
+# AIMD CONCURRENCY CONTROL
+# -----------------------------
+# Any fixed concurrency is either too slow or trips HKJC throttling. An
+# AimdLimiter gates concurrent requests the way TCP gates its window:
+#   - additive increase: +1 slot after each full window of healthy requests
+#     (p95 latency and error rate under target)
+#   - multiplicative decrease: x0.5 on a timeout, HTTP 429/5xx or an
+#     empty race table (at most once per cooldown, so one burst of errors
+#     counts once)
+# The current limit is exposed through limiter_metrics().
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from special.utils_special import log
+
+OK = "ok"
+ERROR = "error"        # counts towards the error rate
+THROTTLE = "throttle"  # backs off immediately
+
+_LIMITERS = {}
+
+def _p95(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+class AimdLimiter:
+
+    def __init__(self, name, initial=2, min_limit=1, max_limit=16,
+                 target_p95=6.0, max_error_rate=0.05, window=20,
+                 increase=1.0, decrease=0.5, cooldown=None):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = target_p95 if cooldown is None else cooldown
+        self.in_flight = 0
+        self._samples = deque(maxlen=window)   # (latency, outcome)
+        self._since_change = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        _LIMITERS[name] = self
+
+    # -- gating --
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started, outcome=OK):
+        latency = time.monotonic() - started
+        with self._cond:
+            self.in_flight -= 1
+            self._record(latency, outcome)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        with limiter.slot() as s:
+            ...            # an exception counts as ERROR
+            s.outcome = THROTTLE
+        """
+        handle = _Slot()
+        started = self.acquire()
+        try:
+            yield handle
+        except Exception:
+            if handle.outcome == OK:
+                handle.outcome = ERROR
+            raise
+        finally:
+            self.release(started, handle.outcome)
+
+    # -- control law --
+    def _record(self, latency, outcome):
+        self._samples.append((latency, outcome))
+        self._since_change += 1
+        now = time.monotonic()
+
+        if outcome == THROTTLE:
+            if now - self._last_decrease >= self.cooldown:
+                self._set_limit(self.limit * self.decrease, "backoff")
+                self._last_decrease = now
+            return
+
+        # Judge only after a full window at the current limit
+        if self._since_change < max(self._samples.maxlen // 2, int(self.limit)):
+            return
+        p95, error_rate = self._stats()
+        if error_rate > self.max_error_rate or (p95 is not None and p95 > self.target_p95):
+            if now - self._last_decrease >= self.cooldown:
+                self._set_limit(self.limit * self.decrease, f"p95={p95}s errors={error_rate:.0%}")
+                self._last_decrease = now
+        else:
+            self._set_limit(self.limit + self.increase, "healthy")
+
+    def _stats(self):
+        latencies = [lat for lat, outcome in self._samples if outcome == OK]
+        errors = sum(1 for _, outcome in self._samples if outcome != OK)
+        p95 = _p95(latencies)
+        return (None if p95 is None else round(p95, 3)), (errors / len(self._samples) if self._samples else 0.0)
+
+    def _set_limit(self, value, reason):
+        new = min(self.max_limit, max(self.min_limit, value))
+        self._since_change = 0
+        if int(new) != int(self.limit):
+            log("INFO", f"[AIMD] {self.name} limit {int(self.limit)} -> {int(new)} ({reason})")
+        self.limit = new
+
+    def metrics(self):
+        with self._cond:
+            p95, error_rate = self._stats()
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "p95": p95,
+                "error_rate": error_rate,
+                "samples": len(self._samples),
+            }
+
+class _Slot:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = OK
+
+def limiter_metrics():
+    """Current state of every limiter, e.g. for the run summary."""
+    return {name: limiter.metrics() for name, limiter in _LIMITERS.items()}
+
+def classify_http_status(status_code):
+    if status_code == 429 or status_code >= 500:
+        return THROTTLE
+    if status_code >= 400:
+        return ERROR
+    return OK
@@ -0,0 +1,247 @@
+# -----------------------------
+# POINT-IN-TIME (AS-OF) FEATURES
+# -----------------------------
+# The preference tables describe a horse's whole history as of scrape time.
+# For backtesting we need each feature as it stood *before* a given race.
+# Each horse's races are read once in date order and cumulative prefix
+# counters are kept per preference key: a race's feature vector is read from
+# the counters first and only then is the race added, so nothing leaks from
+# the race itself or later ones. One linear pass per horse.
+
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+
+from special.utils_special import log, get_distance_group, get_draw_group
+import _horse_dynamic_stats_special as stats
+
+STYLE_BUCKETS = ("Leader", "On-pace", "Stalker", "Closer")
+
+# Feature name -> key builder. Keys mirror the primary keys of the matching
+# preference table (minus HorseID). A key of None means "not applicable".
+def _distance_key(r):
+    if r["Distance"] is None:
+        return None
+    return (r["Season"], stats.get_distance_group_simple(r["Distance"]))
+
+def _going_key(r):
+    return (r["Season"], r["Going"]) if r["Going"] else None
+
+def _course_key(r):
+    if not r["RaceCourse"] or not r["CourseType"]:
+        return None
+    return (r["Season"], r["RaceCourse"], r["CourseType"])
+
+def _race_distance_group(r):
+    if not r["RaceCourse"] or r["Distance"] is None:
+        return None
+    return get_distance_group(r["RaceCourse"], r["CourseType"] or "Turf", r["Distance"])
+
+def _draw_key(r):
+    if r["Draw"] is None or r["Distance"] is None:
+        return None
+    return (r["Season"], r["RaceCourse"], _race_distance_group(r), get_draw_group(r["Draw"]))
+
+def _jockey_key(r):
+    return (r["Season"], r["Jockey"]) if r["Jockey"] else None
+
+def _trainer_key(r):
+    return (r["Season"], r["Trainer"]) if r["Trainer"] else None
+
+def _weight_key(r):
+    if not r["ActualWt"] or r["ActualWt"] > 150 or r["Distance"] is None:
+        return None
+    return (r["Season"], _race_distance_group(r), stats.get_weight_group(r["ActualWt"]))
+
+def _bwr_key(r):
+    if not r["ActualWt"] or not r["DeclaredWt"] or r["Distance"] is None:
+        return None
+    bwr = round((r["ActualWt"] / r["DeclaredWt"]) * 10, 3)
+    return (r["Season"], r["Distance"], stats.get_bwr_group(bwr))
+
+FEATURE_KEYS = {
+    "Distance": _distance_key,
+    "Going": _going_key,
+    "Course": _course_key,
+    "Draw": _draw_key,
+    "Jockey": _jockey_key,
+    "Trainer": _trainer_key,
+    "Weight": _weight_key,
+    "BWR": _bwr_key,
+}
+
+FEATURE_COLUMNS = (
+    ["HorseID", "RaceID", "RaceDate", "Season"]
+    + [f"{name}{suffix}" for name in [*FEATURE_KEYS, "ClassJump"] for suffix in ("Top3Rate", "Runs")]
+    + ["StyleBucket", "StyleTop3Rate", "StyleRuns"]
+)
+
+_RACES_SQL = """
+    SELECT
+        h.HorseID, h.RaceDate, COALESCE(h.RaceID, rp.RaceID) AS RaceID, h.Season,
+        h.RaceCourse, h.CourseType, h.Distance, h.Going, h.ClassNum, h.Draw,
+        h.Trainer, h.Jockey, h.ActualWt, h.DeclaredWt, h.Placing,
+        rp.RaceCourse    AS StyleCourse,
+        rp.CourseType    AS StyleCourseType,
+        rp.DistanceGroup AS StyleDistanceGroup,
+        rp.TurnCount, rp.EarlyPos, rp.FieldSize
+    FROM horse_race_history h
+    LEFT JOIN horse_running_position rp
+           ON rp.HorseID = h.HorseID AND rp.RaceDate = h.RaceDate
+    {horse_filter}
+    ORDER BY h.HorseID, h.RaceDate
+"""
+
+def _damped_rate(top3, runs):
+    """Top3 rate with the usual 50% damping below 3 runs; None without history."""
+    if not runs:
+        return None
+    rate = top3 / runs
+    if runs < 3:
+        rate /= 2
+    return round(rate, 4)
+
+def _style_key(r):
+    if r.get("StyleCourse") is None:
+        return None
+    try:
+        tc = round(float(r["TurnCount"]), 1)
+    except (TypeError, ValueError):
+        tc = 0.0
+    return (r["Season"], r["StyleCourse"] or "Unknown", r["StyleCourseType"] or "Unknown",
+            r["StyleDistanceGroup"] or "Unknown", tc)
+
+def iter_horse_asof_features(races):
+    """
+    Yield one feature dict per race for a single horse.
+    ``races`` must be that horse's races sorted oldest -> newest.
+    """
+    counters = {name: {} for name in FEATURE_KEYS}
+    jump_counts = {}
+    style_counts = {}
+    prev_class = None
+
+    for r in races:
+        out = {"HorseID": r["HorseID"], "RaceID": r["RaceID"],
+               "RaceDate": r["RaceDate"], "Season": r["Season"]}
+        placing = r["Placing"]
+        is_top3 = placing is not None and placing <= 3
+
+        # 1) Read features from races strictly before this one
+        keys = {}
+        for name, key_fn in FEATURE_KEYS.items():
+            key = keys[name] = key_fn(r)
+            top3, runs = counters[name].get(key, (0, 0)) if key else (0, 0)
+            out[f"{name}Top3Rate"] = _damped_rate(top3, runs)
+            out[f"{name}Runs"] = runs
+
+        jump_key = None
+        if prev_class is not None and r["ClassNum"] is not None:
+            cls = r["ClassNum"]
+            jump = "Up" if cls < prev_class else ("Down" if cls > prev_class else "Same")
+            jump_key = (r["Season"], jump)
+        top3, runs = jump_counts.get(jump_key, (0, 0))
+        out["ClassJumpTop3Rate"] = _damped_rate(top3, runs)
+        out["ClassJumpRuns"] = runs
+
+        style_key = _style_key(r)
+        by_bucket = style_counts.get(style_key, {})
+        out["StyleBucket"], out["StyleTop3Rate"], out["StyleRuns"] = None, None, 0
+        if by_bucket:
+            # Dominant prior style at this course/distance/turn geometry
+            bucket = max(STYLE_BUCKETS, key=lambda b: by_bucket.get(b, (0, 0))[1])
+            top3, runs = by_bucket[bucket]
+            out["StyleBucket"] = bucket
+            out["StyleTop3Rate"] = _damped_rate(top3, runs)
+            out["StyleRuns"] = runs
+
+        yield out
+
+        # 2) Only now fold this race into the prefix counters
+        if placing is None:
+            continue
+        for name, key in keys.items():
+            if key:
+                top3, runs = counters[name].get(key, (0, 0))
+                counters[name][key] = (top3 + is_top3, runs + 1)
+        if jump_key:
+            top3, runs = jump_counts.get(jump_key, (0, 0))
+            jump_counts[jump_key] = (top3 + is_top3, runs + 1)
+        if r["ClassNum"] is not None:
+            prev_class = r["ClassNum"]
+        if style_key and r.get("EarlyPos") and r.get("FieldSize"):
+            bucket = stats._compute_style_bucket(r["EarlyPos"], r["FieldSize"])
+            if bucket:
+                top3, runs = style_counts.setdefault(style_key, {}).get(bucket, (0, 0))
+                style_counts[style_key][bucket] = (top3 + is_top3, runs + 1)
+
+def _iter_asof_features(conn, horse_id=None):
+    conn.row_factory = sqlite3.Row
+    sql = _RACES_SQL.format(horse_filter="WHERE h.HorseID = ?" if horse_id else "")
+    cursor = conn.execute(sql, (horse_id,) if horse_id else ())
+    for _, races in groupby(cursor, key=lambda row: row["HorseID"]):
+        yield from iter_horse_asof_features(dict(row) for row in races)
+
+def iter_asof_features(horse_id=None):
+    """
+    Stream as-of feature vectors for every (HorseID, RaceID) in
+    horse_race_history, or for one horse. Rows are read with a cursor in
+    (HorseID, RaceDate) order, so memory stays at one horse's races.
+    """
+    conn = sqlite3.connect(stats.DB_PATH)
+    try:
+        yield from _iter_asof_features(conn, horse_id)
+    finally:
+        conn.close()
+
+def _column_type(column):
+    if column in ("HorseID", "RaceID", "RaceDate", "Season", "StyleBucket"):
+        return "TEXT"
+    return "INTEGER" if column.endswith("Runs") else "REAL"
+
+def create_asof_features_table():
+    conn = sqlite3.connect(stats.DB_PATH)
+    cols = ",\n            ".join(f"{c} {_column_type(c)}" for c in FEATURE_COLUMNS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS horse_asof_features (
+            {cols},
+            LastUpdate TEXT,
+            PRIMARY KEY (HorseID, RaceDate)
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+def rebuild_asof_features(horse_id=None, batch_size=5000):
+    """Materialize the as-of features into horse_asof_features. Returns rows written."""
+    stats.create_race_history_table()
+    stats.create_running_position_table()
+    create_asof_features_table()
+
+    last_update = datetime.now().strftime("%Y/%m/%d %H:%M")
+    columns = FEATURE_COLUMNS + ["LastUpdate"]
+    sql = (
+        f"INSERT OR REPLACE INTO horse_asof_features ({', '.join(columns)}) "
+        f"VALUES ({', '.join(':' + c for c in columns)})"
+    )
+
+    # Read and write on one connection so the streaming cursor never
+    # blocks our own inserts
+    conn = sqlite3.connect(stats.DB_PATH)
+    written = 0
+    batch = []
+    for features in _iter_asof_features(conn, horse_id):
+        features["LastUpdate"] = last_update
+        batch.append(features)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        written += len(batch)
+    conn.commit()
+    conn.close()
+
+    log("INFO", f"[ASOF] Wrote {written} feature rows")
+    return written
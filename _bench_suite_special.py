@@ -0,0 +1,190 @@
+# -----------------------------
+# END-TO-END BENCHMARK SUITE
+# -----------------------------
+# Times the parse -> build -> persist path on synthetic pages
+# (_synthetic_pages_special), with no browser and no network:
+#   results_parse  counting runners on each LocalResults page; the counts
+#                  seed race_field_size, so store_running_positions() never
+#                  goes to the network
+#   parse_html     parse_horse_html() - extract_dynamic_stats() parsing in
+#                  EXTRACT_MODE "dom"
+#   parse_json     parse_horse_json() - the same for EXTRACT_MODE "table"
+#   derive         HorseProfile.prefetch(), what parse workers compute
+#   build_*        every builder, called on its own; exceptions, and
+#                  builders that return nothing for a horse with races,
+#                  are counted under "errors" (persist_horse_data()
+#                  tolerates them too) instead of ending the run
+#   field_size, running_positions, dynamic_stats ... jockey_trainer
+#                  the laps persist_horse_data() records into run_metrics,
+#                  i.e. every upsert (with its builder) against a
+#                  temporary database
+#
+# Every stage gets n / p50 / p95 / max / total over the horses (the
+# run_metrics summary) and the whole run is one JSON document with the
+# commit, Python / SQLite versions and parser backend, so results from
+# different commits can be diffed; compare_results() does that.
+
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from special.utils_special import log, parse_hkjc_date
+import _horse_dynamic_stats_special as stats
+from _run_metrics_special import RunMetrics, _percentile
+from _synthetic_pages_special import generate_fixtures
+
+def _sorted_rows(profile):
+    # persist_horse_data() hands the BWR / weight builders newest-first rows
+    def _key(row):
+        return parse_hkjc_date(row.find_all("td")[2].get_text(strip=True)) or datetime.min.date()
+    return sorted(profile.rows, key=_key, reverse=True)
+
+def _builders():
+    import _scrape_horses_dynamic_data_special2 as scraper
+    return [
+        ("build_race_history", lambda p: stats.build_race_history(p.rows, p.horse_id)),
+        ("build_hwtr_per_class", lambda p: stats.build_hwtr_per_class(p.rows, p.horse_id)),
+        ("build_exact_distance_pref", lambda p: stats.build_exact_distance_pref(p.rows)),
+        ("build_course_pref", lambda p: stats.build_course_pref(p.rows)),
+        ("build_class_jump_pref", lambda p: stats.build_class_jump_pref(p.rows)),
+        ("build_trainer_combo", lambda p: scraper.build_trainer_combo(p.rows)),
+        ("build_horse_jockey_combo", lambda p: stats.build_horse_jockey_combo(p.rows)),
+        ("build_jockey_trainer_combo", lambda p: scraper.build_jockey_trainer_combo(p.rows)),
+        ("build_bwr_distance_perf", lambda p: stats.build_bwr_distance_perf(_sorted_rows(p))),
+        ("build_weight_pref_from_dict", lambda p: stats.build_weight_pref_from_dict(_sorted_rows(p), p.horse_id)),
+        ("build_draw_pref", lambda p: stats.build_draw_pref(p.rows)),
+    ]
+
+def _record_error(errors, name, message):
+    error = errors.setdefault(name, {"count": 0, "last": None})
+    error["count"] += 1
+    error["last"] = message
+
+def _stage_summary(values):
+    values = sorted(values)
+    return {"n": len(values), "p50": _percentile(values, 0.50), "p95": _percentile(values, 0.95),
+            "max": values[-1], "total": sum(values)}
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+def run_suite(horses=20, races=30, seed=0, persist=True):
+    """
+    Benchmark ``horses`` synthetic horses of ``races`` runs each; returns
+    the JSON-ready result. The stats DB is a temporary file for the run.
+    """
+    import _scrape_horses_dynamic_data_special2 as scraper
+    import _html_parser_special as html_parser
+
+    fixtures = generate_fixtures(horses, races, seed)
+    builders = _builders()
+    metrics = RunMetrics()
+    errors = {}  # build stage -> {"count", "last"}: raised, or no records
+    saved_db, saved_level = stats.DB_PATH, scraper.DEBUG_LEVEL
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats.DB_PATH = os.path.join(tmp, "bench.db")
+        # The builders log a line per skipped row; not what is being timed
+        scraper.DEBUG_LEVEL = stats.DEBUG_LEVEL = "OFF"
+        try:
+            scraper.init_database()
+            stats.create_race_field_size_table()
+
+            sizes, results_parse = [], []
+            for key, page in fixtures.results_pages.items():
+                page_started = time.perf_counter()
+                sizes.append((*key, scraper.field_size_from_results(page)))
+                results_parse.append(time.perf_counter() - page_started)
+            conn = sqlite3.connect(stats.DB_PATH)
+            conn.executemany("INSERT OR REPLACE INTO race_field_size (RaceDate, RaceNo, RaceCourse, FieldSize) "
+                             "VALUES (?, ?, ?, ?)", sizes)
+            conn.commit()
+            conn.close()
+
+            for horse_id, page in fixtures.horse_pages.items():
+                url = fixtures.horse_url(horse_id)
+                timer = metrics.timer(horse_id)
+                with timer.stage("parse_html"):
+                    profile = scraper.parse_horse_html(page, url)
+                with timer.stage("parse_json"):
+                    scraper.parse_horse_json(fixtures.horse_json[horse_id], url)
+                if profile is None:
+                    metrics.finish(horse_id, "failed")
+                    continue
+                with timer.stage("derive"):
+                    profile.prefetch()
+                for name, build in builders:
+                    # persist_horse_data() survives a failing builder, so does the suite
+                    try:
+                        with timer.stage(name):
+                            built = build(profile)
+                    except Exception as e:
+                        _record_error(errors, name, f"{horse_id}: {type(e).__name__}: {e}")
+                        continue
+                    if profile.rows and not built:
+                        # A builder that silently drops every row times nothing useful
+                        _record_error(errors, name, f"{horse_id}: no records from {len(profile.rows)} races")
+                if persist:
+                    scraper.persist_horse_data(horse_id, profile, timer)
+                metrics.finish(horse_id, "done")
+        finally:
+            stats.DB_PATH = saved_db
+            scraper.DEBUG_LEVEL = stats.DEBUG_LEVEL = saved_level
+
+    stages = metrics.summary(slowest=0)["stages"]
+    if results_parse:
+        stages["results_parse"] = _stage_summary(results_parse)
+    return {
+        "commit": git_commit(),
+        "recorded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parser_backend": html_parser.PARSER_BACKEND or html_parser.default_backend(),
+        "params": {"horses": horses, "races": races, "seed": seed, "persist": persist,
+                   "results_pages": len(fixtures.results_pages)},
+        "seconds": round(time.perf_counter() - started, 3),
+        "stages": {name: {k: round(v, 6) if isinstance(v, float) else v for k, v in m.items()}
+                   for name, m in sorted(stages.items())},
+        "errors": errors,
+    }
+
+def compare_results(baseline, current, threshold=0.2):
+    """
+    [(stage, baseline p50, current p50, ratio)] for stages whose p50 grew
+    by more than ``threshold`` (0.2 = 20%) against ``baseline``.
+    """
+    slower = []
+    for name, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before or not before["p50"]:
+            continue
+        ratio = now["p50"] / before["p50"]
+        if ratio > 1 + threshold:
+            slower.append((name, before["p50"], now["p50"], round(ratio, 2)))
+    return slower
+
+def log_results(result):
+    log("INFO", f"[BENCH] {result['params']['horses']} horses x {result['params']['races']} races "
+                f"in {result['seconds']:.1f}s (commit {result['commit'] or 'unknown'}, "
+                f"{result['parser_backend']})")
+    log("INFO", f"[BENCH] {'stage':<28} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'sum s':>8}")
+    for name, m in sorted(result["stages"].items(), key=lambda kv: -kv[1]["total"]):
+        log("INFO", f"[BENCH] {name:<28} {m['n']:>5} {m['p50'] * 1000:>9.3f} {m['p95'] * 1000:>9.3f} "
+                    f"{m['max'] * 1000:>9.3f} {m['total']:>8.3f}")
+    for name, error in sorted(result.get("errors", {}).items()):
+        log("WARNING", f"[BENCH] {name} failed on {error['count']} horses, last {error['last']}")
+
+def write_results(result, path):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, indent=2, sort_keys=True)
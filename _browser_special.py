@@ -0,0 +1,170 @@
+# -----------------------------
+# LEAN BROWSER PROFILE
+# -----------------------------
+# We only read one <table> from each HKJC page, but a default Chrome pulls in
+# every image, stylesheet, font, tracker and ad script. The helpers here
+#   - disable images through Chrome preferences,
+#   - block URL patterns (static assets + third-party trackers) through the
+#     DevTools protocol (Network.setBlockedURLs),
+#   - switch to pageLoadStrategy=eager and wait for the table instead of a
+#     fixed sleep,
+# and measure what a page costs (bytes transferred, ms) so profiles can be
+# compared with compare_profiles().
+#
+# Chrome can only block by resource *type* through request interception,
+# which selenium cannot serve synchronously; types are therefore mapped to
+# URL patterns (RESOURCE_TYPE_PATTERNS) plus the image preference.
+
+import threading
+import time
+
+from special.utils_special import log
+
+RESOURCE_TYPE_PATTERNS = {
+    "image": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico", "*.bmp"],
+    "stylesheet": ["*.css"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.mp3", "*.m3u8"],
+}
+
+TRACKER_PATTERNS = [
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*facebook.com/tr*",
+    "*hotjar.com*", "*scorecardresearch.com*", "*adobedtm.com*", "*omtrdc.net*",
+]
+
+DEFAULT_BLOCKED_TYPES = ("image", "stylesheet", "font", "media")
+
+# Chrome content settings: 2 = block
+_BLOCK_PREFS = {
+    "image": {"profile.managed_default_content_settings.images": 2},
+}
+
+# Summed from the Resource Timing API. Cross-origin entries without
+# Timing-Allow-Origin report 0 bytes, so totals are a lower bound.
+PAGE_COST_JS = """
+const nav = performance.getEntriesByType('navigation')[0] || {};
+const res = performance.getEntriesByType('resource');
+let bytes = nav.transferSize || nav.encodedBodySize || 0;
+for (const r of res) { bytes += r.transferSize || r.encodedBodySize || 0; }
+return {bytes: bytes, requests: res.length + 1,
+        dom_ms: Math.round(nav.domContentLoadedEventEnd || 0)};
+"""
+
+def blocked_url_patterns(blocked_types=DEFAULT_BLOCKED_TYPES, block_trackers=True, extra=()):
+    patterns = []
+    for resource_type in blocked_types:
+        patterns += RESOURCE_TYPE_PATTERNS.get(resource_type, [])
+    if block_trackers:
+        patterns += TRACKER_PATTERNS
+    return patterns + list(extra)
+
+def configure_options(options, block_resources=True, page_load_strategy="eager",
+                      blocked_types=DEFAULT_BLOCKED_TYPES):
+    """Apply the lean profile to a ChromeOptions instance (before the driver starts)."""
+    options.page_load_strategy = page_load_strategy
+    if block_resources:
+        prefs = {}
+        for resource_type in blocked_types:
+            prefs.update(_BLOCK_PREFS.get(resource_type, {}))
+        if prefs:
+            options.add_experimental_option("prefs", prefs)
+        if "image" in blocked_types:
+            options.add_argument("--blink-settings=imagesEnabled=false")
+    return options
+
+def apply_request_blocking(driver, patterns):
+    """Block ``patterns`` for every later request of this driver (CDP)."""
+    if not patterns:
+        return False
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(patterns)})
+        return True
+    except Exception as e:
+        # Not a Chromium driver or CDP unavailable: preferences still apply
+        log("DEBUG", f"[BROWSER] Request blocking unavailable: {e}")
+        return False
+
+def wait_for_selector(driver, selector, timeout, poll=0.1):
+    """Poll until ``selector`` matches (eager loads return before late scripts run)."""
+    deadline = time.monotonic() + timeout
+    script = "return document.querySelector(arguments[0]) !== null"
+    while True:
+        if driver.execute_script(script, selector):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll)
+
+def page_cost(driver):
+    """{"bytes", "requests", "dom_ms"} for the page currently loaded."""
+    try:
+        cost = driver.execute_script(PAGE_COST_JS) or {}
+    except Exception as e:
+        log("DEBUG", f"[BROWSER] Could not read page cost: {e}")
+        cost = {}
+    return {
+        "bytes": int(cost.get("bytes") or 0),
+        "requests": int(cost.get("requests") or 0),
+        "dom_ms": int(cost.get("dom_ms") or 0),
+    }
+
+class PageCostMeter:
+    """Thread-safe running totals of page cost (one per profile)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.pages = 0
+        self.bytes = 0
+        self.requests = 0
+        self.ms = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, cost, elapsed_ms):
+        with self._lock:
+            self.pages += 1
+            self.bytes += cost.get("bytes", 0)
+            self.requests += cost.get("requests", 0)
+            self.ms += elapsed_ms
+
+    def averages(self):
+        with self._lock:
+            n = max(1, self.pages)
+            return {
+                "pages": self.pages,
+                "bytes": self.bytes // n,
+                "requests": round(self.requests / n, 1),
+                "ms": round(self.ms / n),
+            }
+
+    def log_summary(self):
+        avg = self.averages()
+        if avg["pages"]:
+            log("INFO", f"[BROWSER] {self.name}: {avg['pages']} pages, avg {avg['bytes'] / 1024:.0f} KB, "
+                        f"{avg['requests']} requests, {avg['ms']} ms")
+
+def compare_profiles(fetch_page, urls, profiles):
+    """
+    Fetch ``urls`` once per profile and report the savings against the first.
+    fetch_page(url, profile_name, meter) loads one page and records its cost;
+    profiles is a list of profile names. Returns {profile: averages}.
+    """
+    results = {}
+    for name in profiles:
+        meter = PageCostMeter(name)
+        for url in urls:
+            try:
+                fetch_page(url, name, meter)
+            except Exception as e:
+                log("WARNING", f"[BROWSER] {name}: {url} failed: {e}")
+        results[name] = meter.averages()
+        meter.log_summary()
+
+    baseline = results[profiles[0]]
+    for name in profiles[1:]:
+        avg = results[name]
+        log("INFO", f"[BROWSER] {name} vs {profiles[0]}: saves "
+                    f"{(baseline['bytes'] - avg['bytes']) / 1024:.0f} KB and "
+                    f"{baseline['ms'] - avg['ms']} ms per page")
+    return results
@@ -0,0 +1,176 @@
+# -----------------------------
+# TABLE-DRIVEN BUCKETING
+# -----------------------------
+# Distance / draw / weight / BWR / HWTR groups used to be if-ladders that
+# re-normalized their string arguments on every call. Each ladder is now a
+# Buckets table: sorted (bound, operator) pairs + labels, defined once.
+# Whole columns are bucketed with numpy.searchsorted, scalars with
+# bisect_right over the same bounds.
+#
+# Ladders mix "x < b" and "x <= b" tests. For bisect/searchsorted a "<= b"
+# bound is stored as math.nextafter(b, inf), the smallest float above b, so
+# one strict comparison serves both: x < nextafter(b) <=> x <= b for every
+# int and float x. NaN falls through to the last label, as in the ladders.
+#
+# Course / surface keys are normalized once per distinct raw pair
+# (distance_table).
+
+import math
+from bisect import bisect_right
+from importlib.util import find_spec
+
+# numpy is imported on the first vectorized call, not at startup; without
+# it the vectorized helpers fall back to a scalar loop
+HAVE_NUMPY = find_spec("numpy") is not None
+
+def _numpy():
+    import numpy
+    return numpy
+
+LT = "<"
+LE = "<="
+
+class Buckets:
+    """labels[i] for the first bound x falls under; labels[-1] above all of them."""
+
+    __slots__ = ("upper", "labels", "_np_upper", "_np_labels")
+
+    def __init__(self, bounds, labels):
+        if len(labels) != len(bounds) + 1:
+            raise ValueError("Need exactly one more label than bounds")
+        bounds = [(b, op) for b, op in bounds]
+        if any(op not in (LT, LE) or not isinstance(b, (int, float)) for b, op in bounds):
+            raise ValueError("Bounds must be (value, LT) or (value, LE)")
+        self.upper = [math.nextafter(b, math.inf) if op == LE else float(b) for b, op in bounds]
+        if self.upper != sorted(self.upper):
+            raise ValueError("Bounds must be ascending")
+        self.labels = list(labels)
+        self._np_upper = None
+        self._np_labels = None
+
+    def lookup(self, x):
+        return self.labels[bisect_right(self.upper, x)]
+
+    def _arrays(self):
+        if self._np_upper is None:
+            np = _numpy()
+            self._np_upper = np.asarray(self.upper, dtype=float)
+            self._np_labels = np.asarray(self.labels, dtype=object)
+        return self._np_upper, self._np_labels
+
+    def label_array(self, values):
+        """numpy object array of labels for a numeric array (numpy required)."""
+        np = _numpy()
+        upper, labels = self._arrays()
+        return labels[np.searchsorted(upper, np.asarray(values, dtype=float), side="right")]
+
+    def many(self, values):
+        """Labels for a whole column (numpy if installed); returns a list."""
+        if not HAVE_NUMPY:
+            return [self.lookup(x) for x in values]
+        return self.label_array(values).tolist()
+
+_DISTANCE_LABELS = ["Sprint", "Short", "Mid", "Long", "Endurance"]
+
+DISTANCE_GROUPS = {
+    ("ST", "AWT"): Buckets([(1000, LE), (1400, LE), (1650, LE), (2000, LE)], _DISTANCE_LABELS),
+    ("ST", "TURF"): Buckets([(1000, LE), (1400, LE), (1800, LE), (2200, LE)], _DISTANCE_LABELS),
+    ("HV", "TURF"): Buckets([(1000, LE), (1200, LE), (1800, LE), (2200, LE)], _DISTANCE_LABELS),
+}
+
+# get_distance_group_special(): no Sprint bucket on the Sha Tin AWT
+SPECIAL_DISTANCE_GROUPS = dict(DISTANCE_GROUPS)
+SPECIAL_DISTANCE_GROUPS[("ST", "AWT")] = Buckets([(1400, LE), (1650, LE), (2000, LE)], _DISTANCE_LABELS[1:])
+
+SIMPLE_DISTANCE_GROUP = Buckets([(1000, LT), (1400, LE), (1800, LT), (2200, LT)], _DISTANCE_LABELS)
+
+DRAW_GROUP = Buckets([(1, LT), (3, LE), (6, LE), (9, LE), (12, LE)],
+                     [None, "Inside", "InnerMid", "OuterMid", "Wide", "Outer"])
+
+WEIGHT_GROUP = Buckets([(110, LT), (116, LE), (123, LE), (130, LE)],
+                       ["Light", "Low-Mid", "Mid", "High-Mid", "Heavy"])
+
+BWR_GROUP = Buckets([(0.90, LE), (0.98, LE), (1.04, LE), (1.10, LE), (1.18, LE), (1.34, LE)],
+                    ["Very Low", "Low", "Medium Low", "Medium", "Medium High", "High", "Very High"])
+
+HWTR_GROUP = Buckets([(0.85, LT), (0.95, LT), (1.05, LT), (1.15, LT), (1.25, LT)],
+                     ["0.75–0.85", "0.85–0.95", "0.95–1.05", "1.05–1.15", "1.15–1.25", "1.25+"])
+
+# build_hwtr_per_class() groups
+HWTR_CLASS_GROUP = Buckets([(0.85, LT), (0.95, LT), (1.05, LT), (1.15, LT)],
+                           ["<0.85", "0.85–0.95", "0.95–1.05", "1.05–1.15", "1.15+"])
+
+def distance_key(race_course, course_type):
+    """(course, surface) key of DISTANCE_GROUPS, or None (-> "Unknown")."""
+    race_course = race_course.upper()
+    course_type = course_type.upper()
+    if race_course == "ST":
+        return ("ST", "AWT") if course_type == "AWT" else ("ST", "TURF")
+    if race_course == "HV":
+        return ("HV", "TURF")
+    return None
+
+def special_distance_key(race_course, course_type):
+    # get_distance_group_special() compares case-sensitively
+    if race_course == "ST":
+        return ("ST", "AWT") if course_type == "AWT" else ("ST", "TURF")
+    if race_course == "HV":
+        return ("HV", "TURF")
+    return None
+
+_TABLE_CACHE = {}
+
+def distance_table(race_course, course_type, special=False):
+    """Buckets for a raw (course, surface) pair, normalized once; None if unknown."""
+    try:
+        return _TABLE_CACHE[race_course, course_type, special]
+    except KeyError:
+        pass
+    if special:
+        table = SPECIAL_DISTANCE_GROUPS.get(special_distance_key(race_course, course_type))
+    else:
+        table = DISTANCE_GROUPS.get(distance_key(race_course, course_type))
+    if len(_TABLE_CACHE) < 1024:
+        _TABLE_CACHE[race_course, course_type, special] = table
+    return table
+
+def distance_group(race_course, course_type, distance, special=False):
+    table = distance_table(race_course, course_type, special)
+    return table.lookup(distance) if table is not None else "Unknown"
+
+def distance_groups(race_courses, course_types, distances, special=False):
+    """
+    Vectorized distance_group(): one call for a season's worth of races.
+    Each distinct (course, surface) pair is resolved once and its rows are
+    bucketed with a single searchsorted.
+    """
+    if not HAVE_NUMPY:
+        return [distance_group(c, t, d, special) for c, t, d in zip(race_courses, course_types, distances)]
+    np = _numpy()
+    distances = np.asarray(distances, dtype=float)
+    codes = {}
+    pair_codes = np.fromiter(
+        (codes.setdefault(pair, len(codes)) for pair in zip(race_courses, course_types)),
+        dtype=np.intp, count=len(distances),
+    )
+    out = np.full(len(distances), "Unknown", dtype=object)
+    for (course, surface), code in codes.items():
+        table = distance_table(course, surface, special)
+        if table is not None:
+            mask = pair_codes == code
+            out[mask] = table.label_array(distances[mask])
+    return out.tolist()
+
+def draw_groups(draws):
+    """Vectorized get_draw_group() (strings like " 9 " accepted, junk -> None)."""
+    parsed = []
+    for draw in draws:
+        try:
+            parsed.append(int(str(draw).strip()) if draw is not None else None)
+        except (ValueError, TypeError):
+            parsed.append(None)
+    valid = [i for i, d in enumerate(parsed) if d is not None]
+    out = [None] * len(parsed)
+    for i, label in zip(valid, DRAW_GROUP.many([parsed[i] for i in valid])):
+        out[i] = label
+    return out
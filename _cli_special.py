@@ -0,0 +1,201 @@
+# -----------------------------
+# COMMAND LINE
+# -----------------------------
+#   python _cli_special.py scrape [scraper options]   batch / queue / shard scraping
+#   python _cli_special.py rebuild [TARGET ...]       recompute SQL-derived tables
+#   python _cli_special.py export {dead-letters,asof} write CSVs
+#   python _cli_special.py bench {parsers,browser}    backend / browser benchmarks
+#   python _cli_special.py bench {suite,fixtures}     synthetic end-to-end benchmark (JSON)
+#   python _cli_special.py status                     queue, last run, dead letters
+#   python _cli_special.py audit [QUERY ...]          EXPLAIN QUERY PLAN of the read queries
+#
+# Every command imports its modules inside its handler, so read-only
+# commands never load selenium, requests, pandas or bs4 (check with
+# ``python -X importtime _cli_special.py status``).
+
+import argparse
+import os
+import sys
+
+REBUILD_TARGETS = ("running-style", "class-jump", "hwtr-trend", "asof", "compact")
+
+def cmd_scrape(args):
+    import _scrape_horses_dynamic_data_special2 as scraper
+    scraper.main(args.scrape_args, prog="_cli_special.py scrape")
+
+def cmd_rebuild(args):
+    import _horse_dynamic_stats_special as stats
+    from _sql_profile_special import profiling
+
+    unknown = set(args.targets) - set(REBUILD_TARGETS)
+    if unknown:
+        sys.exit(f"rebuild: unknown target(s) {', '.join(sorted(unknown))}; choose from {', '.join(REBUILD_TARGETS)}")
+    with profiling(stats, enabled=args.profile_sql):
+        _rebuild(stats, args)
+
+def _rebuild(stats, args):
+    from special.utils_special import log
+
+    for target in args.targets or REBUILD_TARGETS:
+        if target == "running-style":
+            upserts, groups = stats.rebuild_running_style_pref_sql(args.horse)
+            log("INFO", f"[REBUILD] running_style_pref: {upserts} rows across {groups} groups")
+        elif target == "class-jump":
+            log("INFO", f"[REBUILD] class_jump_pref: {stats.rebuild_class_jump_pref_sql(args.horse)} rows")
+        elif target == "hwtr-trend":
+            log("INFO", f"[REBUILD] hwtr_trend: {stats.rebuild_hwtr_trend_sql(args.horse)} rows")
+        elif target == "asof":
+            from _asof_features_special import rebuild_asof_features
+            rebuild_asof_features(args.horse)
+        elif target == "compact":
+            from _pref_versions_special import compact_pref_versions
+            compact_pref_versions()
+
+def cmd_export(args):
+    from special.utils_special import log
+
+    if args.what == "dead-letters":
+        from _dead_letters_special import export_dead_letters
+        path, count = export_dead_letters(args.output)
+    else:
+        import csv
+        from _asof_features_special import FEATURE_COLUMNS, iter_asof_features
+
+        path = args.output or "asof_features.csv"
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.DictWriter(fh, fieldnames=FEATURE_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            for features in iter_asof_features(args.horse):
+                writer.writerow(features)
+                count += 1
+    log("INFO", f"[EXPORT] {count} rows -> {path}")
+
+def cmd_bench(args):
+    if args.what in ("suite", "fixtures"):
+        return _bench_synthetic(args)
+
+    import _scrape_horses_dynamic_data_special2 as scraper
+
+    if args.what == "parsers":
+        if not args.paths:
+            sys.exit("bench parsers: give one or more saved horse pages")
+        scraper.bench_parsers(args.paths, repeat=args.repeat)
+    else:
+        scraper.bench_browser_profiles(args.input, pages=args.pages)
+
+def _bench_synthetic(args):
+    import json
+    from special.utils_special import log
+
+    if args.what == "fixtures":
+        from _synthetic_pages_special import generate_fixtures, write_fixtures
+
+        directory = args.output or "synthetic_pages"
+        count = write_fixtures(generate_fixtures(args.horses, args.races, args.seed), directory)
+        log("INFO", f"[BENCH] {count} files -> {directory}")
+        return
+
+    import _bench_suite_special as suite
+
+    result = suite.run_suite(args.horses, args.races, args.seed)
+    suite.log_results(result)
+    if args.output:
+        suite.write_results(result, args.output)
+        log("INFO", f"[BENCH] results -> {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            slower = suite.compare_results(json.load(fh), result)
+        for stage, before, now, ratio in slower:
+            log("WARNING", f"[BENCH] {stage}: p50 {before * 1000:.3f} -> {now * 1000:.3f} ms (x{ratio})")
+        if slower:
+            sys.exit(f"bench suite: {len(slower)} stages slower than {args.baseline}")
+
+def cmd_status(args):
+    import _horse_dynamic_stats_special as stats
+    import _job_queue_special as job_queue
+    from _dead_letters_special import list_dead_letters
+    from _run_journal_special import latest_run, run_summary
+
+    print(f"Database:     {stats.DB_PATH}")
+    print(f"Job queue:    {job_queue.queue_status() or 'empty'}")
+    run = latest_run()
+    if run:
+        run_id, input_path, status, started_at, finished_at = run
+        print(f"Last run:     {run_id} ({status}) {input_path} started {started_at}"
+              + (f", finished {finished_at}" if finished_at else ""))
+        print(f"              {run_summary(run_id)}")
+    else:
+        print("Last run:     none")
+    print(f"Dead letters: {len(list_dead_letters())}")
+
+def cmd_audit(args):
+    import _sql_profile_special as sql_profile
+    # Importing the scraper registers its race_field_size lookup next to
+    # the stats module's fetch_*_ordered and rebuild queries
+    import _scrape_horses_dynamic_data_special2  # noqa: F401
+
+    unknown = set(args.queries) - set(sql_profile.READ_QUERIES)
+    if unknown:
+        sys.exit(f"audit: unknown query {', '.join(sorted(unknown))}; "
+                 f"choose from {', '.join(sql_profile.READ_QUERIES)}")
+    db_path = args.db or _scrape_horses_dynamic_data_special2.stats.DB_PATH
+    if not os.path.exists(db_path):
+        sys.exit(f"audit: no database at {db_path}")
+    results = sql_profile.audit_query_plans(db_path, names=args.queries)
+    bad = sql_profile.log_audit(results, verbose=args.verbose)
+    if bad:
+        sys.exit(f"audit: {bad} of {len(results)} queries need attention")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="_cli_special.py", description="HKJC dynamic stats tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape = commands.add_parser("scrape", help="scrape horses (same options as the scraper script)",
+                                 add_help=False)
+    scrape.add_argument("scrape_args", nargs=argparse.REMAINDER)
+    scrape.set_defaults(func=cmd_scrape)
+
+    rebuild = commands.add_parser("rebuild", help="recompute SQL-derived tables")
+    rebuild.add_argument("targets", nargs="*", metavar="TARGET",
+                         help=f"any of {', '.join(REBUILD_TARGETS)} (default: all)")
+    rebuild.add_argument("--horse", help="only this HorseID")
+    rebuild.add_argument("--profile-sql", action="store_true", help="log calls, rows and time per SQL statement")
+    rebuild.set_defaults(func=cmd_rebuild)
+
+    export = commands.add_parser("export", help="write CSVs")
+    export.add_argument("what", choices=["dead-letters", "asof"])
+    export.add_argument("-o", "--output", help="CSV path")
+    export.add_argument("--horse", help="asof: only this HorseID")
+    export.set_defaults(func=cmd_export)
+
+    bench = commands.add_parser("bench", help="parser / browser / end-to-end benchmarks")
+    bench.add_argument("what", choices=["parsers", "browser", "suite", "fixtures"])
+    bench.add_argument("paths", nargs="*", metavar="HTML", help="parsers: saved horse pages")
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument("--input", default="horse_ids_to_update.csv", help="browser: HorseID CSV")
+    bench.add_argument("--pages", type=int, default=5, help="browser: horses to fetch")
+    bench.add_argument("--horses", type=int, default=20, help="suite / fixtures: synthetic horses")
+    bench.add_argument("--races", type=int, default=30, help="suite / fixtures: races per horse")
+    bench.add_argument("--seed", type=int, default=0, help="suite / fixtures: generator seed")
+    bench.add_argument("-o", "--output", help="suite: JSON results path; fixtures: directory")
+    bench.add_argument("--baseline", help="suite: earlier JSON results; exit non-zero on >20%% slower stages")
+    bench.set_defaults(func=cmd_bench)
+
+    status = commands.add_parser("status", help="job queue, last run and dead letters")
+    status.set_defaults(func=cmd_status)
+
+    audit = commands.add_parser("audit", help="flag full scans and temp B-tree sorts in the read queries")
+    audit.add_argument("queries", nargs="*", metavar="QUERY", help="registered query names (default: all)")
+    audit.add_argument("--db", help="database to plan against (default: the stats DB)")
+    audit.add_argument("-v", "--verbose", action="store_true", help="print every plan, not just flagged ones")
+    audit.set_defaults(func=cmd_audit)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
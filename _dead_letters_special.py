@@ -0,0 +1,105 @@
+# -----------------------------
+# DEAD LETTERS
+# -----------------------------
+# Horses that failed permanently (or ran out of retries) are parked in the
+# dead_letters table with the reason and the last HTML snapshot, so they can
+# be inspected and reprocessed on their own instead of re-running the whole
+# batch. A later successful scrape removes the horse from the list.
+
+import csv
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from special.utils_special import log
+import _horse_dynamic_stats_special as stats
+from _retry_special import classify_error
+
+def dead_letter_csv_path():
+    """Input file handed to run_batch() when reprocessing dead letters."""
+    return str(Path(stats.DB_PATH).with_name("dead_letters.csv"))
+
+def create_dead_letters_table():
+    conn = sqlite3.connect(stats.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            HorseID       TEXT PRIMARY KEY,
+            RunID         TEXT,
+            ErrorType     TEXT,
+            ErrorClass    TEXT,       -- 'transient' (out of retries) / 'permanent'
+            Reason        TEXT,
+            HtmlSnapshot  BLOB,       -- zlib-compressed page source, if any
+            SnapshotBytes INTEGER,
+            Occurrences   INTEGER DEFAULT 1,
+            FailedAt      TEXT
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+def record_dead_letter(horse_id, error, run_id=None, page_source=None):
+    """Park ``horse_id``; the snapshot defaults to the error's page_source."""
+    if page_source is None:
+        page_source = getattr(error, "page_source", None)
+    snapshot = zlib.compress(page_source.encode("utf-8")) if page_source else None
+
+    create_dead_letters_table()
+    conn = sqlite3.connect(stats.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO dead_letters
+            (HorseID, RunID, ErrorType, ErrorClass, Reason, HtmlSnapshot, SnapshotBytes, Occurrences, FailedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+        ON CONFLICT(HorseID) DO UPDATE SET
+            RunID = excluded.RunID, ErrorType = excluded.ErrorType,
+            ErrorClass = excluded.ErrorClass, Reason = excluded.Reason,
+            HtmlSnapshot = COALESCE(excluded.HtmlSnapshot, dead_letters.HtmlSnapshot),
+            SnapshotBytes = COALESCE(excluded.SnapshotBytes, dead_letters.SnapshotBytes),
+            Occurrences = dead_letters.Occurrences + 1, FailedAt = excluded.FailedAt
+    """, (
+        horse_id, run_id, type(error).__name__, classify_error(error), str(error)[:1000],
+        snapshot, len(page_source) if page_source else None,
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    ))
+    conn.commit()
+    conn.close()
+    log("WARNING", f"[DEAD LETTER] {horse_id}: {type(error).__name__}: {error}")
+
+def clear_dead_letter(horse_id):
+    create_dead_letters_table()
+    conn = sqlite3.connect(stats.DB_PATH)
+    conn.execute("DELETE FROM dead_letters WHERE HorseID = ?", (horse_id,))
+    conn.commit()
+    conn.close()
+
+def list_dead_letters():
+    """Return [(HorseID, ErrorType, Reason, Occurrences, FailedAt)] oldest first."""
+    create_dead_letters_table()
+    conn = sqlite3.connect(stats.DB_PATH)
+    rows = conn.execute("""
+        SELECT HorseID, ErrorType, Reason, Occurrences, FailedAt
+        FROM dead_letters ORDER BY FailedAt, HorseID
+    """).fetchall()
+    conn.close()
+    return rows
+
+def load_snapshot(horse_id):
+    """Decompressed HTML snapshot for ``horse_id`` (None if there is none)."""
+    create_dead_letters_table()
+    conn = sqlite3.connect(stats.DB_PATH)
+    row = conn.execute("SELECT HtmlSnapshot FROM dead_letters WHERE HorseID = ?", (horse_id,)).fetchone()
+    conn.close()
+    return zlib.decompress(row[0]).decode("utf-8") if row and row[0] else None
+
+def export_dead_letters(path=None):
+    """Write the dead-lettered HorseIDs as a run_batch() input CSV; returns (path, count)."""
+    path = path or dead_letter_csv_path()
+    rows = list_dead_letters()
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["HorseID", "ErrorType", "Reason"])
+        for horse_id, error_type, reason, _, _ in rows:
+            writer.writerow([horse_id, error_type, reason])
+    return path, len(rows)
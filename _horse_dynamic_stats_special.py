@@ -9,36 +9,32 @@ from special.utils_special import (
     safe_int, safe_float, parse_weight, parse_lbw,
     get_distance_group, get_turn_count, get_draw_group,
     get_jump_type, get_distance_group_from_row, get_season_code,
-    parse_hkjc_date,
+    parse_hkjc_date, get_logger,
     DB_PATH,
 )
+from _buckets_special import (
+    SIMPLE_DISTANCE_GROUP, WEIGHT_GROUP, BWR_GROUP, HWTR_GROUP, HWTR_CLASS_GROUP,
+    distance_group,
+)
+from _sql_profile_special import register_read_query
 
 
 import sqlite3
 
 from collections import defaultdict
 from datetime import datetime
-import pandas as pd
-from bs4 import BeautifulSoup, UnicodeDammit
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-import ftfy
 from typing import List, Dict, Union
+# Builders and upserts only need sqlite3; bs4 is imported where rows are parsed
 
 # ===== DEBUGGING CONTROL =====
 DEBUG_LEVEL = "INFO"  # "OFF", "INFO", "DEBUG", "TRACE"
 
+# Level-gated logger for per-row messages (formats only when enabled)
+logger = get_logger(__name__)
+
 def get_distance_group_simple(distance: int) -> str:
-    if distance < 1000:
-        return "Sprint"
-    elif distance <= 1400:
-        return "Short"
-    elif distance < 1800:
-        return "Mid"
-    elif distance < 2200:
-        return "Long"
-    else:
-        return "Endurance"
+    # <1000 Sprint, <=1400 Short, <1800 Mid, <2200 Long, else Endurance
+    return SIMPLE_DISTANCE_GROUP.lookup(distance)
 
 def _compute_style_bucket(early_pos: int, field_size: int) -> str | None:
     """Map early position to a style bucket using % of field.
@@ -88,49 +84,22 @@ def convert_time_to_seconds(time_str):
             total_seconds = int(secs) + int(hundredths) / 100
             return round(total_seconds, 2)
     except Exception as e:
-        log("DEBUG", f"Failed to convert finish time '{time_str}': {e}")
+        logger.debug("Failed to convert finish time '%s': %s", time_str, e)
     return None
 
 # For distance preferences (simple version)
 def get_distance_group_special(race_course: str, course_type: str, distance: int) -> str:
     """Determine a horse's distance preference group for special races."""
-    if race_course == "ST":
-        if course_type == "AWT":
-            if distance <= 1200:
-                return "Short"
-            if distance <= 1400:
-                return "Short"
-            elif distance <= 1650:
-                return "Mid"
-            elif distance <= 2000:
-                return "Long"
-            else:
-                return "Endurance"
-        else:  # Turf
-            if distance <= 1000:
-                return "Sprint"
-            elif distance <= 1400:
-                return "Short"
-            elif distance <= 1800:
-                return "Mid"
-            elif distance <= 2200:
-                return "Long"
-            else:
-                return "Endurance"
-
-    elif race_course == "HV":  # Happy Valley (always Turf)
-        if distance <= 1000:
-            return "Sprint"
-        elif distance <= 1200:
-            return "Short"
-        elif distance <= 1800:
-            return "Mid"
-        elif distance <= 2200:
-            return "Long"
-        else:
-            return "Endurance"
+    # Case-sensitive course keys; the ST AWT ladder has no Sprint bucket
+    return distance_group(race_course, course_type, distance, special=True)
+
+def get_weight_group(weight):
+    """Carried-weight bucket (lbs) used by the weight preference tables."""
+    return WEIGHT_GROUP.lookup(weight)
 
-    return "Unknown"
+def get_bwr_group(bwr):
+    """Bucket for BWR = (actual weight / declared horse weight) * 10."""
+    return BWR_GROUP.lookup(bwr)
 
 def ensure_column_exists(db_path, table, column, col_type):
     conn = sqlite3.connect(db_path)
@@ -148,19 +117,6 @@ def build_weight_pref_from_dict(race_history_records, horse_id):
     Build performance stats by DistanceGroup and WeightGroup
     """
     from collections import defaultdict
-    
-    from bs4 import BeautifulSoup
-    from bs4.element import Tag
-
-    results = []
-    seen_keys = set()
-    for season, entries in weight_stats.items():
-        for (dist_group, weight_group), stats in entries.items():
-            key = (horse_id, season, dist_group, weight_group)
-            if key in seen_keys:
-                log("WARNING", f"Duplicate key in build_weight_pref_from_dict: {key}")
-                continue
-            seen_keys.add(key)
 
     # ====== HELPER FUNCTIONS ======
     def get_season_from_row(date_str):
@@ -233,12 +189,12 @@ def build_weight_pref_from_dict(race_history_records, horse_id):
             return "Unknown"
     
     # ====== MAIN FUNCTION ======
-    log("DEBUG", f"\n[WEIGHT_BUILD] Starting for {horse_id}")
-    log("TRACE", f"Initial input type: {type(race_history_records)}")
+    logger.debug("\n[WEIGHT_BUILD] Starting for %s", horse_id)
+    logger.trace("Initial input type: %s", type(race_history_records))
     
-    # Conversion for BeautifulSoup rows
-    if race_history_records and isinstance(race_history_records[0], Tag):
-        log("DEBUG", "Detected BeautifulSoup rows - converting to dicts")
+    # Conversion for table rows (bs4 Tags or HtmlRows - anything with find_all("td"))
+    if race_history_records and hasattr(race_history_records[0], "find_all"):
+        logger.debug("Detected table rows - converting to dicts")
         converted_records = []
         for row in race_history_records:
             try:
@@ -257,23 +213,13 @@ def build_weight_pref_from_dict(race_history_records, horse_id):
                 }
                 converted_records.append(record)
             except Exception as e:
-                log("DEBUG", f"Conversion error: {str(e)}")
+                logger.debug("Conversion error: %s", e)
                 continue
                 
-        race_history_records = converted_records
-        log("DEBUG", "Converted {len(converted_records)}/{len(race_history_records)} rows")
+        logger.debug("Converted %d/%d rows", len(converted_records), len(race_history_records))
         if converted_records:
-            log("TRACE", "Sample converted record:", converted_records[0])
-
-    # Rest of the processing logic...
-    def get_weight_group(weight):
-        group = ("Light" if weight < 110 else
-                "Low-Mid" if weight <= 116 else
-                "Mid" if weight <= 123 else
-                "High-Mid" if weight <= 130 else
-                "Heavy")
-        log("TRACE", f"Weight {weight} → {group}")
-        return group
+            logger.trace("Sample converted record: %s", converted_records[0])
+        race_history_records = converted_records
 
     weight_stats = defaultdict(lambda: defaultdict(lambda: {
         "Top3Count": 0,
@@ -301,6 +247,7 @@ def build_weight_pref_from_dict(race_history_records, horse_id):
             season = race.get("season", "Unknown")
             distance_group = race.get("distance_group", "Unknown")
             weight_group = get_weight_group(carried_weight)
+            logger.trace("Weight %s → %s", carried_weight, weight_group)
             
             stats = weight_stats[season][(distance_group, weight_group)]
             stats["TotalRuns"] += 1
@@ -310,7 +257,7 @@ def build_weight_pref_from_dict(race_history_records, horse_id):
             processed += 1
         except Exception as e:
             skipped += 1
-            log("DEBUG", f"Process error for race record: {str(e)}")
+            logger.debug("Process error for race record: %s", e)
             continue
 
     results = []
@@ -337,37 +284,15 @@ def build_weight_pref_from_dict(race_history_records, horse_id):
     log("INFO", f"Processed {processed} races, skipped {skipped}")
     log("INFO", f"Generated {len(results)} preference records")
     if results:
-        log("DEBUG", f"Sample output record: {results[0]}")
-        log("TRACE", f"Weight groups generated: { {r['WeightGroup'] for r in results} }")
+        logger.debug("Sample output record: %s", results[0])
+        if logger.isEnabledFor("TRACE"):
+            logger.trace("Weight groups generated: %s", {r['WeightGroup'] for r in results})
 
     return results
 
 def build_bwr_distance_perf(rows):
     last_update = datetime.now().strftime("%Y/%m/%d %H:%M")
 
-    def parse_date(date_str):
-        clean_date = sanitize_text(date_str)
-        try:
-            return datetime.strptime(clean_date, "%d/%m/%y")
-        except ValueError:
-            return None
-
-    def get_bwr_group(bwr):
-        if bwr <= 0.90:
-            return "Very Low"
-        elif bwr <= 0.98:
-            return "Low"
-        elif bwr <= 1.04:
-            return "Medium Low"
-        elif bwr <= 1.10:
-            return "Medium"
-        elif bwr <= 1.18:
-            return "Medium High"
-        elif bwr <= 1.34:
-            return "High"
-        else:
-            return "Very High"
-
     bwr_perf = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {"Top3Count": 0, "TotalRuns": 0})))
     today = datetime.now().date()
 
@@ -389,15 +314,10 @@ def build_bwr_distance_perf(rows):
         ):
             continue
 
-        race_date = parse_date(date_str)
+        race_date = parse_hkjc_date(date_str)
         if not race_date:
             continue
-
-        # Determine season from race date
-        if race_date.month >= 9:
-            season_code = f"{race_date.year % 100:02d}/{(race_date.year + 1) % 100:02d}"
-        else:
-            season_code = f"{(race_date.year - 1) % 100:02d}/{race_date.year % 100:02d}"
+        season_code = get_season_code(race_date)
 
         distance = int(distance_str)
         actual_wt = int(actual_wt_str)
@@ -409,7 +329,7 @@ def build_bwr_distance_perf(rows):
         bwr = round((actual_wt / declared_wt) * 10, 3)
         bwr_group = get_bwr_group(bwr)
 
-        log("DEBUG", f"BWR = {bwr} → Group = {bwr_group} | ActWt = {actual_wt}, DeclWt = {declared_wt}")
+        logger.debug("BWR = %s → Group = %s | ActWt = %s, DeclWt = %s", bwr, bwr_group, actual_wt, declared_wt)
 
         stats = bwr_perf[season_code][distance][bwr_group]
         stats["TotalRuns"] += 1
@@ -439,12 +359,9 @@ def build_bwr_distance_perf(rows):
 
     return result
 
-def upsert_hwtr_trend(hwtr_data):
-    """Insert or update HWTR performance into horse_hwtr_trend table"""
-    import sqlite3
+def create_hwtr_trend_table():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS horse_hwtr_trend (
             HorseID TEXT,
@@ -458,6 +375,16 @@ def upsert_hwtr_trend(hwtr_data):
             PRIMARY KEY (HorseID, Season, Class, HWTRGroup)
         );
     """)
+    conn.commit()
+    conn.close()
+
+def upsert_hwtr_trend(hwtr_data):
+    """Insert or update HWTR performance into horse_hwtr_trend table"""
+    import sqlite3
+    create_hwtr_trend_table()  # Ensure table exists
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
 
     for row in hwtr_data:
         cursor.execute("""
@@ -469,25 +396,15 @@ def upsert_hwtr_trend(hwtr_data):
             row["Top3Rate"], row["Top3Count"], row["TotalRuns"], row["LastUpdate"]
         ))
 
-        log("DEBUG", f"UPSERT HWTR → {row['HorseID']} | {row['Season']} | Class={row['Class']} | Group={row['HWTRGroup']}")
+        logger.debug("UPSERT HWTR → %s | %s | Class=%s | Group=%s",
+                     row['HorseID'], row['Season'], row['Class'], row['HWTRGroup'])
 
     conn.commit()
     conn.close()
 
 # --- Utility: Group HWTR into buckets for ML ---
 def get_hwtr_group(hwtr):
-    if hwtr < 0.85:
-        return "0.75–0.85"
-    elif hwtr < 0.95:
-        return "0.85–0.95"
-    elif hwtr < 1.05:
-        return "0.95–1.05"
-    elif hwtr < 1.15:
-        return "1.05–1.15"
-    elif hwtr < 1.25:
-        return "1.15–1.25"
-    else:
-        return "1.25+"
+    return HWTR_GROUP.lookup(hwtr)
 
 def build_hwtr_per_class(rows, horse_id):
     """Analyze Historical Weight Trend Ratio (HWTR) by Class per horse and season"""
@@ -496,49 +413,47 @@ def build_hwtr_per_class(rows, horse_id):
 
     def parse_float(value):
         try:
-            return float(value)
-        except:
-            return 0.0
-
-    hwtr_group = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {"top3": 0, "total": 0})))
+            return float(sanitize_text(value))
+        except Exception:
+            return None
 
-    for i in range(len(rows) - 1, -1, -1):
-        cols = rows[i].find_all("td")
+    # Only races rebuild_hwtr_trend_sql() sees in horse_race_history: a
+    # dd/mm/yy date, a declared-weight column and both weights parsed
+    races = []
+    for row in rows:
+        cols = row.find_all("td")
         if len(cols) < 17:
             continue
-
         try:
-            placing_str = cols[1].text.strip()
-            placing = int(placing_str) if placing_str.isdigit() else 99
-            date = datetime.strptime(cols[2].text.strip(), "%d/%m/%y")
-            # Correct HKJC season code logic
-            if date.month >= 9:
-                season_code = f"{date.year%100:02d}/{(date.year+1)%100:02d}"
-            else:
-                season_code = f"{(date.year-1)%100:02d}/{date.year%100:02d}"
-            cls = sanitize_text(cols[6].text).upper()
-            if cls in ("GRIFFIN", "GRF"):
-                cls = "6"
-            actual_wt = parse_float(cols[13].text.strip())
-            declared_wt = parse_float(cols[16].text.strip())
-        except:
+            race_date = datetime.strptime(sanitize_text(cols[2].text), "%d/%m/%y")
+        except ValueError:
+            continue
+        actual_wt = parse_float(cols[13].text)
+        declared_wt = parse_float(cols[16].text)
+        if actual_wt is None or actual_wt <= 0 or declared_wt is None:
             continue
+        races.append((race_date, cols, actual_wt, declared_wt))
+
+    # Oldest -> newest, so races[j] for j < i are the races before races[i]
+    races.sort(key=lambda race: race[0])
 
+    hwtr_group = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {"top3": 0, "total": 0})))
+
+    for i in range(len(races) - 1, -1, -1):
+        race_date, cols, actual_wt, declared_wt = races[i]
         # Skip invalid weights
-        if actual_wt <= 0 or declared_wt <= 0:
+        if declared_wt <= 0:
             continue
 
+        placing = clean_placing(cols[1].text) or 99
+        # Correct HKJC season code logic
+        season_code = get_season_code(race_date)
+        cls = sanitize_text(cols[6].text).upper()
+        if cls in ("GRIFFIN", "GRF"):
+            cls = "6"
+
         # Look back at up to 3 previous races
-        history = []
-        for j in range(i - 1, -1, -1):
-            prev_cols = rows[j].find_all("td")
-            if len(prev_cols) < 17:
-                continue
-            prev_actual = parse_float(prev_cols[13].text.strip())
-            if prev_actual > 0:
-                history.append(prev_actual)
-            if len(history) >= 3:
-                break
+        history = [race[2] for race in races[max(0, i - 3):i]]
 
         # Fix #1: Relax history requirement to minimum 2 past races
         if len(history) < 2:
@@ -548,16 +463,7 @@ def build_hwtr_per_class(rows, horse_id):
         hwtr = actual_wt / avg_prev_wt if avg_prev_wt > 0 else 0.0
 
         # Define HWTR buckets
-        if hwtr < 0.85:
-            group = "<0.85"
-        elif hwtr < 0.95:
-            group = "0.85–0.95"
-        elif hwtr < 1.05:
-            group = "0.95–1.05"
-        elif hwtr < 1.15:
-            group = "1.05–1.15"
-        else:
-            group = "1.15+"
+        group = HWTR_CLASS_GROUP.lookup(hwtr)
 
         hwtr_group[season_code][cls][group]["total"] += 1
         if placing <= 3:
@@ -571,26 +477,28 @@ def build_hwtr_per_class(rows, horse_id):
                 top3 = hwtr_group[season_code][cls][group]["top3"]
                 total = hwtr_group[season_code][cls][group]["total"]
 
-            # Fix #2: Apply fallback logic for small sample sizes
-            if total < 3 and top3 > 0:
-                top3rate = (top3 / total) * 0.5
-            else:
-                top3rate = top3 / total if total > 0 else 0.0
+                # Fix #2: Apply fallback logic for small sample sizes
+                if total < 3 and top3 > 0:
+                    top3rate = (top3 / total) * 0.5
+                else:
+                    top3rate = top3 / total if total > 0 else 0.0
 
-            result.append({
-                "HorseID": horse_id,
-                "Season": season_code,
-                "Class": cls,
-                "HWTRGroup": group,
-                "Top3Rate": round(top3rate, 3),
-                "Top3Count": top3,
-                "TotalRuns": total,
-                "LastUpdate": datetime.now().strftime("%Y/%m/%d %H:%M")
-            })
+                result.append({
+                    "HorseID": horse_id,
+                    "Season": season_code,
+                    "Class": cls,
+                    "HWTRGroup": group,
+                    "Top3Rate": round(top3rate, 3),
+                    "Top3Count": top3,
+                    "TotalRuns": total,
+                    "LastUpdate": datetime.now().strftime("%Y/%m/%d %H:%M")
+                })
 
     # Fix #3: Debug output
-    for r in result:
-        log("DEBUG", f"HWTR {r['HorseID']} | Class={r['Class']} | Group={r['HWTRGroup']} | Top3Rate={r['Top3Rate']:.2f}")
+    if logger.isEnabledFor("DEBUG"):
+        for r in result:
+            logger.debug("HWTR %s | Class=%s | Group=%s | Top3Rate=%.2f",
+                         r['HorseID'], r['Class'], r['HWTRGroup'], r['Top3Rate'])
     
     return result
 
@@ -694,10 +602,7 @@ def build_exact_distance_pref(rows):
         if not race_date:
             continue
 
-        if race_date.month >= 9:
-            season_code = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}"
-        else:
-            season_code = f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
+        season_code = get_season_code(race_date)
 
         race_info_list.append({
             "season": season_code,
@@ -793,17 +698,8 @@ def create_horse_jockey_combo_table():
     conn.commit()
     conn.close()
 
-def upsert_horse_jockey_combo(horse_id, rows):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    last_update = datetime.now().strftime("%Y/%m/%d %H:%M")
-
-    # Ensure table and columns exist
-    create_horse_jockey_combo_table()
-    ensure_column_exists(DB_PATH, "horse_jockey_combo", "LastUpdate", "TEXT")
-    ensure_column_exists(DB_PATH, "horse_jockey_combo", "LastRaceDate", "TEXT")
-    ensure_column_exists(DB_PATH, "horse_jockey_combo", "LastUpdate", "TEXT")
-
+def build_horse_jockey_combo(rows):
+    """{season: {jockey: {"Top3Count", "TotalRuns", "LastRaceDate", ...}}} from race-table rows."""
     # Helper: parse date
     def parse_date(date_str):
         clean_date = sanitize_text(date_str)
@@ -811,24 +707,19 @@ def upsert_horse_jockey_combo(horse_id, rows):
             return datetime.strptime(clean_date, "%d/%m/%y")
         except ValueError:
             return None
-    
-    try:
-        sorted_rows = sorted(
-            rows,
-            key=lambda row: parse_date(row.find_all("td")[2].get_text(strip=True)) or datetime.min,
-            reverse=True
-        )
-    except Exception as e:
-        log("DEBUG", f"Sort error for {horse_id}: {e}")
-        sorted_rows = rows
 
-    if sorted_rows:
+    if rows and logger.isEnabledFor("DEBUG"):
         try:
+            sorted_rows = sorted(
+                rows,
+                key=lambda row: parse_date(row.find_all("td")[2].get_text(strip=True)) or datetime.min,
+                reverse=True
+            )
             newest = sorted_rows[0].find_all("td")[2].get_text(strip=True)
             oldest = sorted_rows[-1].find_all("td")[2].get_text(strip=True)
-            log("DEBUG", f"Processing {len(sorted_rows)} races ({newest} to {oldest})")
+            logger.debug("Processing %d races (%s to %s)", len(sorted_rows), newest, oldest)
         except Exception as debug_e:
-            log("DEBUG", f"Debug error: {debug_e}")
+            logger.debug("Debug error: %s", debug_e)
 
     ## Process statistics
     stats_dict = defaultdict(lambda: defaultdict(lambda: {
@@ -855,10 +746,7 @@ def upsert_horse_jockey_combo(horse_id, rows):
                 continue
 
             # Convert to season format
-            if race_date.month >= 9:
-                season_code = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}"
-            else:
-                season_code = f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
+            season_code = get_season_code(race_date)
 
             stats = stats_dict[season_code][jockey_name]
             stats["TotalRuns"] += 1
@@ -874,10 +762,25 @@ def upsert_horse_jockey_combo(horse_id, rows):
                 stats["LastRaceDateDisplay"] = date_str
 
         except Exception as e:
-            log("DEBUG", f"Row processing error: {e}")
+            logger.debug("Row processing error: %s", e)
             continue
 
-    for season, jockeys in stats_dict.items():
+    # Plain dicts, so the result pickles back from a parse worker
+    return {season: dict(jockeys) for season, jockeys in stats_dict.items()}
+
+def upsert_horse_jockey_combo(horse_id, jockey_combo):
+    """Write build_horse_jockey_combo() output."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    last_update = datetime.now().strftime("%Y/%m/%d %H:%M")
+
+    # Ensure table and columns exist
+    create_horse_jockey_combo_table()
+    ensure_column_exists(DB_PATH, "horse_jockey_combo", "LastUpdate", "TEXT")
+    ensure_column_exists(DB_PATH, "horse_jockey_combo", "LastRaceDate", "TEXT")
+    ensure_column_exists(DB_PATH, "horse_jockey_combo", "LastUpdate", "TEXT")
+
+    for season, jockeys in jockey_combo.items():
         for jockey, values in jockeys.items():
             runs = values["TotalRuns"]
             top3 = values["Top3Count"]
@@ -945,8 +848,9 @@ def create_running_style_pref_table():
     conn.commit()
     conn.close()
 
-def migrate_turncount_to_real(db_path=DB_PATH):
+def migrate_turncount_to_real(db_path=None):
     import sqlite3
+    db_path = db_path or DB_PATH  # resolved at call time (shard workers repoint DB_PATH)
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
 
@@ -1028,7 +932,7 @@ def migrate_turncount_to_real(db_path=DB_PATH):
 
     # Rebuild style preferences to retain original fractional TurnCount values
     try:
-        rebuild_running_style_pref()
+        rebuild_running_style_pref_sql()
     except Exception as e:
         log("WARNING", f"Failed to rebuild running_style_pref: {e}")
 
@@ -1172,10 +1076,11 @@ def create_draw_pref_table():
             Top3Rate REAL,
             Top3Count INTEGER,
             TotalRuns INTEGER,
-            LastUpdate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (HorseID, Season, RaceCourse, DistanceGroup, DrawGroup)
+            LastUpdate TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # Append-only, so per-horse reads would otherwise scan every version
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_horse_draw_pref_horse ON horse_draw_pref (HorseID)")
     conn.commit()
     conn.close()
 
@@ -1277,8 +1182,37 @@ def create_class_jump_pref_table():
     conn.commit()
     conn.close()
 
-def create_horse_rating_table(db_path=DB_PATH):
+def create_race_history_table():
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS horse_race_history (
+            HorseID    TEXT,
+            RaceDate   TEXT,      -- ISO YYYY-MM-DD
+            RaceID     TEXT,
+            Season     TEXT,
+            RaceCourse TEXT,      -- ST / HV
+            CourseType TEXT,      -- A, B, C, C+3, AWT
+            Distance   INTEGER,
+            Going      TEXT,
+            Class      TEXT,      -- as shown on the page, Griffin -> '6'
+            ClassNum   INTEGER,   -- NULL for group races
+            Draw       INTEGER,
+            Trainer    TEXT,
+            Jockey     TEXT,
+            ActualWt   REAL,
+            DeclaredWt REAL,
+            Placing    INTEGER,
+            LastUpdate TEXT,
+            PRIMARY KEY (HorseID, RaceDate)
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+def create_horse_rating_table(db_path=None):
     import sqlite3
+    db_path = db_path or DB_PATH
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     # Create with LastUpdate as the LAST column
@@ -1309,10 +1243,11 @@ def upsert_horse_rating(
     official_rating: float,
     rating_start_season: float,
     rating_start_career: float,
-    db_path=DB_PATH
+    db_path=None
 ):
     import sqlite3
     from datetime import datetime
+    db_path = db_path or DB_PATH
     last_update = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
@@ -1348,7 +1283,7 @@ def upsert_weight_pref(horse_id, weight_pref_list):
         if key in unique_keys:
             duplicate_count += 1
             log("WARNING", f"Duplicate in input data: {key}")
-            log("DEBUG", f"Duplicate row details: {row}")
+            logger.debug("Duplicate row details: %s", row)
         unique_keys.add(key)
     log("DEBUG", f"Unique keys in input: {len(unique_keys)}, Duplicates: {duplicate_count}")
     # ===== END DUPLICATE DETECTION =====
@@ -1384,7 +1319,7 @@ def upsert_weight_pref(horse_id, weight_pref_list):
             
             # Skip if we've already processed this key in this batch
             if record_key in processed_keys:
-                log("DEBUG", f"Skipping duplicate record {i+1}: {record_key}")
+                logger.debug("Skipping duplicate record %d: %s", i + 1, record_key)
                 skipped_duplicates += 1
                 continue
                 
@@ -1431,7 +1366,7 @@ def upsert_weight_pref(horse_id, weight_pref_list):
                     carried_weight, rate, top3, total, last_update,
                     horse_id, season, distance_group, weight_group
                 ))
-                log("DEBUG", f"Updated existing record: {record_key}")
+                logger.debug("Updated existing record: %s", record_key)
             else:
                 # INSERT new record
                 insert_sql = """
@@ -1444,14 +1379,14 @@ def upsert_weight_pref(horse_id, weight_pref_list):
                     horse_id, season, distance_group, weight_group, carried_weight,
                     rate, top3, total, last_update
                 ))
-                log("DEBUG", f"Inserted new record: {record_key}")
+                logger.debug("Inserted new record: %s", record_key)
 
             success_count += 1
 
         except Exception as e:
             error_count += 1
             log("ERROR", f"Failed to upsert record {i+1}: {str(e)}")
-            log("DEBUG", f"Problematic row: {row}")
+            logger.debug("Problematic row: %s", row)
 
     try:
         conn.commit()
@@ -1529,12 +1464,13 @@ def upsert_weight_pref(horse_id, weight_pref_list):
             last_update = row.get("LastUpdate") or datetime.now().strftime("%Y/%m/%d %H:%M")
 
             # ====== 7. DEBUG BEFORE INSERT ======
-            log("DEBUG", f"\nRecord {i+1}:")
-            log("DEBUG", f"  Season: {row['Season']}")
-            log("DEBUG", f"  DistGroup: {row['DistanceGroup']}")
-            log("DEBUG", f"  WeightGroup: {row['WeightGroup']}")
-            log("DEBUG", f"  CarriedWeight: {row.get('CarriedWeight', 'None')}")
-            log("DEBUG", f"  Stats: {top3}/{total} (Rate: {rate})")
+            if logger.isEnabledFor("DEBUG"):
+                logger.debug("\nRecord %d:", i + 1)
+                logger.debug("  Season: %s", row['Season'])
+                logger.debug("  DistGroup: %s", row['DistanceGroup'])
+                logger.debug("  WeightGroup: %s", row['WeightGroup'])
+                logger.debug("  CarriedWeight: %s", row.get('CarriedWeight', 'None'))
+                logger.debug("  Stats: %s/%s (Rate: %s)", top3, total, rate)
 
             # ====== 8. EXECUTE UPSERT ======
             insert_sql = """
@@ -1621,7 +1557,7 @@ def upsert_weight_pref(horse_id, weight_pref_list):
         except Exception as e:
             error_count += 1
             log("ERROR", f"Failed to upsert record {i+1}: {str(e)}")  # Main error message
-            log("DEBUG", f"Problematic row: {row}")  # Detailed debug info
+            logger.debug("Problematic row: %s", row)  # Detailed debug info
             continue
 
     # ====== 8. FINAL COMMIT AND REPORT ======
@@ -1776,7 +1712,7 @@ def upsert_jockey_trainer_combo(horse_id, season, jockey, trainer, top3_count, t
             rate = round((top3_count / total_runs), 4) if total_runs > 0 else 0.0
             if total_runs < 3:
                 rate = round(rate * 0.5, 4)
-                log("DEBUG", f"Small sample adjustment for {horse_id}")
+                logger.debug("Small sample adjustment for %s", horse_id)
         except ZeroDivisionError:
             rate = 0.0
             stats['warnings'] += 1
@@ -1835,10 +1771,11 @@ def upsert_jockey_trainer_combo(horse_id, season, jockey, trainer, top3_count, t
             conn.close()
 
         # Single clean stats output
-        log("DEBUG", f"\n{horse_id} Result:")
-        log("DEBUG", f"  Combo: {jockey}/{trainer}")
-        log("DEBUG", f"  Status: {'SUCCESS' if stats['successful'] else 'FAILED'}")
-        log("DEBUG", f"  Warnings: {stats['warnings']}")
+        if logger.isEnabledFor("DEBUG"):
+            logger.debug("\n%s Result:", horse_id)
+            logger.debug("  Combo: %s/%s", jockey, trainer)
+            logger.debug("  Status: %s", 'SUCCESS' if stats['successful'] else 'FAILED')
+            logger.debug("  Warnings: %s", stats['warnings'])
 
 def build_course_pref(rows):
     def parse_date(date_str):
@@ -1863,10 +1800,7 @@ def build_course_pref(rows):
         if placing is None or not race_date or not raw_course:
             continue
 
-        if race_date.month >= 9:
-            season_code = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}"
-        else:
-            season_code = f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
+        season_code = get_season_code(race_date)
 
         if "AWT" in raw_course:
             race_course = "ST"
@@ -1900,6 +1834,20 @@ def build_course_pref(rows):
 
     return result
 
+def _class_to_int(txt):
+    """Numeric class for jump comparisons; None for group races or unknown text."""
+    import re
+
+    t = sanitize_text(txt).upper()
+    if not t:
+        return None
+    if any(k in t for k in ["G1", "G2", "G3"]):
+        return None
+    if "GRIFFIN" in t or "GRF" in t:
+        return 6
+    m = re.search(r"(\d+)", t)
+    return int(m.group(1)) if m else None
+
 def build_class_jump_pref(rows):
     """
     Build per-season stats for class movement between consecutive races.
@@ -1920,19 +1868,9 @@ def build_class_jump_pref(rows):
 
     def season_from_date(d: datetime) -> str:
         # HK season starts in September
-        return (f"{d.year%100:02d}/{(d.year+1)%100:02d}" if d.month >= 9
-                else f"{(d.year-1)%100:02d}/{d.year%100:02d}")
+        return get_season_code(d)
 
-    def class_to_int(txt):
-        t = sanitize_text(txt).upper()
-        if not t:
-            return None
-        if any(k in t for k in ["G1", "G2", "G3"]):
-            return None
-        if "GRIFFIN" in t or "GRF" in t:
-            return 6
-        m = re.search(r"(\d+)", t)
-        return int(m.group(1)) if m else None
+    class_to_int = _class_to_int
 
     # Build chronological list: (date_dt, placing, class_int)
     races = []
@@ -2031,10 +1969,7 @@ def build_draw_pref(rows):
         draw = int(draw_str)
 
         # Calculate season code
-        if race_date.month >= 9:
-            season_code = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}"
-        else:
-            season_code = f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
+        season_code = get_season_code(race_date)
 
         distance = int(distance_str)
         draw = int(draw_str)
@@ -2089,9 +2024,9 @@ def upsert_course_pref(horse_id, course_pref):
     ''')
 
     # ✅ Add these 3 lines right here to patch older DBs
-    ensure_column_exists("hkjc_horses_dynamic_special.db", "horse_course_pref", "Top3Count", "INTEGER")
-    ensure_column_exists("hkjc_horses_dynamic_special.db", "horse_course_pref", "TotalRuns", "INTEGER")
-    ensure_column_exists("hkjc_horses_dynamic_special.db", "horse_course_pref", "LastUpdate", "TEXT")
+    ensure_column_exists(DB_PATH, "horse_course_pref", "Top3Count", "INTEGER")
+    ensure_column_exists(DB_PATH, "horse_course_pref", "TotalRuns", "INTEGER")
+    ensure_column_exists(DB_PATH, "horse_course_pref", "LastUpdate", "TEXT")
 
     for season, courses in course_pref.items():
         for (race_course, course_type), values in courses.items():
@@ -2160,6 +2095,17 @@ def upsert_class_jump_pref(horse_id, jump_stats):
     conn.commit()
     conn.close()
 
+_FETCH_CLASS_JUMP_PREF_SQL = register_read_query("fetch_class_jump_pref_ordered", """
+    SELECT Season, JumpType, Top3Rate, Top3Count, TotalRuns
+    FROM horse_class_jump_pref
+    WHERE HorseID = ?
+    ORDER BY
+        CASE
+            WHEN Season = ? THEN 0  -- Current season first
+            ELSE 99 - CAST(SUBSTR(Season, 1, 2) AS INTEGER)  -- Older seasons sorted by recency
+        END
+""", ("HK_2020_A000", "24/25"), expect=("temp_btree",))
+
 def fetch_class_jump_pref_ordered(horse_id):
     """Fetch class jump pref ordered by season (newest first) with dynamic season handling"""
     conn = sqlite3.connect(DB_PATH)
@@ -2169,22 +2115,33 @@ def fetch_class_jump_pref_ordered(horse_id):
     current_year = datetime.now().year
     current_season = f"{current_year%100:02d}/{(current_year+1)%100:02d}"
     
-    cursor.execute(f"""
-        SELECT Season, JumpType, Top3Rate, Top3Count, TotalRuns
-        FROM horse_class_jump_pref
-        WHERE HorseID = ?
-        ORDER BY
-            CASE
-                WHEN Season = ? THEN 0  -- Current season first
-                ELSE 99 - CAST(SUBSTR(Season, 1, 2) AS INTEGER  -- Older seasons sorted by recency
-            END
-    """, (horse_id, current_season))
+    cursor.execute(_FETCH_CLASS_JUMP_PREF_SQL, (horse_id, current_season))
     
     results = cursor.fetchall()
     conn.close()
     
     return results
 
+_FETCH_RUNNING_STYLE_PREF_SQL = register_read_query("fetch_running_style_pref_ordered", """
+    SELECT
+        HorseID, Season, RaceCourse, DistanceGroup, TurnCount,
+        StyleBucket, Top3Rate, Top3Count, TotalRuns, LastUpdate
+    FROM horse_running_style_pref
+    WHERE HorseID = ?
+    ORDER BY
+        CAST(SUBSTR(Season, 1, 2) AS INTEGER) DESC,      -- 24/25 before 23/24
+        RaceCourse,
+        DistanceGroup,
+        TurnCount DESC,
+        CASE StyleBucket
+            WHEN 'Leader'  THEN 1
+            WHEN 'On-pace' THEN 2
+            WHEN 'Stalker' THEN 3
+            WHEN 'Closer'  THEN 4
+            ELSE 99
+        END
+""", ("HK_2020_A000",), expect=("temp_btree",))
+
 def fetch_running_style_pref_ordered(horse_id):
     """
     Return horse_running_style_pref rows for a horse with Season sorted newest→oldest.
@@ -2197,43 +2154,24 @@ def fetch_running_style_pref_ordered(horse_id):
     current_year = datetime.now().year
     current_season = f"{current_year%100:02d}/{(current_year+1)%100:02d}"
     
-    cur.execute("""
-        SELECT
-            HorseID, Season, RaceCourse, DistanceGroup, TurnCount,
-            StyleBucket, Top3Rate, Top3Count, TotalRuns, LastUpdate
-        FROM horse_running_style_pref
-        WHERE HorseID = ?
-        ORDER BY
-            CAST(SUBSTR(Season, 1, 2) AS INTEGER) DESC,      -- 24/25 before 23/24
-            RaceCourse,
-            DistanceGroup,
-            TurnCount DESC,
-            CASE StyleBucket
-                WHEN 'Leader'  THEN 1
-                WHEN 'On-pace' THEN 2
-                WHEN 'Stalker' THEN 3
-                WHEN 'Closer'  THEN 4
-                ELSE 99
-            END
-    """, (horse_id,))
+    cur.execute(_FETCH_RUNNING_STYLE_PREF_SQL, (horse_id,))
     rows = cur.fetchall()
     conn.close()
     return rows
     
+_FETCH_DRAW_PREF_SQL = register_read_query("fetch_draw_pref_ordered", """
+    SELECT HorseID, Season, RaceCourse, DistanceGroup, DrawGroup,
+           Top3Rate, Top3Count, TotalRuns, LastUpdate
+    FROM horse_draw_pref
+    WHERE HorseID = ?
+    ORDER BY datetime(LastUpdate) DESC
+""", ("HK_2020_A000",), expect=("temp_btree",))
+
 def fetch_draw_pref_ordered(horse_id):
     """Fetch draw preference rows for a horse ordered by most recent update."""
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT HorseID, Season, RaceCourse, DistanceGroup, DrawGroup,
-               Top3Rate, Top3Count, TotalRuns, LastUpdate
-        FROM horse_draw_pref
-        WHERE HorseID = ?
-        ORDER BY datetime(LastUpdate) DESC
-        """,
-        (horse_id,),
-    )
+    cur.execute(_FETCH_DRAW_PREF_SQL, (horse_id,))
     rows = cur.fetchall()
     conn.close()
     return rows
@@ -2285,7 +2223,7 @@ def rebuild_running_style_pref(horse_id: str | None = None) -> tuple[int, int]:
         try:
             tc = round(float(turn_cnt), 1)
         except Exception as e:
-            log("DEBUG", f"Failed to convert turn count '{turn_cnt}': {e}")
+            logger.debug("Failed to convert turn count '%s': %s", turn_cnt, e)
 
         key = (hid, season, rc or "Unknown", ctype or "Unknown",
                dist_grp or "Unknown", tc, bucket)
@@ -2326,6 +2264,330 @@ def rebuild_running_style_pref(horse_id: str | None = None) -> tuple[int, int]:
     conn.close()
     return upserts, len(agg)
 
+# Same bucketing as _compute_style_bucket / rebuild_running_style_pref, but
+# evaluated entirely inside SQLite as one INSERT ... SELECT ... GROUP BY.
+_RUNNING_STYLE_PREF_SQL = """
+    INSERT OR REPLACE INTO horse_running_style_pref
+    (HorseID, Season, RaceCourse, CourseType, DistanceGroup,
+     TurnCount, StyleBucket,
+     Top3Rate, Top3Count, TotalRuns, LastUpdate)
+    SELECT
+        HorseID, Season, RaceCourse, CourseType, DistanceGroup,
+        TurnCount, StyleBucket,
+        CAST(SUM(IsTop3) AS REAL) / COUNT(*)
+            * (CASE WHEN COUNT(*) < 3 AND SUM(IsTop3) > 0 THEN 0.5 ELSE 1.0 END),
+        SUM(IsTop3),
+        COUNT(*),
+        :last_update
+    FROM (
+        SELECT
+            HorseID,
+            Season,
+            COALESCE(NULLIF(RaceCourse, ''), 'Unknown')    AS RaceCourse,
+            COALESCE(NULLIF(CourseType, ''), 'Unknown')    AS CourseType,
+            COALESCE(NULLIF(DistanceGroup, ''), 'Unknown') AS DistanceGroup,
+            COALESCE(ROUND(CAST(TurnCount AS REAL), 1), 0) AS TurnCount,
+            CASE
+                WHEN EarlyPct <= 0.15 THEN 'Leader'
+                WHEN EarlyPct <= 0.35 THEN 'On-pace'
+                WHEN EarlyPct <= 0.65 THEN 'Stalker'
+                ELSE 'Closer'
+            END AS StyleBucket,
+            CASE WHEN CAST(Placing AS INTEGER) <= 3 THEN 1 ELSE 0 END AS IsTop3
+        FROM (
+            SELECT
+                *,
+                -- (pos-1)/(field_size-1) so leader=0.0, last=1.0
+                (CAST(EarlyPos AS INTEGER) - 1) * 1.0
+                    / MAX(CAST(FieldSize AS INTEGER) - 1, 1) AS EarlyPct
+            FROM horse_running_position
+            WHERE FieldSize AND EarlyPos {horse_filter}
+        )
+    )
+    GROUP BY HorseID, Season, RaceCourse, CourseType, DistanceGroup, TurnCount, StyleBucket
+"""
+
+register_read_query("rebuild_running_style_pref",
+                    _RUNNING_STYLE_PREF_SQL.format(horse_filter="AND HorseID = :horse_id"),
+                    {"last_update": "2024/06/01 00:00", "horse_id": "HK_2020_A000"},
+                    expect=("temp_btree",))
+register_read_query("rebuild_running_style_pref (all horses)",
+                    _RUNNING_STYLE_PREF_SQL.format(horse_filter=""),
+                    {"last_update": "2024/06/01 00:00"},
+                    expect=("scan", "temp_btree"))
+
+def rebuild_running_style_pref_sql(horse_id: str | None = None) -> tuple[int, int]:
+    """
+    Set-based equivalent of rebuild_running_style_pref().
+    Style bucketing, TurnCount rounding and the <3-runs 50% damping all run
+    inside SQLite, so a full backfill never pulls horse_running_position
+    into Python. Pass horse_id to rebuild a single horse.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    create_running_style_pref_table()
+
+    params = {"last_update": datetime.now().strftime("%Y/%m/%d %H:%M")}
+    horse_filter = ""
+    if horse_id:
+        horse_filter = "AND HorseID = :horse_id"
+        params["horse_id"] = horse_id
+
+    cur.execute(_RUNNING_STYLE_PREF_SQL.format(horse_filter=horse_filter), params)
+    upserts = cur.rowcount
+
+    conn.commit()
+    conn.close()
+    return upserts, upserts
+
+def build_race_history(rows, horse_id):
+    """
+    Flatten race-history table rows into one record per race for horse_race_history.
+    Parsing mirrors build_class_jump_pref / build_hwtr_per_class so the SQL
+    rebuilds below see the same values the Python builders do.
+    """
+    def parse_float(value):
+        try:
+            return float(sanitize_text(value))
+        except Exception:
+            return None
+
+    records = []
+    for row in rows:
+        cols = row.find_all("td")
+        if len(cols) < 8:
+            continue
+
+        try:
+            race_date = datetime.strptime(sanitize_text(cols[2].get_text()), "%d/%m/%y")
+        except ValueError:
+            continue
+
+        raw_course = sanitize_text(cols[3].get_text())
+        if "AWT" in raw_course:
+            race_course, course_type = "ST", "AWT"
+        else:
+            parts = raw_course.split("/")
+            race_course = parts[0].strip() if parts[0].strip() else None
+            course_type = parts[2].replace('"', '').strip() if len(parts) > 2 else None
+
+        # Class as HWTR groups it (col 6), and the numeric class used for jumps
+        cls = sanitize_text(cols[6].get_text()).upper()
+        if cls in ("GRIFFIN", "GRF"):
+            cls = "6"
+        cls_txt = sanitize_text(cols[6].get_text())
+        if (not cls_txt or not any(c.isdigit() for c in cls_txt)) and len(cols) > 7:
+            cls_txt = sanitize_text(cols[7].get_text())
+
+        race_link = cols[0].find("a")
+        race_id = ''.join(c for c in sanitize_text(race_link.get_text()) if c.isdigit()) if race_link else ""
+        distance_str = sanitize_text(cols[4].get_text())
+        draw_str = sanitize_text(cols[7].get_text())
+
+        records.append({
+            "HorseID": horse_id,
+            "RaceDate": race_date.strftime("%Y-%m-%d"),
+            "RaceID": race_id or None,
+            "Season": get_season_code(race_date),
+            "RaceCourse": race_course,
+            "CourseType": course_type,
+            "Distance": int(distance_str) if distance_str.isdigit() else None,
+            "Going": sanitize_text(cols[5].get_text()) or None,
+            "Class": cls,
+            "ClassNum": _class_to_int(cls_txt),
+            "Draw": int(draw_str) if draw_str.isdigit() else None,
+            "Trainer": (sanitize_text(cols[9].get_text()) or None) if len(cols) > 9 else None,
+            "Jockey": (sanitize_text(cols[10].get_text()) or None) if len(cols) > 10 else None,
+            "ActualWt": parse_float(cols[13].get_text()) if len(cols) > 13 else None,
+            "DeclaredWt": parse_float(cols[16].get_text()) if len(cols) > 16 else None,
+            "Placing": clean_placing(cols[1].get_text()),
+        })
+
+    return records
+
+def upsert_race_history(horse_id, records):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    create_race_history_table()
+    last_update = datetime.now().strftime("%Y/%m/%d %H:%M")
+
+    cursor.executemany("""
+        INSERT INTO horse_race_history (
+            HorseID, RaceDate, RaceID, Season, RaceCourse, CourseType,
+            Distance, Going, Class, ClassNum, Draw, Trainer, Jockey,
+            ActualWt, DeclaredWt, Placing, LastUpdate
+        ) VALUES (
+            :HorseID, :RaceDate, :RaceID, :Season, :RaceCourse, :CourseType,
+            :Distance, :Going, :Class, :ClassNum, :Draw, :Trainer, :Jockey,
+            :ActualWt, :DeclaredWt, :Placing, :LastUpdate
+        )
+        ON CONFLICT(HorseID, RaceDate) DO UPDATE SET
+            RaceID     = excluded.RaceID,
+            Season     = excluded.Season,
+            RaceCourse = excluded.RaceCourse,
+            CourseType = excluded.CourseType,
+            Distance   = excluded.Distance,
+            Going      = excluded.Going,
+            Class      = excluded.Class,
+            ClassNum   = excluded.ClassNum,
+            Draw       = excluded.Draw,
+            Trainer    = excluded.Trainer,
+            Jockey     = excluded.Jockey,
+            ActualWt   = excluded.ActualWt,
+            DeclaredWt = excluded.DeclaredWt,
+            Placing    = excluded.Placing,
+            LastUpdate = excluded.LastUpdate
+    """, [{**r, "HorseID": horse_id, "LastUpdate": last_update} for r in records])
+
+    conn.commit()
+    conn.close()
+
+# Previous-race class via LAG(). Races without a numeric class or placing are
+# dropped first, which is what build_class_jump_pref does when it only moves
+# prev_cls forward on races with a class.
+_CLASS_JUMP_PREF_SQL = """
+    INSERT INTO horse_class_jump_pref (
+        HorseID, Season, JumpType,
+        Top3Rate, Top3Count, TotalRuns, LastUpdate
+    )
+    SELECT
+        HorseID, Season, JumpType,
+        PYROUND(
+            CAST(SUM(IsTop3) AS REAL) / COUNT(*)
+                * (CASE WHEN COUNT(*) < 3 AND SUM(IsTop3) > 0 THEN 0.5 ELSE 1.0 END),
+            4),
+        SUM(IsTop3),
+        COUNT(*),
+        :last_update
+    FROM (
+        SELECT
+            HorseID,
+            Season,
+            CASE
+                WHEN ClassNum < PrevClass THEN 'Up'
+                WHEN ClassNum > PrevClass THEN 'Down'
+                ELSE 'Same'
+            END AS JumpType,
+            CASE WHEN Placing <= 3 THEN 1 ELSE 0 END AS IsTop3
+        FROM (
+            SELECT
+                HorseID, Season, ClassNum, Placing,
+                LAG(ClassNum) OVER (PARTITION BY HorseID ORDER BY RaceDate) AS PrevClass
+            FROM horse_race_history
+            WHERE ClassNum IS NOT NULL AND Placing IS NOT NULL {horse_filter}
+        )
+        WHERE PrevClass IS NOT NULL
+    )
+    WHERE true
+    GROUP BY HorseID, Season, JumpType
+    ON CONFLICT(HorseID, Season, JumpType)
+    DO UPDATE SET
+        Top3Rate = excluded.Top3Rate,
+        Top3Count = excluded.Top3Count,
+        TotalRuns = excluded.TotalRuns,
+        LastUpdate = excluded.LastUpdate
+"""
+
+# HWTR = ActualWt / average of up to 3 previous carried weights (at least 2).
+# The window only spans races build_hwtr_per_class looks back over: a
+# carried weight and a declared weight (build_race_history leaves DeclaredWt
+# NULL for short rows and "--"); undated rows never reach the table.
+_HWTR_TREND_SQL = """
+    WITH weights AS (
+        SELECT
+            HorseID, Season, Class, Placing, ActualWt, DeclaredWt,
+            AVG(ActualWt) OVER prev3   AS AvgPrevWt,
+            COUNT(ActualWt) OVER prev3 AS PrevRuns
+        FROM horse_race_history
+        WHERE ActualWt > 0 AND DeclaredWt IS NOT NULL {horse_filter}
+        WINDOW prev3 AS (
+            PARTITION BY HorseID ORDER BY RaceDate
+            ROWS BETWEEN 3 PRECEDING AND 1 PRECEDING
+        )
+    ),
+    grouped AS (
+        SELECT
+            HorseID, Season, Class,
+            CASE
+                WHEN ActualWt / AvgPrevWt < 0.85 THEN '<0.85'
+                WHEN ActualWt / AvgPrevWt < 0.95 THEN '0.85–0.95'
+                WHEN ActualWt / AvgPrevWt < 1.05 THEN '0.95–1.05'
+                WHEN ActualWt / AvgPrevWt < 1.15 THEN '1.05–1.15'
+                ELSE '1.15+'
+            END AS HWTRGroup,
+            CASE WHEN COALESCE(Placing, 99) <= 3 THEN 1 ELSE 0 END AS IsTop3
+        FROM weights
+        WHERE DeclaredWt > 0 AND PrevRuns >= 2
+    )
+    REPLACE INTO horse_hwtr_trend (
+        HorseID, Season, Class, HWTRGroup, Top3Rate, Top3Count, TotalRuns, LastUpdate
+    )
+    SELECT
+        HorseID, Season, Class, HWTRGroup,
+        PYROUND(
+            CAST(SUM(IsTop3) AS REAL) / COUNT(*)
+                * (CASE WHEN COUNT(*) < 3 AND SUM(IsTop3) > 0 THEN 0.5 ELSE 1.0 END),
+            3),
+        SUM(IsTop3),
+        COUNT(*),
+        :last_update
+    FROM grouped
+    GROUP BY HorseID, Season, Class, HWTRGroup
+"""
+
+def _connect_with_sql_functions(db_path):
+    """Connection with PYROUND(), so SQL-side rates round exactly like Python's round()."""
+    conn = sqlite3.connect(db_path)
+    conn.create_function("PYROUND", 2, round, deterministic=True)
+    return conn
+
+def rebuild_class_jump_pref_sql(horse_id: str | None = None) -> int:
+    """
+    Rebuild horse_class_jump_pref from horse_race_history with LAG(),
+    for one horse or (horse_id=None) every horse. Returns rows written.
+    """
+    create_race_history_table()
+    create_class_jump_pref_table()
+    conn = _connect_with_sql_functions(DB_PATH)
+    cur = conn.cursor()
+
+    params = {"last_update": datetime.now().strftime("%Y/%m/%d %H:%M")}
+    horse_filter = ""
+    if horse_id:
+        horse_filter = "AND HorseID = :horse_id"
+        params["horse_id"] = horse_id
+
+    cur.execute(_CLASS_JUMP_PREF_SQL.format(horse_filter=horse_filter), params)
+    upserts = cur.rowcount
+
+    conn.commit()
+    conn.close()
+    return upserts
+
+def rebuild_hwtr_trend_sql(horse_id: str | None = None) -> int:
+    """
+    Rebuild horse_hwtr_trend from horse_race_history with a
+    3-preceding-rows AVG() window, for one horse or every horse.
+    Returns rows written.
+    """
+    create_race_history_table()
+    create_hwtr_trend_table()
+    conn = _connect_with_sql_functions(DB_PATH)
+    cur = conn.cursor()
+
+    params = {"last_update": datetime.now().strftime("%Y/%m/%d %H:%M")}
+    horse_filter = ""
+    if horse_id:
+        horse_filter = "AND HorseID = :horse_id"
+        params["horse_id"] = horse_id
+
+    cur.execute(_HWTR_TREND_SQL.format(horse_filter=horse_filter), params)
+    upserts = cur.rowcount
+
+    conn.commit()
+    conn.close()
+    return upserts
+
 if __name__ == "__main__":
     print("\n[INFO] This module provides helper functions for processing HKJC horse data.")
     print("       It's designed to be imported, not run directly.")
@@ -0,0 +1,147 @@
+# -----------------------------
+# HORSE ID SOURCES
+# -----------------------------
+# run_batch(), the job queue and the benchmarks take any iterable of
+# HorseIDs. HorseIdStream yields them lazily - from a CSV file, stdin or a
+# DB query - normalized and deduplicated on the fly, so the first horse is
+# scraped as soon as its ID is read and the list never has to fit in memory
+# (only the set of IDs already seen is kept).
+#
+# Input specs:
+#   "ids.csv"     CSV with a HorseID column
+#   "-"           stdin: the same CSV, or one ID per line
+#   "recent:30"   horses with a race in the last 30 days (horse_race_history)
+
+import csv
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+from special.utils_special import log
+import _horse_dynamic_stats_special as stats
+
+ID_COLUMN = "HorseID"
+STDIN_SPEC = "-"
+RECENT_PREFIX = "recent:"
+
+# Cells pandas.read_csv treated as missing (the old loader dropped them)
+_MISSING = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+# Rows per query when streaming from the DB; the connection is closed
+# between chunks so scraper writes are never blocked by our read lock
+DB_CHUNK_SIZE = 1000
+
+def normalize_horse_id(raw):
+    """Stripped HorseID, or None for blank / NaN-like cells."""
+    if raw is None:
+        return None
+    horse_id = str(raw).strip()
+    return None if horse_id in _MISSING else horse_id
+
+def iter_csv_ids(lines, column=ID_COLUMN, name="input"):
+    """Raw values of ``column`` from CSV ``lines`` (a file object or any iterable of lines)."""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [h.strip().lstrip("\ufeff") for h in header]
+    if column not in header:
+        raise ValueError(f"{name}: no {column} column in header {header}")
+    index = header.index(column)
+    for row in reader:
+        if len(row) > index:
+            yield row[index]
+
+def iter_file_ids(path, column=ID_COLUMN):
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        yield from iter_csv_ids(fh, column, name=path)
+
+def iter_stdin_ids(stream=None, column=ID_COLUMN):
+    """CSV with a ``column`` header, or bare IDs one per line (first field of each row)."""
+    stream = sys.stdin if stream is None else stream
+    reader = csv.reader(stream)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [h.strip().lstrip("\ufeff") for h in first]
+    if column in header:
+        index = header.index(column)
+    else:
+        index = 0
+        if first:
+            yield first[0]
+    for row in reader:
+        if len(row) > index:
+            yield row[index]
+
+def iter_recent_runner_ids(days, today=None, chunk_size=DB_CHUNK_SIZE):
+    """HorseIDs with a horse_race_history row in the last ``days`` days, in HorseID order."""
+    since = ((today or date.today()) - timedelta(days=days)).isoformat()
+    stats.create_race_history_table()
+    last = ""
+    while True:
+        conn = sqlite3.connect(stats.DB_PATH)
+        try:
+            # Keyset pagination over the (HorseID, RaceDate) primary key
+            rows = conn.execute("""
+                SELECT DISTINCT HorseID FROM horse_race_history
+                WHERE HorseID > ? AND RaceDate >= ?
+                ORDER BY HorseID
+                LIMIT ?
+            """, (last, since, chunk_size)).fetchall()
+        finally:
+            conn.close()
+        for (horse_id,) in rows:
+            yield horse_id
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+def open_source(spec, column=ID_COLUMN):
+    """Raw (un-normalized) IDs for an input spec, see the module header."""
+    if spec == STDIN_SPEC:
+        return iter_stdin_ids(column=column)
+    if spec.startswith(RECENT_PREFIX):
+        try:
+            days = int(spec[len(RECENT_PREFIX):])
+        except ValueError:
+            raise ValueError(f"Expected {RECENT_PREFIX}<days>, got {spec!r}") from None
+        return iter_recent_runner_ids(days)
+    return iter_file_ids(spec, column)
+
+def is_file_spec(spec):
+    return spec != STDIN_SPEC and not spec.startswith(RECENT_PREFIX)
+
+class HorseIdStream:
+    """
+    Iterable of normalized, deduplicated HorseIDs for ``spec`` (or any
+    iterable of raw IDs). Counts what it yielded and dropped as it goes.
+    """
+
+    def __init__(self, spec, column=ID_COLUMN):
+        self.spec = spec
+        self.column = column
+        self.count = 0
+        self.duplicates = 0
+        self.blank = 0
+
+    def __iter__(self):
+        raw_ids = open_source(self.spec, self.column) if isinstance(self.spec, str) else self.spec
+        seen = set()
+        for raw in raw_ids:
+            horse_id = normalize_horse_id(raw)
+            if horse_id is None:
+                self.blank += 1
+                continue
+            if horse_id in seen:
+                self.duplicates += 1
+                continue
+            seen.add(horse_id)
+            self.count += 1
+            yield horse_id
+        if self.duplicates or self.blank:
+            log("INFO", f"[INPUT] {self.count} horses ({self.duplicates} duplicates, "
+                        f"{self.blank} blank skipped)")
@@ -0,0 +1,235 @@
+# -----------------------------
+# HTML PARSER BACKENDS
+# -----------------------------
+# BeautifulSoup(page, "html.parser") builds a tree for the whole page in
+# pure Python only to find one table in it. find_table_rows() parses with
+# the fastest backend installed:
+#   "selectolax" - lexbor (C), rows are built straight from its nodes
+#   "lxml"       - BeautifulSoup over libxml2
+#   "html.parser"- stdlib, always there
+# The bs4 backends only build <table> subtrees (SoupStrainer). If a fast
+# backend finds no table (e.g. it repaired broken markup differently) the
+# page is parsed again with html.parser. Every backend returns the same
+# HtmlRows; bench_backends() checks that and times them.
+#
+# bs4 and selectolax are imported on first parse (bs4 alone costs ~75 ms
+# at startup); availability is checked with find_spec without importing.
+#
+# A bs4 tree is a web of parent/sibling reference cycles, so dropping the
+# soup does not free it: it lingers until a full cyclic GC pass, and with a
+# few workers parsing at once those dead trees dominate RSS. With
+# RELEASE_TREES (the default) each tree is decompose()d as soon as its rows
+# have been copied into HtmlRows, which frees it immediately.
+
+import codecs
+import time
+from importlib.util import find_spec
+
+from special.utils_special import log
+from _html_rows_special import HtmlCell, HtmlLink, HtmlRow, rows_from_table
+
+def _installed(name):
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+HAVE_LXML = _installed("lxml")  # BeautifulSoup(..., "lxml")
+HAVE_SELECTOLAX = _installed("selectolax.lexbor")
+
+# Fastest first
+BACKENDS = ("selectolax", "lxml", "html.parser")
+
+# None = fastest available; set to force a backend
+PARSER_BACKEND = None
+
+# Memory-bounded mode: free bs4 trees right after the rows are copied
+RELEASE_TREES = True
+
+# Attributes bs4 splits into lists
+_MULTI_VALUED = {"class", "rel", "rev", "headers", "accesskey", "accept-charset", "dropzone"}
+
+def decode_html(raw, encoding=None, fallbacks=("big5", "latin-1")):
+    """
+    Decode a response body once. UTF-8 (what HKJC serves) is tried first,
+    then the declared encoding; only if both fail is the encoding sniffed
+    with UnicodeDammit. (UTF-8 goes first because requests reports
+    ISO-8859-1 for any text/html without a charset, which never fails.)
+    """
+    if isinstance(raw, str):
+        return raw
+    for candidate in ("utf-8", encoding):
+        if not candidate:
+            continue
+        try:
+            codecs.lookup(candidate)
+            return raw.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    from bs4 import UnicodeDammit
+
+    return UnicodeDammit(raw, ["utf-8", *fallbacks]).unicode_markup
+
+def available_backends():
+    found = []
+    if HAVE_SELECTOLAX:
+        found.append("selectolax")
+    if HAVE_LXML:
+        found.append("lxml")
+    found.append("html.parser")
+    return found
+
+def default_backend():
+    if PARSER_BACKEND:
+        return PARSER_BACKEND
+    return available_backends()[0]
+
+# -- bs4 backends --
+def release_tree(soup):
+    """
+    Free a BeautifulSoup tree now rather than at the next cyclic GC.
+    decompose() on the soup object itself only wipes the root, so its
+    top-level children are decomposed first.
+    """
+    for child in list(soup.contents):
+        child.decompose()
+    soup.decompose()
+
+def _soup_table_rows(soup, selectors, fallback_header, clean):
+    for selector in selectors:
+        table = soup.select_one(selector)
+        if table is not None:
+            return rows_from_table(table, clean)
+    if fallback_header:
+        for table in soup.find_all("table"):
+            header = table.find("tr")
+            if header and fallback_header in header.get_text():
+                return rows_from_table(table, clean)
+    return None
+
+def _find_with_soup(html, selectors, fallback_header, features, clean):
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    soup = BeautifulSoup(html, features, parse_only=SoupStrainer("table"))
+    try:
+        return _soup_table_rows(soup, selectors, fallback_header, clean)
+    finally:
+        if RELEASE_TREES:
+            release_tree(soup)
+
+# -- selectolax backend --
+def _lexbor_attrs(node):
+    attrs = {}
+    for name, value in node.attributes.items():
+        value = value or ""
+        attrs[name] = value.split() if name in _MULTI_VALUED else value
+    return attrs
+
+def _lexbor_strings(node, clean=None):
+    strings = [n.text_content for n in node.traverse(include_text=True) if n.tag == "-text"]
+    return strings if clean is None else [clean(s) for s in strings]
+
+def _lexbor_rows(table, clean):
+    rows = []
+    for tr in table.css("tr"):
+        cells = []
+        for td in tr.css("td"):
+            a = td.css_first("a")
+            link = HtmlLink(_lexbor_strings(a, clean), _lexbor_attrs(a)) if a is not None else None
+            cells.append(HtmlCell(_lexbor_strings(td, clean), link))
+        rows.append(HtmlRow(cells, _lexbor_attrs(tr)))
+    return rows
+
+def _find_with_lexbor(html, selectors, fallback_header, clean):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    for selector in selectors:
+        table = tree.css_first(selector)
+        if table is not None:
+            return _lexbor_rows(table, clean)
+    if fallback_header:
+        for table in tree.css("table"):
+            header = table.css_first("tr")
+            if header is not None and fallback_header in "".join(_lexbor_strings(header)):
+                return _lexbor_rows(table, clean)
+    return None
+
+def _find_rows(html, selectors, fallback_header, backend, clean=None):
+    if backend == "selectolax":
+        return _find_with_lexbor(html, selectors, fallback_header, clean)
+    return _find_with_soup(html, selectors, fallback_header, backend, clean)
+
+def find_table_rows(html, selectors, fallback_header=None, backend=None, clean=None):
+    """
+    HtmlRows (header row included) of the first table matching one of the
+    CSS ``selectors`` (tried in order) or, failing that, of the first table
+    whose first row contains ``fallback_header``. None if there is none.
+    ``clean`` normalizes every cell string once (e.g. strip_non_ascii).
+    """
+    backend = backend or default_backend()
+    try:
+        rows = _find_rows(html, selectors, fallback_header, backend, clean)
+    except Exception as e:
+        log("DEBUG", f"[PARSER] {backend} failed: {e}")
+        rows = None
+    if rows is None and backend != "html.parser":
+        rows = _find_rows(html, selectors, fallback_header, "html.parser", clean)
+        if rows is not None:
+            log("DEBUG", f"[PARSER] {backend} found no table, html.parser did")
+    return rows
+
+# -----------------------------
+# BENCHMARK
+# -----------------------------
+def row_signature(rows):
+    """Comparable form of HtmlRows (text, links and attributes of every cell)."""
+    if rows is None:
+        return None
+    return [
+        (row.attrs, [(c.strings, c.link and (c.link.strings, c.link.attrs)) for c in row.cells])
+        for row in rows
+    ]
+
+def _full_tree_rows(html, selectors, fallback_header, clean=None):
+    # What the scraper did before: whole-page html.parser tree, then find
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    try:
+        return _soup_table_rows(soup, selectors, fallback_header, clean)
+    finally:
+        if RELEASE_TREES:
+            release_tree(soup)
+
+def bench_backends(pages, selectors, fallback_header=None, repeat=3, clean=None):
+    """
+    Time every available backend on ``pages`` (HTML strings) against the
+    full-tree html.parser baseline and check they produce identical rows.
+    Returns {backend: {"ms_per_page", "speedup", "identical"}}.
+    """
+    candidates = [("html.parser (full tree)",
+                   lambda html: _full_tree_rows(html, selectors, fallback_header, clean))]
+    for backend in available_backends():
+        candidates.append((backend, lambda html, b=backend: _find_rows(html, selectors, fallback_header, b, clean)))
+
+    expected = [row_signature(_full_tree_rows(html, selectors, fallback_header, clean)) for html in pages]
+    results = {}
+    for name, parse in candidates:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            outputs = [parse(html) for html in pages]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            "ms_per_page": round(best * 1000 / max(1, len(pages)), 2),
+            "identical": [row_signature(rows) for rows in outputs] == expected,
+        }
+
+    baseline = results["html.parser (full tree)"]["ms_per_page"]
+    for name, result in results.items():
+        result["speedup"] = round(baseline / result["ms_per_page"], 1) if result["ms_per_page"] else None
+        log("INFO", f"[PARSER] {name:<24} {result['ms_per_page']:>8} ms/page  "
+                    f"x{result['speedup']}  identical={result['identical']}")
+    return results
@@ -0,0 +1,185 @@
+# -----------------------------
+# PLAIN (PICKLABLE) TABLE ROWS
+# -----------------------------
+# bs4 Tags drag the whole parse tree along and are slow to pickle, so they
+# cannot be handed between processes. The race-table builders only use a
+# small slice of the Tag API:
+#   row.find_all("td"), row.attrs, cell.get_text(...), cell.text,
+#   cell.find("a"), link.has_attr("href"), link["href"]
+# HtmlRow / HtmlCell / HtmlLink provide exactly that over plain strings, so
+# the build_* functions work unchanged on them as long as they test for that
+# API (hasattr(row, "find_all")) rather than isinstance(row, bs4.Tag).
+#
+# Text is normalized once, when a row is built (``clean``, normally
+# strip_non_ascii), and a cell's plain get_text() is computed once and
+# kept, so the dozen sanitize_text(cell.get_text()) calls per cell in the
+# builders only see short, already-clean ASCII strings.
+
+import re
+
+_NON_ASCII = re.compile(r'[^\x00-\x7F\xa0]+')
+
+def strip_non_ascii(text):
+    """
+    Per-string equivalent of running sanitize_text() over the raw page
+    before parsing: literal non-ASCII goes, an entity-encoded &nbsp;
+    (\xa0 after decoding) stays.
+    """
+    return text if text.isascii() else _NON_ASCII.sub('', text)
+
+def _join_strings(strings, separator="", strip=False):
+    # Same semantics as bs4's Tag.get_text()
+    if strip:
+        strings = [s.strip() for s in strings]
+        strings = [s for s in strings if s]
+    return separator.join(strings)
+
+class HtmlLink:
+    __slots__ = ("strings", "attrs")
+
+    def __init__(self, strings, attrs):
+        self.strings = tuple(strings)
+        self.attrs = dict(attrs)
+
+    def get_text(self, separator="", strip=False):
+        return _join_strings(self.strings, separator, strip)
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    def has_attr(self, name):
+        return name in self.attrs
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+    def __getitem__(self, name):
+        return self.attrs[name]
+
+class HtmlCell:
+    __slots__ = ("strings", "link", "_text")
+
+    def __init__(self, strings, link=None):
+        self.strings = tuple(strings)
+        self.link = link
+        self._text = None
+
+    def get_text(self, separator="", strip=False):
+        if separator or strip:
+            return _join_strings(self.strings, separator, strip)
+        if self._text is None:
+            self._text = "".join(self.strings)
+        return self._text
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    def find(self, name):
+        return self.link if name == "a" else None
+
+class HtmlRow:
+    __slots__ = ("cells", "attrs")
+
+    def __init__(self, cells, attrs=None):
+        self.cells = list(cells)
+        self.attrs = dict(attrs or {})
+
+    def find_all(self, name):
+        return list(self.cells) if name == "td" else []
+
+    def get_text(self, separator="", strip=False):
+        return _join_strings([s for c in self.cells for s in c.strings], separator, strip)
+
+    def __repr__(self):
+        return f"HtmlRow({[c.get_text(strip=True) for c in self.cells]!r})"
+
+def _plain_strings(tag, clean=None):
+    # NavigableStrings keep a reference to the tree, copy to str
+    if clean is None:
+        return [str(s) for s in tag.strings]
+    return [clean(str(s)) for s in tag.strings]
+
+def _plain_attrs(tag):
+    return {k: list(v) if isinstance(v, list) else str(v) for k, v in tag.attrs.items()}
+
+def row_from_tag(tr, clean=None):
+    """Copy a bs4 <tr> into an HtmlRow (text of every <td> + its first link)."""
+    cells = []
+    for td in tr.find_all("td"):
+        a = td.find("a")
+        link = HtmlLink(_plain_strings(a, clean), _plain_attrs(a)) if a is not None else None
+        cells.append(HtmlCell(_plain_strings(td, clean), link))
+    return HtmlRow(cells, _plain_attrs(tr))
+
+def rows_from_table(table, clean=None):
+    """
+    All <tr> of a bs4 table as HtmlRows, header row included. ``clean`` is
+    applied to every text string.
+    """
+    return [row_from_tag(tr, clean) for tr in table.find_all("tr")]
+
+# -----------------------------
+# IN-BROWSER TABLE EXTRACTION
+# -----------------------------
+# Returning document.outerHTML ships the whole page (hundreds of KB) over
+# the driver connection only to find one table in it. TABLE_ROWS_JS runs
+# in the page and returns just that table as JSON, in the shape HtmlRow
+# needs; rows_from_json() turns it back into HtmlRows. Selection mirrors
+# the bs4 lookups: exact class strings first, then any table.bigborder;
+# every <tr>/<td> below the table, text nodes in document order.
+
+RACE_TABLE_SELECTORS = [
+    'table[class="f_tac f_fs12 js_race_tab"]',
+    'table[class="f_tac f_fs12"]',
+    "table.bigborder",
+]
+
+TABLE_ROWS_JS = """
+let table = null;
+for (const selector of arguments[0]) {
+    table = document.querySelector(selector);
+    if (table) break;
+}
+if (!table) return null;
+const texts = (el) => {
+    const out = [];
+    const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+    let node;
+    while ((node = walker.nextNode())) out.push(node.nodeValue);
+    return out;
+};
+const attrs = (el) => {
+    const out = {};
+    for (const a of el.attributes) {
+        out[a.name] = (a.name === 'class' || a.name === 'rel')
+            ? a.value.split(/\\s+/).filter(Boolean) : a.value;
+    }
+    return out;
+};
+return Array.from(table.querySelectorAll('tr'), (tr) => ({
+    attrs: attrs(tr),
+    cells: Array.from(tr.querySelectorAll('td'), (td) => {
+        const a = td.querySelector('a');
+        return {strings: texts(td), link: a ? {strings: texts(a), attrs: attrs(a)} : null};
+    }),
+}));
+"""
+
+def rows_from_json(rows, clean=None):
+    """
+    HtmlRows from TABLE_ROWS_JS output, header row included (same as
+    rows_from_table). ``clean`` is applied to every text string.
+    """
+    clean = clean or str
+    out = []
+    for row in rows:
+        cells = []
+        for cell in row.get("cells", []):
+            link = cell.get("link")
+            if link is not None:
+                link = HtmlLink([clean(s) for s in link.get("strings", [])], link.get("attrs", {}))
+            cells.append(HtmlCell([clean(s) for s in cell.get("strings", [])], link))
+        out.append(HtmlRow(cells, row.get("attrs", {})))
+    return out
@@ -0,0 +1,227 @@
+# -----------------------------
+# SQLITE JOB QUEUE (MULTI-NODE)
+# -----------------------------
+# One scrape_jobs row per horse. Workers (one per node / browser pool) claim
+# batches under a time-limited lease and keep it alive with heartbeats. If a
+# worker dies its leases expire and the remaining workers pick the horses
+# up. Each worker writes its results to its own shard DB; merge_shards()
+# folds the shards back into the main DB afterwards.
+#
+# Job status: 'queued' -> 'leased' -> 'done' | 'failed' (attempts exhausted)
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from special.utils_special import log, DB_PATH
+
+# Next to the main DB; point every node at the same (shared) file
+QUEUE_DB_PATH = str(Path(DB_PATH).with_name("hkjc_scrape_queue.db"))
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+# Jobs inserted per transaction by enqueue_horses()
+ENQUEUE_CHUNK_SIZE = 1000
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _connect():
+    # Autocommit mode so claims can take an explicit BEGIN IMMEDIATE
+    return sqlite3.connect(QUEUE_DB_PATH, timeout=30, isolation_level=None)
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def create_job_queue_table():
+    conn = _connect()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_jobs (
+            HorseID      TEXT PRIMARY KEY,
+            Status       TEXT NOT NULL DEFAULT 'queued',
+            Attempts     INTEGER NOT NULL DEFAULT 0,
+            LeaseOwner   TEXT,
+            LeaseExpires REAL,          -- epoch seconds
+            HeartbeatAt  REAL,
+            Shard        TEXT,          -- where the result was written
+            LastError    TEXT,
+            EnqueuedAt   TEXT,
+            FinishedAt   TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_jobs_claim ON scrape_jobs (Status, LeaseExpires)")
+    conn.close()
+
+def enqueue_horses(horse_ids, requeue=False):
+    """
+    Add horses to the queue. Existing jobs are left alone unless
+    requeue=True, which resets them to 'queued' for a fresh refresh.
+    Returns the number of jobs inserted or reset.
+    """
+    create_job_queue_table()
+    if requeue:
+        sql = """
+            INSERT INTO scrape_jobs (HorseID, Status, Attempts, EnqueuedAt)
+            VALUES (?, 'queued', 0, ?)
+            ON CONFLICT(HorseID) DO UPDATE SET
+                Status = 'queued', Attempts = 0, LeaseOwner = NULL, LeaseExpires = NULL,
+                LastError = NULL, FinishedAt = NULL, EnqueuedAt = excluded.EnqueuedAt
+        """
+    else:
+        sql = "INSERT OR IGNORE INTO scrape_jobs (HorseID, Status, Attempts, EnqueuedAt) VALUES (?, 'queued', 0, ?)"
+
+    # Streamed in chunks, one short transaction each, so a long (or slow,
+    # e.g. stdin) ID source neither sits in memory nor blocks the workers
+    ids = (str(h).strip() for h in horse_ids)
+    ids = (h for h in ids if h)
+    conn = _connect()
+    before = conn.total_changes
+    while True:
+        chunk = [(h, _now()) for h in islice(ids, ENQUEUE_CHUNK_SIZE)]
+        if not chunk:
+            break
+        conn.execute("BEGIN")
+        conn.executemany(sql, chunk)
+        conn.execute("COMMIT")
+    changed = conn.total_changes - before
+    conn.close()
+    log("INFO", f"[QUEUE] Enqueued {changed} horses")
+    return changed
+
+def claim_batch(worker_id, batch_size=5, lease_seconds=DEFAULT_LEASE_SECONDS,
+                max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Atomically lease up to ``batch_size`` horses: queued ones first, then
+    leases that expired without a result. Returns the claimed HorseIDs.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # one claimer at a time
+        # Expired leases with no attempts left are given up, not re-leased
+        conn.execute("""
+            UPDATE scrape_jobs
+            SET Status = 'failed', LeaseOwner = NULL, LeaseExpires = NULL,
+                LastError = COALESCE(LastError, 'Lease expired'), FinishedAt = ?
+            WHERE Status = 'leased' AND LeaseExpires < ? AND Attempts >= ?
+        """, (_now(), now, max_attempts))
+        horse_ids = [row[0] for row in conn.execute("""
+            SELECT HorseID FROM scrape_jobs
+            WHERE Attempts < ?
+              AND (Status = 'queued' OR (Status = 'leased' AND LeaseExpires < ?))
+            ORDER BY Status DESC, Attempts, rowid
+            LIMIT ?
+        """, (max_attempts, now, batch_size))]
+        conn.executemany("""
+            UPDATE scrape_jobs
+            SET Status = 'leased', LeaseOwner = ?, LeaseExpires = ?, HeartbeatAt = ?,
+                Attempts = Attempts + 1
+            WHERE HorseID = ?
+        """, [(worker_id, now + lease_seconds, now, h) for h in horse_ids])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if horse_ids:
+        log("DEBUG", f"[QUEUE] {worker_id} claimed {len(horse_ids)} horses")
+    return horse_ids
+
+def heartbeat(worker_id, horse_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Extend this worker's leases; returns how many are still held."""
+    if not horse_ids:
+        return 0
+    now = time.time()
+    conn = _connect()
+    before = conn.total_changes
+    conn.executemany("""
+        UPDATE scrape_jobs SET LeaseExpires = ?, HeartbeatAt = ?
+        WHERE HorseID = ? AND Status = 'leased' AND LeaseOwner = ?
+    """, [(now + lease_seconds, now, h, worker_id) for h in horse_ids])
+    held = conn.total_changes - before
+    conn.close()
+    return held
+
+def complete_job(worker_id, horse_id, shard=None):
+    conn = _connect()
+    conn.execute("""
+        UPDATE scrape_jobs
+        SET Status = 'done', LeaseOwner = NULL, LeaseExpires = NULL,
+            Shard = ?, LastError = NULL, FinishedAt = ?
+        WHERE HorseID = ? AND LeaseOwner = ?
+    """, (shard, _now(), horse_id, worker_id))
+    conn.close()
+
+def fail_job(worker_id, horse_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Release the lease: back to 'queued' while attempts remain, else 'failed'."""
+    conn = _connect()
+    conn.execute("""
+        UPDATE scrape_jobs
+        SET Status = CASE WHEN Attempts < ? THEN 'queued' ELSE 'failed' END,
+            LeaseOwner = NULL, LeaseExpires = NULL, LastError = ?,
+            FinishedAt = CASE WHEN Attempts < ? THEN NULL ELSE ? END
+        WHERE HorseID = ? AND LeaseOwner = ?
+    """, (max_attempts, str(error)[:500], max_attempts, _now(), horse_id, worker_id))
+    conn.close()
+
+def has_open_jobs(max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """True while some job is queued or leased (possibly by another worker)."""
+    conn = _connect()
+    count = conn.execute("""
+        SELECT COUNT(*) FROM scrape_jobs
+        WHERE Status = 'leased' OR (Status = 'queued' AND Attempts < ?)
+    """, (max_attempts,)).fetchall()[0][0]
+    conn.close()
+    return count > 0
+
+def queue_status():
+    """Return {status: count}."""
+    create_job_queue_table()
+    conn = _connect()
+    rows = conn.execute("SELECT Status, COUNT(*) FROM scrape_jobs GROUP BY Status").fetchall()
+    conn.close()
+    return dict(rows)
+
+class LeaseHeartbeat:
+    """
+    Background thread that keeps the leases of the batch currently being
+    processed alive (every lease_seconds / 3).
+        with LeaseHeartbeat(worker_id) as hb:
+            hb.track(batch)
+    """
+
+    def __init__(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._horse_ids = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def track(self, horse_ids):
+        with self._lock:
+            self._horse_ids = list(horse_ids)
+
+    def _run(self):
+        while not self._stop.wait(max(1.0, self.lease_seconds / 3)):
+            with self._lock:
+                horse_ids = list(self._horse_ids)
+            try:
+                heartbeat(self.worker_id, horse_ids, self.lease_seconds)
+            except Exception as e:
+                log("WARNING", f"[QUEUE] Heartbeat failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
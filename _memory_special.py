@@ -0,0 +1,100 @@
+# -----------------------------
+# MEMORY (RSS) REPORTING
+# -----------------------------
+# With many workers on one box, per-horse memory has to stay flat. The
+# meter here samples the resident set size after every horse and reports
+#   - the process high-water mark (getrusage ru_maxrss) and which horse
+#     raised it most,
+#   - current RSS (/proc/self/statm) and how far it drifted over the run,
+# so a leak (RSS keeps climbing) is told apart from one big page (a single
+# jump in the peak). peak_rss_mb(children=True) gives the largest child
+# process, i.e. the hungriest parse / queue worker once they have exited.
+#
+# ru_maxrss is in KB on Linux and bytes on macOS; Windows has neither
+# source, everything returns None there and nothing is logged.
+
+import os
+import sys
+import threading
+
+from special.utils_special import log
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb(children=False):
+    """High-water RSS of this process (or of its largest reaped child), in MB."""
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def current_rss_mb():
+    """Current RSS in MB (Linux only, None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+class MemoryMeter:
+    """Thread-safe per-horse RSS samples for one process."""
+
+    def __init__(self, name):
+        self.name = name
+        self.horses = 0
+        self.start_rss = current_rss_mb()
+        self.last_rss = self.start_rss
+        self.last_peak = peak_rss_mb()
+        self.max_peak_rise = 0.0
+        self.max_peak_horse = None
+        self._lock = threading.Lock()
+
+    def sample(self, horse_id):
+        """Record RSS after ``horse_id``; call once per horse, success or not."""
+        rss = current_rss_mb()
+        peak = peak_rss_mb()
+        with self._lock:
+            self.horses += 1
+            growth = rss - self.last_rss if rss is not None and self.last_rss is not None else None
+            rise = peak - self.last_peak if peak is not None and self.last_peak is not None else 0.0
+            if rise > self.max_peak_rise:
+                self.max_peak_rise = rise
+                self.max_peak_horse = horse_id
+            self.last_rss = rss
+            self.last_peak = peak
+        if peak is not None:
+            log("DEBUG", f"[MEMORY] {horse_id}: peak {peak:.1f} MB (+{rise:.1f})"
+                         + (f", rss {rss:.1f} MB ({growth:+.1f})" if growth is not None else ""))
+
+    def summary(self):
+        with self._lock:
+            return {
+                "horses": self.horses,
+                "peak_mb": peak_rss_mb(),
+                "start_mb": self.start_rss,
+                "rss_mb": self.last_rss,
+                "max_peak_rise_mb": self.max_peak_rise,
+                "max_peak_horse": self.max_peak_horse,
+            }
+
+    def log_summary(self):
+        s = self.summary()
+        if not s["horses"] or s["peak_mb"] is None:
+            return
+        line = f"[MEMORY] {self.name}: {s['horses']} horses, peak RSS {s['peak_mb']:.1f} MB"
+        if s["rss_mb"] is not None and s["start_mb"] is not None:
+            line += f", RSS {s['start_mb']:.1f} -> {s['rss_mb']:.1f} MB"
+        if s["max_peak_horse"]:
+            line += f", largest per-horse rise {s['max_peak_rise_mb']:.1f} MB ({s['max_peak_horse']})"
+        log("INFO", line)
+
+def log_child_peak(label):
+    """Log the largest peak RSS among exited child processes (e.g. parse workers)."""
+    peak = peak_rss_mb(children=True)
+    if peak:
+        log("INFO", f"[MEMORY] {label}: largest peak RSS {peak:.1f} MB")
@@ -0,0 +1,172 @@
+# -----------------------------
+# STAGED FETCH -> PARSE -> WRITE PIPELINE
+# -----------------------------
+# Fetching is I/O bound (browser), parsing + aggregation is CPU bound
+# (BeautifulSoup, build_*), writing must stay single-threaded (SQLite).
+#
+#   fetch threads --(bounded queue)--> process pool --(results)--> writer
+#
+# The parse stage runs in a ProcessPoolExecutor, so it scales past the GIL;
+# its function and results must be picklable (top-level function, plain
+# dicts/lists/HtmlRow, no defaultdict(lambda)). Backpressure: the fetched
+# queue is bounded and at most ``max_in_flight`` pages are being parsed or
+# waiting for the writer, so a slow writer stalls parsing, which stalls
+# fetching, and memory stays flat.
+
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from special.utils_special import log
+
+_DONE = object()
+
+def default_parse_workers():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def _next_item(items, items_lock, source):
+    # The items generator journals / reads input, so it can raise; the first
+    # error stops every fetcher and run_pipeline() re-raises it at the end
+    with items_lock:
+        if source["error"] is not None:
+            return _DONE
+        try:
+            return next(items, _DONE)
+        except Exception as e:
+            log("ERROR", f"[PIPELINE] Work items failed: {type(e).__name__}: {e}")
+            source["error"] = e
+            return _DONE
+
+def _fetch_loop(items, items_lock, source, make_fetcher, fetched_q):
+    fetcher = start_error = None
+    try:
+        try:
+            fetcher = make_fetcher()
+        except Exception as e:
+            # Fail what this thread takes rather than leave it unfetched
+            log("ERROR", f"[PIPELINE] Fetcher start failed: {e}")
+            start_error = e
+        while True:
+            item = _next_item(items, items_lock, source)
+            if item is _DONE:
+                break
+            if start_error is not None:
+                fetched_q.put((item, None, start_error))
+                continue
+            try:
+                fetched_q.put((item, fetcher(item), None))
+            except Exception as e:
+                fetched_q.put((item, None, e))
+    finally:
+        close = getattr(fetcher, "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                log("DEBUG", f"[PIPELINE] Fetcher close failed: {e}")
+        fetched_q.put(_DONE)
+
+def run_pipeline(items, make_fetcher, parse, on_result, on_error,
+                 fetch_workers=2, parse_workers=None, queue_size=32, max_in_flight=None):
+    """
+    Run every item through fetch -> parse -> write.
+
+    make_fetcher() is called once per fetch thread and returns a callable
+    ``fetch(item) -> payload`` (optionally with a close() method, e.g. to quit
+    its browser). ``parse(item, payload)`` runs in a worker process.
+    on_result(item, result) / on_error(item, exc) run on the calling thread,
+    which is the only writer. Returns (ok, failed) counts. If iterating
+    ``items`` raises, fetching stops, what was already fetched is finished
+    and that exception is re-raised.
+    """
+    parse_workers = parse_workers or default_parse_workers()
+    max_in_flight = max_in_flight or parse_workers * 2
+
+    items = iter(items)
+    items_lock = threading.Lock()
+    source = {"error": None}  # first exception raised by ``items``
+    fetched_q = queue.Queue(maxsize=queue_size)
+    results_q = queue.Queue()
+    slots = threading.BoundedSemaphore(max_in_flight)
+
+    fetchers = [
+        threading.Thread(target=_fetch_loop, args=(items, items_lock, source, make_fetcher, fetched_q),
+                         name=f"fetch-{i}", daemon=True)
+        for i in range(fetch_workers)
+    ]
+
+    def _forward(item, future):
+        try:
+            results_q.put((item, future.result(), None))
+        except Exception as e:
+            results_q.put((item, None, e))
+
+    def _dispatch(pool):
+        finished = 0
+        futures = []
+        try:
+            while finished < len(fetchers):
+                entry = fetched_q.get()
+                if entry is _DONE:
+                    finished += 1
+                    continue
+                item, payload, error = entry
+                slots.acquire()  # released by the writer
+                if error is None:
+                    try:
+                        future = pool.submit(parse, item, payload)
+                    except Exception as e:
+                        error = e  # e.g. BrokenProcessPool after a worker died
+                if error is not None:
+                    results_q.put((item, None, error))
+                    continue
+                future.add_done_callback(lambda f, item=item: _forward(item, f))
+                futures.append(future)
+                futures = [f for f in futures if not f.done()]
+            for future in futures:
+                try:
+                    future.exception()  # wait; the callback already forwarded it
+                except Exception:
+                    pass  # cancelled; forwarded as well
+        finally:
+            # The writer loop only ends on this
+            results_q.put(_DONE)
+
+    log("INFO", f"[PIPELINE] fetch_workers={fetch_workers} parse_workers={parse_workers} "
+                f"queue_size={queue_size} max_in_flight={max_in_flight}")
+
+    ok = failed = 0
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        dispatcher = threading.Thread(target=_dispatch, args=(pool,), name="dispatch", daemon=True)
+        for t in fetchers:
+            t.start()
+        dispatcher.start()
+
+        while True:
+            entry = results_q.get()
+            if entry is _DONE:
+                break
+            item, result, error = entry
+            if error is None:
+                try:
+                    on_result(item, result)
+                    ok += 1
+                except Exception as e:
+                    error = e
+            if error is not None:
+                try:
+                    on_error(item, error)
+                except Exception as e:
+                    log("ERROR", f"[PIPELINE] Error handler failed for {item}: {e}")
+                failed += 1
+            slots.release()
+
+        dispatcher.join()
+        for t in fetchers:
+            t.join()
+
+    if source["error"] is not None:
+        # Items after the failure were never started; the run is not done
+        raise source["error"]
+    return ok, failed
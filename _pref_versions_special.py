@@ -0,0 +1,187 @@
+# -----------------------------
+# VERSIONED (BITEMPORAL) PREFERENCE ROWS
+# -----------------------------
+# The preference upserts overwrite rows in place (INSERT OR REPLACE /
+# ON CONFLICT DO UPDATE). Each table gets an append-only "<table>_versions"
+# companion, kept up to date by AFTER INSERT/UPDATE/DELETE triggers, so
+# every upsert path is covered without touching the upsert functions.
+# A version is valid for ValidFrom <= t < ValidTo (ValidTo NULL = current).
+
+import sqlite3
+from datetime import datetime
+
+from special.utils_special import log
+import _horse_dynamic_stats_special as stats
+
+# Table -> natural key (its primary key)
+PREF_TABLE_KEYS = {
+    "horse_distance_pref": ("HorseID", "Season", "DistanceGroup"),
+    "horse_going_pref": ("HorseID", "Season", "GoingType"),
+    "horse_course_pref": ("HorseID", "Season", "RaceCourse", "CourseType"),
+    "horse_jockey_combo": ("HorseID", "Season", "Jockey"),
+    "horse_trainer_combo": ("HorseID", "Season", "Trainer"),
+    "horse_jockey_trainer_combo": ("HorseID", "Season", "Jockey", "Trainer"),
+    "horse_draw_pref": ("HorseID", "Season", "RaceCourse", "DistanceGroup", "DrawGroup"),
+    "horse_weight_pref": ("HorseID", "Season", "DistanceGroup", "WeightGroup"),
+    "horse_bwr_distance_pref": ("HorseID", "Season", "Distance", "BWRGroup"),
+    "horse_hwtr_trend": ("HorseID", "Season", "Class", "HWTRGroup"),
+    "horse_class_jump_pref": ("HorseID", "Season", "JumpType"),
+    "horse_running_style_pref": (
+        "HorseID", "Season", "RaceCourse", "CourseType",
+        "DistanceGroup", "TurnCount", "StyleBucket"),
+}
+
+# Columns that change on every upsert and must not split a version
+VOLATILE_COLUMNS = {"ID", "LastUpdate"}
+
+# Millisecond local time, same clock as the LastUpdate stamps
+_NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def _key_match(key_cols, ref):
+    # IS instead of = so NULL key parts still match
+    return " AND ".join(f"{c} IS {ref}.{c}" for c in key_cols)
+
+def enable_pref_versioning(tables=None):
+    """
+    Create the *_versions tables, their indexes and the triggers that feed
+    them. Safe to call on every start: triggers are recreated so columns added
+    later by ensure_column_exists() are picked up.
+    """
+    conn = sqlite3.connect(stats.DB_PATH)
+    cur = conn.cursor()
+    enabled = []
+
+    for table in tables or PREF_TABLE_KEYS:
+        key_cols = PREF_TABLE_KEYS[table]
+        columns = _table_columns(cur, table)
+        if not columns:
+            log("DEBUG", f"[VERSIONS] {table} does not exist yet, skipping")
+            continue
+
+        versions = f"{table}_versions"
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {versions} (
+                VersionID INTEGER PRIMARY KEY AUTOINCREMENT,
+                ValidFrom TEXT NOT NULL,
+                ValidTo   TEXT
+            )
+        """)
+        existing = set(_table_columns(cur, versions))
+        for col in columns:
+            if col not in existing:
+                cur.execute(f"ALTER TABLE {versions} ADD COLUMN {col}")
+
+        # Point lookups by horse/key and "as of" range scans
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{versions}_asof "
+                    f"ON {versions} (HorseID, ValidFrom, ValidTo)")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{versions}_open "
+                    f"ON {versions} ({', '.join(key_cols)}) WHERE ValidTo IS NULL")
+
+        col_list = ", ".join(columns)
+        new_values = ", ".join(f"NEW.{c}" for c in columns)
+        close_sql = (f"UPDATE {versions} SET ValidTo = {_NOW_SQL} "
+                     f"WHERE ValidTo IS NULL AND {{match}};")
+        append_sql = (f"INSERT INTO {versions} ({col_list}, ValidFrom) "
+                      f"VALUES ({new_values}, {_NOW_SQL});")
+
+        for event, ref, body in (
+            ("INSERT", "NEW", close_sql + append_sql),
+            ("UPDATE", "OLD", close_sql + append_sql),
+            ("DELETE", "OLD", close_sql),
+        ):
+            trigger = f"trg_{table}_version_{event.lower()}"
+            cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cur.execute(f"""
+                CREATE TRIGGER {trigger} AFTER {event} ON {table}
+                BEGIN
+                    {body.format(match=_key_match(key_cols, ref))}
+                END
+            """)
+        enabled.append(table)
+
+    conn.commit()
+    conn.close()
+    log("INFO", f"[VERSIONS] Versioning enabled for {len(enabled)} preference tables")
+    return enabled
+
+def _format_ts(as_of):
+    if isinstance(as_of, datetime):
+        return as_of.strftime(_TS_FORMAT)[:-3]
+    return str(as_of)
+
+def fetch_pref_as_of(table, horse_id, as_of):
+    """
+    Return (columns, rows) for a horse's rows in ``table`` as they were at
+    ``as_of`` (datetime or 'YYYY-MM-DD HH:MM[:SS[.fff]]' string).
+    """
+    conn = sqlite3.connect(stats.DB_PATH)
+    cur = conn.cursor()
+    columns = _table_columns(cur, table)
+    ts = _format_ts(as_of)
+    cur.execute(f"""
+        SELECT {', '.join(columns)}
+        FROM {table}_versions
+        WHERE HorseID = ?
+          AND ValidFrom <= ?
+          AND (ValidTo IS NULL OR ValidTo > ?)
+        ORDER BY {', '.join(PREF_TABLE_KEYS[table])}
+    """, (horse_id, ts, ts))
+    rows = cur.fetchall()
+    conn.close()
+    return columns, rows
+
+def compact_pref_versions(tables=None):
+    """
+    Merge consecutive versions of the same key whose values are identical
+    (ignoring LastUpdate), so repeated re-scrapes of unchanged stats do not
+    grow the history. Returns the number of versions removed.
+    """
+    conn = sqlite3.connect(stats.DB_PATH)
+    cur = conn.cursor()
+    removed = 0
+
+    for table in tables or PREF_TABLE_KEYS:
+        versions = f"{table}_versions"
+        columns = _table_columns(cur, versions)
+        if not columns:
+            continue
+        key_cols = PREF_TABLE_KEYS[table]
+        value_cols = [c for c in _table_columns(cur, table)
+                      if c not in key_cols and c not in VOLATILE_COLUMNS]
+        nk, nv = len(key_cols), len(value_cols)
+
+        rows = cur.execute(f"""
+            SELECT {', '.join(key_cols + tuple(value_cols))}, VersionID, ValidFrom, ValidTo
+            FROM {versions}
+            ORDER BY {', '.join(key_cols)}, ValidFrom, VersionID
+        """)
+
+        extend, delete = [], []
+        head = None  # [key, values, VersionID, ValidTo, merged]
+        for row in rows:
+            key, values = row[:nk], row[nk:nk + nv]
+            version_id, valid_from, valid_to = row[nk + nv:]
+            if head and head[0] == key and head[1] == values and head[3] == valid_from:
+                head[3] = valid_to
+                head[4] = True
+                delete.append((version_id,))
+                continue
+            if head and head[4]:
+                extend.append((head[3], head[2]))
+            head = [key, values, version_id, valid_to, False]
+        if head and head[4]:
+            extend.append((head[3], head[2]))
+
+        cur.executemany(f"DELETE FROM {versions} WHERE VersionID = ?", delete)
+        cur.executemany(f"UPDATE {versions} SET ValidTo = ? WHERE VersionID = ?", extend)
+        removed += len(delete)
+
+    conn.commit()
+    conn.close()
+    log("INFO", f"[VERSIONS] Compaction merged {removed} duplicate versions")
+    return removed
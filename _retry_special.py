@@ -0,0 +1,81 @@
+# -----------------------------
+# CLASSIFIED RETRIES
+# -----------------------------
+# Transient faults (browser/page timeouts, connection resets, a race table
+# that has not rendered yet) are retried in place with exponential backoff
+# and full jitter; anything else is permanent and fails straight away so it
+# can be dead-lettered with its reason and HTML snapshot.
+
+import random
+import time
+
+from special.utils_special import log
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 2.0   # seconds
+BACKOFF_CAP = 60.0
+
+# Matched by exact class name so selenium / requests need not be importable
+# here. Every selenium error subclasses WebDriverException, so that base
+# class is not listed: NoSuchElementException, InvalidArgumentException
+# etc. are permanent, and a bare WebDriverException is only retried when
+# its message says the connection or browser went away.
+_TRANSIENT_TYPES = {
+    "HorseTimeout", "TimeoutException", "StaleElementReferenceException",
+    "Timeout", "ReadTimeout", "ConnectTimeout", "ChunkedEncodingError", "ProtocolError",
+    "MissingTableError",
+}
+_TRANSIENT_MESSAGES = ("connection reset", "connection aborted", "connection refused",
+                       "net::err_", "timed out", "disconnected")
+
+class PageError(Exception):
+    """A failure that carries the page that caused it (picklable)."""
+
+    def __init__(self, message, page_source=None):
+        super().__init__(message, page_source)
+        self.message = message
+        self.page_source = page_source
+
+    def __str__(self):
+        return str(self.message)
+
+class MissingTableError(PageError):
+    """The race history table is not in the rendered page (yet)."""
+
+def classify_error(exc):
+    """Return TRANSIENT or PERMANENT for an exception."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if type(exc).__name__ in _TRANSIENT_TYPES:
+        return TRANSIENT
+    message = str(exc).lower()
+    if any(m in message for m in _TRANSIENT_MESSAGES):
+        return TRANSIENT
+    return PERMANENT
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full jitter: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def retry_call(fn, attempts=DEFAULT_RETRIES, base=BACKOFF_BASE, cap=BACKOFF_CAP,
+               label="call", on_retry=None, sleep=time.sleep):
+    """
+    Call fn() up to ``attempts`` times, retrying transient errors after a
+    jittered backoff. on_retry(exc) runs before each retry (e.g. to restart
+    a dead browser). The last error, or any permanent one, is raised.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1 or classify_error(e) != TRANSIENT:
+                raise
+            delay = backoff_delay(attempt, base, cap)
+            log("WARNING", f"[RETRY] {label}: {type(e).__name__}: {e} "
+                           f"(attempt {attempt + 1}/{attempts}, retrying in {delay:.1f}s)")
+            if on_retry:
+                on_retry(e)
+            sleep(delay)
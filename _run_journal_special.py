@@ -0,0 +1,200 @@
+# -----------------------------
+# RUN JOURNAL (CHECKPOINT / RESUME)
+# -----------------------------
+# Durable per-horse progress for long batch runs. Every status change is
+# committed immediately, so after a crash (Chrome, power, Ctrl-C) a resumed
+# run skips finished horses and only pays for the remaining work.
+#
+# Item status: 'pending' (registered or in flight), 'done', 'failed'.
+
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+from special.utils_special import log
+import _horse_dynamic_stats_special as stats
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def create_run_journal_tables():
+    conn = sqlite3.connect(stats.DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS run_journal (
+            RunID      TEXT PRIMARY KEY,
+            InputPath  TEXT,
+            InputHash  TEXT,
+            Status     TEXT,       -- 'running' / 'finished'
+            StartedAt  TEXT,
+            FinishedAt TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS run_journal_items (
+            RunID     TEXT,
+            HorseID   TEXT,
+            Position  INTEGER,
+            Status    TEXT,        -- 'pending' / 'done' / 'failed'
+            Attempts  INTEGER DEFAULT 0,
+            Reason    TEXT,
+            UpdatedAt TEXT,
+            PRIMARY KEY (RunID, HorseID)
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def input_fingerprint(input_path):
+    """
+    Hash identifying an input for --resume: the file contents, or the spec
+    itself for query sources such as "recent:30". None for stdin ("-").
+    """
+    if not input_path or input_path == "-":
+        return None
+    if os.path.isfile(input_path):
+        return file_sha256(input_path)
+    return hashlib.sha256(input_path.encode("utf-8")).hexdigest()
+
+def start_run(input_path, resume=False):
+    """
+    Return the RunID to journal against. With resume=True the latest
+    unfinished run over an identical input file is continued; otherwise (or
+    if there is none) a new run is opened.
+    """
+    create_run_journal_tables()
+    input_hash = input_fingerprint(input_path)
+
+    conn = sqlite3.connect(stats.DB_PATH)
+    cursor = conn.cursor()
+    if resume:
+        cursor.execute("""
+            SELECT RunID FROM run_journal
+            WHERE InputHash IS ? AND Status = 'running'
+            ORDER BY StartedAt DESC LIMIT 1
+        """, (input_hash,))
+        row = cursor.fetchone()
+        if row:
+            conn.close()
+            log("INFO", f"[JOURNAL] Resuming run {row[0]}")
+            return row[0]
+        log("INFO", "[JOURNAL] Nothing to resume for this input, starting a new run")
+
+    run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{(input_hash or 'adhoc')[:8]}"
+    cursor.execute("""
+        INSERT INTO run_journal (RunID, InputPath, InputHash, Status, StartedAt)
+        VALUES (?, ?, ?, 'running', ?)
+    """, (run_id, input_path, input_hash, _now()))
+    conn.commit()
+    conn.close()
+    log("INFO", f"[JOURNAL] Started run {run_id}")
+    return run_id
+
+def iter_unfinished(run_id, horse_ids, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Yield, in input order, the horses of ``horse_ids`` that still need work:
+    never seen, or pending/failed with attempts to spare (a horse that keeps
+    crashing the run mid-way also runs out of attempts).
+    New IDs are registered as they are reached, so any iterable works.
+    """
+    conn = sqlite3.connect(stats.DB_PATH)
+    known = {
+        hid: (status, attempts)
+        for hid, status, attempts in conn.execute(
+            "SELECT HorseID, Status, Attempts FROM run_journal_items WHERE RunID = ?", (run_id,))
+    }
+    position = conn.execute(
+        "SELECT COALESCE(MAX(Position), 0) FROM run_journal_items WHERE RunID = ?", (run_id,)
+    ).fetchall()[0][0]
+    conn.close()
+
+    skipped = 0
+    for horse_id in horse_ids:
+        status, attempts = known.get(horse_id, (None, 0))
+        if status == "done" or attempts >= max_attempts:
+            skipped += 1
+            continue
+        if status is None:
+            position += 1
+            conn = sqlite3.connect(stats.DB_PATH)
+            conn.execute("""
+                INSERT OR IGNORE INTO run_journal_items
+                (RunID, HorseID, Position, Status, Attempts, UpdatedAt)
+                VALUES (?, ?, ?, 'pending', 0, ?)
+            """, (run_id, horse_id, position, _now()))
+            conn.commit()
+            conn.close()
+            known[horse_id] = ("pending", 0)
+        yield horse_id
+
+    if skipped:
+        log("INFO", f"[JOURNAL] Skipped {skipped} horses already finished in run {run_id}")
+
+def has_unfinished(run_id, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """True while some horse is not done and still has attempts to spare."""
+    conn = sqlite3.connect(stats.DB_PATH)
+    count = conn.execute("""
+        SELECT COUNT(*) FROM run_journal_items
+        WHERE RunID = ?
+          AND Status != 'done' AND Attempts < ?
+    """, (run_id, max_attempts)).fetchall()[0][0]
+    conn.close()
+    return count > 0
+
+def _set_status(run_id, horse_id, status, reason=None, attempt=False):
+    conn = sqlite3.connect(stats.DB_PATH)
+    conn.execute(f"""
+        UPDATE run_journal_items
+        SET Status = ?, Reason = ?, UpdatedAt = ?
+            {', Attempts = Attempts + 1' if attempt else ''}
+        WHERE RunID = ? AND HorseID = ?
+    """, (status, reason, _now(), run_id, horse_id))
+    conn.commit()
+    conn.close()
+
+def mark_started(run_id, horse_id):
+    """Count an attempt before work starts, so a crash mid-horse still counts."""
+    _set_status(run_id, horse_id, "pending", attempt=True)
+
+def mark_done(run_id, horse_id):
+    _set_status(run_id, horse_id, "done")
+
+def mark_failed(run_id, horse_id, reason):
+    _set_status(run_id, horse_id, "failed", reason=str(reason)[:500])
+
+def finish_run(run_id):
+    conn = sqlite3.connect(stats.DB_PATH)
+    conn.execute("UPDATE run_journal SET Status = 'finished', FinishedAt = ? WHERE RunID = ?",
+                 (_now(), run_id))
+    conn.commit()
+    conn.close()
+
+def run_summary(run_id):
+    """Return {status: count} for a run."""
+    conn = sqlite3.connect(stats.DB_PATH)
+    rows = conn.execute(
+        "SELECT Status, COUNT(*) FROM run_journal_items WHERE RunID = ? GROUP BY Status", (run_id,)
+    ).fetchall()
+    conn.close()
+    return dict(rows)
+
+def latest_run():
+    """(RunID, InputPath, Status, StartedAt, FinishedAt) of the newest run, or None."""
+    create_run_journal_tables()
+    conn = sqlite3.connect(stats.DB_PATH)
+    row = conn.execute("""
+        SELECT RunID, InputPath, Status, StartedAt, FinishedAt
+        FROM run_journal ORDER BY StartedAt DESC LIMIT 1
+    """).fetchone()
+    conn.close()
+    return row
@@ -0,0 +1,241 @@
+# -----------------------------
+# PER-STAGE RUN METRICS
+# -----------------------------
+# Where does a slow batch spend its time? Every horse gets a HorseTimer and
+# each stage - limiter wait, browser start, page load, retry backoff, parse,
+# every builder/upsert step of persist_horse_data(), field-size lookups -
+# adds its perf_counter() seconds to it. Blocks are timed with
+#   with timer.stage("page_load"): ...
+# or, for a straight run of steps, with lap(): each lap is the time since
+# the previous lap (or mark()), so no re-indenting of long blocks.
+#
+# Finished horses are written to run_metrics (one row per horse and stage,
+# buffered, a few per batch of horses) and summarised at the end of a run:
+# p50/p95/max per stage, horses per minute and the slowest horses.
+# Overhead is two perf_counter() calls and a dict update per stage, i.e.
+# microseconds against seconds of page load per horse.
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from special.utils_special import log
+import _horse_dynamic_stats_special as stats
+
+# Finished horses buffered before one INSERT batch
+FLUSH_EVERY = 20
+
+def create_run_metrics_table():
+    conn = sqlite3.connect(stats.DB_PATH)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            RunID      TEXT,
+            HorseID    TEXT,
+            Stage      TEXT,      -- 'total' = the whole horse
+            Seconds    REAL,
+            Status     TEXT,      -- done / failed / timeout
+            RecordedAt TEXT,
+            PRIMARY KEY (RunID, HorseID, Stage)
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+class _Stage:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        return False
+
+class HorseTimer:
+    """Seconds per stage for one horse; repeated stages (retries) add up."""
+
+    __slots__ = ("horse_id", "stages", "started", "_mark")
+
+    def __init__(self, horse_id):
+        self.horse_id = horse_id
+        self.stages = {}
+        self.started = time.perf_counter()
+        self._mark = self.started
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, stages):
+        """Add stages timed elsewhere (e.g. in a parse worker process)."""
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def mark(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.add(name, now - self._mark)
+        self._mark = now
+
+class _NullTimer:
+    """Stands in when nothing is being measured."""
+
+    __slots__ = ()
+
+    def add(self, name, seconds):
+        pass
+
+    def merge(self, stages):
+        pass
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def mark(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = _NullTimer()
+_NULL_STAGE = _NullStage()
+
+def _percentile(ordered, q):
+    # Nearest rank, as _aimd_special._p95()
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+class RunMetrics:
+    """Per-horse timers of one run; thread-safe (fetch threads + writer)."""
+
+    def __init__(self):
+        self.run_id = None
+        self.started = None
+        self._timers = {}
+        self._finished = []  # (horse_id, status, total, stages)
+        self._pending = []
+        self._pending_horses = 0
+        self._lock = threading.Lock()
+
+    def start(self, run_id):
+        """Begin a run (clears what an earlier run in this process recorded)."""
+        self.flush()
+        create_run_metrics_table()
+        with self._lock:
+            self.run_id = run_id
+            self.started = time.perf_counter()
+            self._timers = {}
+            self._finished = []
+
+    def timer(self, horse_id):
+        """The horse's timer, started on first use."""
+        with self._lock:
+            timer = self._timers.get(horse_id)
+            if timer is None:
+                timer = self._timers[horse_id] = HorseTimer(horse_id)
+            return timer
+
+    def finish(self, horse_id, status):
+        with self._lock:
+            timer = self._timers.pop(horse_id, None)
+            if timer is None:
+                return
+            total = time.perf_counter() - timer.started
+            self._finished.append((horse_id, status, total, dict(timer.stages)))
+            if self.run_id is None:
+                return
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._pending.extend((self.run_id, horse_id, stage, round(seconds, 4), status, now)
+                                 for stage, seconds in [("total", total), *timer.stages.items()])
+            self._pending_horses += 1
+            flush = self._pending_horses >= FLUSH_EVERY
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._pending_horses = 0
+        if not rows:
+            return
+        try:
+            conn = sqlite3.connect(stats.DB_PATH)
+            conn.executemany("""
+                INSERT OR REPLACE INTO run_metrics (RunID, HorseID, Stage, Seconds, Status, RecordedAt)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log("WARNING", f"[METRICS] Could not store {len(rows)} timings: {e}")
+
+    def summary(self, slowest=5):
+        """
+        {"horses", "minutes", "horses_per_min",
+         "stages": {stage: {"n", "p50", "p95", "max", "total"}},
+         "slowest": [(horse_id, status, total, top stage, its seconds)]}
+        """
+        with self._lock:
+            finished = list(self._finished)
+            elapsed = time.perf_counter() - self.started if self.started else 0.0
+        per_stage = {}
+        for _, _, total, stages in finished:
+            per_stage.setdefault("total", []).append(total)
+            for name, seconds in stages.items():
+                per_stage.setdefault(name, []).append(seconds)
+        table = {}
+        for name, values in per_stage.items():
+            values.sort()
+            table[name] = {
+                "n": len(values),
+                "p50": _percentile(values, 0.50),
+                "p95": _percentile(values, 0.95),
+                "max": values[-1],
+                "total": sum(values),
+            }
+        worst = []
+        for horse_id, status, total, stages in sorted(finished, key=lambda f: f[2], reverse=True)[:slowest]:
+            top = max(stages.items(), key=lambda kv: kv[1], default=(None, 0.0))
+            worst.append((horse_id, status, total, *top))
+        minutes = elapsed / 60
+        return {
+            "horses": len(finished),
+            "minutes": minutes,
+            "horses_per_min": len(finished) / minutes if minutes else None,
+            "stages": table,
+            "slowest": worst,
+        }
+
+    def log_summary(self, slowest=5):
+        self.flush()
+        s = self.summary(slowest)
+        if not s["horses"]:
+            return
+        log("INFO", f"[METRICS] {s['horses']} horses in {s['minutes']:.1f} min "
+                    f"({s['horses_per_min']:.1f} horses/min)")
+        log("INFO", f"[METRICS] {'stage':<20} {'n':>5} {'p50':>8} {'p95':>8} {'max':>8} {'sum':>9}")
+        # Whole-horse row, then the biggest share of the run first
+        for name, m in sorted(s["stages"].items(), key=lambda kv: (kv[0] != "total", -kv[1]["total"])):
+            log("INFO", f"[METRICS] {name:<20} {m['n']:>5} {m['p50']:>7.2f}s {m['p95']:>7.2f}s "
+                        f"{m['max']:>7.2f}s {m['total']:>8.1f}s")
+        for horse_id, status, total, stage, seconds in s["slowest"]:
+            log("INFO", f"[METRICS] slow: {horse_id} {total:.1f}s ({status})"
+                        + (f", mostly {stage} {seconds:.1f}s" if stage else ""))
@@ -1,35 +1,90 @@
 # -----------------------------
 # IMPORTS + UTILS_special
 # -----------------------------
+import os
 import sys
+import threading
 
 import time
 import re
+import json
 from datetime import datetime
 from special.utils_special import parse_hkjc_date
 
 from special.utils_special import (
-    log, sanitize_text, clean_placing, convert_finish_time,
+    log, sanitize_text, convert_finish_time,
     get_distance_group, get_turn_count, get_draw_group,
-    get_jump_type, get_distance_group_from_row, get_season_code
+    get_jump_type, get_distance_group_from_row, get_season_code, get_logger,
+    set_json_log,
 )
 
 
 import sqlite3
 
 from collections import defaultdict
-import pandas as pd
-from bs4 import BeautifulSoup, UnicodeDammit
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-import requests
+from functools import cached_property
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+# selenium and requests are imported by the functions that use them,
+# so status / rebuild / export commands start without loading them
 
 # ===== DEBUGGING CONTROL =====
 DEBUG_LEVEL = "INFO"  # "OFF", "INFO", "DEBUG", "TRACE"
 
+# Level-gated logger for per-row messages (formats only when enabled)
+logger = get_logger(__name__)
+
 CHROME_DRIVER_PATH = './chromedriver'
 
-from _horse_dynamic_stats_cleaned import (
+# ===== WATCHDOG LIMITS (seconds) =====
+PAGE_LOAD_TIMEOUT = 30      # driver.get()
+SCRIPT_TIMEOUT = 15         # execute_script()
+HORSE_BUDGET_SECONDS = 90   # wall clock per horse: browser start + fetch + parse
+
+# ===== BROWSER PROFILE =====
+BLOCK_RESOURCES = True        # images, css, fonts, media and trackers are never downloaded
+PAGE_LOAD_STRATEGY = "eager"  # driver.get() returns at DOMContentLoaded ...
+RENDER_WAIT_SECONDS = 5       # ... then wait at most this long for the race table
+RACE_TABLE_SELECTOR = "table.f_tac.f_fs12, table.bigborder"
+
+# ===== PAGE EXTRACTION =====
+EXTRACT_MODE = "table"  # "table": race table as JSON built in the page; "dom": whole outerHTML
+
+from _pref_versions_special import enable_pref_versioning, compact_pref_versions
+from _html_rows_special import rows_from_json, strip_non_ascii, TABLE_ROWS_JS, RACE_TABLE_SELECTORS
+import _html_parser_special as html_parser
+from _html_parser_special import find_table_rows, decode_html
+from _watchdog_special import HorseTimeout, call_with_budget, close_driver, reap_orphaned_browsers
+from _pipeline_special import run_pipeline
+from _horse_ids_special import HorseIdStream
+from _memory_special import MemoryMeter, log_child_peak
+from _run_metrics_special import RunMetrics, NULL_TIMER
+from _sql_profile_special import register_read_query, profiling
+from _browser_special import (
+    configure_options, blocked_url_patterns, apply_request_blocking,
+    wait_for_selector, page_cost, PageCostMeter, compare_profiles,
+)
+from _aimd_special import AimdLimiter, THROTTLE, classify_http_status, limiter_metrics
+from _retry_special import DEFAULT_RETRIES, PageError, MissingTableError, backoff_delay, retry_call
+from _dead_letters_special import (
+    create_dead_letters_table, record_dead_letter, clear_dead_letter,
+    list_dead_letters, export_dead_letters,
+)
+import _job_queue_special as job_queue
+from _shards_special import use_shard, shard_path_for, init_shard_schema, merge_shards
+from _run_journal_special import (
+    DEFAULT_MAX_ATTEMPTS, start_run, iter_unfinished, has_unfinished,
+    mark_started, mark_done, mark_failed, finish_run, run_summary,
+)
+
+# ===== ADAPTIVE CONCURRENCY (AIMD) =====
+# Limits grow while p95 latency / error rate stay under target and halve on
+# timeouts, HTTP 429/5xx or pages without a race table.
+HORSE_PAGE_LIMITER = AimdLimiter("horse_pages", initial=2, max_limit=8, target_p95=10.0)
+LOCAL_RESULTS_LIMITER = AimdLimiter("local_results", initial=2, max_limit=8, target_p95=3.0)
+
+import _horse_dynamic_stats_special as stats
+from _horse_dynamic_stats_special import (
     build_exact_distance_pref,
     convert_finish_time,
     upsert_running_position,
@@ -42,6 +97,7 @@ from _horse_dynamic_stats_cleaned import (
     upsert_bwr_distance_perf,
     create_bwr_distance_perf_table,
     ensure_column_exists,
+    build_horse_jockey_combo,
     upsert_horse_jockey_combo,
     create_trainer_combo_table,
     upsert_trainer_combo,
@@ -57,18 +113,70 @@ from _horse_dynamic_stats_cleaned import (
     upsert_hwtr_trend,
     build_class_jump_pref,
     upsert_class_jump_pref,
-    create_class_jump_pref_table,
-    rebuild_running_style_pref,
+    rebuild_running_style_pref_sql,
     create_horse_rating_table,
     upsert_horse_rating,
     create_running_style_pref_table,
     migrate_turncount_to_real,
-    create_race_field_size_table
+    create_race_field_size_table,
+    create_race_history_table,
+    build_race_history,
+    upsert_race_history,
 )
 
 # -----------------------------
 # DYNAMIC STATS UPSERT (LOCAL)
 # -----------------------------
+_FIELD_SIZE_SQL = register_read_query(
+    "race_field_size",
+    "SELECT FieldSize FROM race_field_size WHERE RaceDate=? AND RaceNo=? AND RaceCourse=?",
+    ("2024/06/01", "1", "ST"),
+)
+
+def _cached_field_size(race_date_str, race_no, race_course):
+    try:
+        conn = sqlite3.connect(stats.DB_PATH)
+        cur = conn.cursor()
+        cur.execute(_FIELD_SIZE_SQL, (race_date_str, str(race_no), race_course))
+        row = cur.fetchone()
+        conn.close()
+        if row and row[0]:
+            return int(row[0])
+    except Exception as e:
+        log("DEBUG", f"Field size DB lookup failed: {e}")
+    return None
+
+def field_size_from_results(html):
+    """Runners in a LocalResults page's results table (0 when there is none)."""
+    table_rows = find_table_rows(html, ["table.bigborder"], fallback_header="Horse")
+    if not table_rows:
+        return 0
+    rows = [r for r in table_rows if r.find_all("td")]
+    return len(rows) - 1  # exclude header
+
+def _scrape_field_size(race_date_str, race_no, race_course):
+    """Count the runners on the LocalResults page (gated by LOCAL_RESULTS_LIMITER)."""
+    import requests
+
+    url = (
+        "https://racing.hkjc.com/racing/information/English/racing/"
+        f"LocalResults.aspx?RaceDate={race_date_str}&Racecourse={race_course}&RaceNo={race_no}"
+    )
+    with LOCAL_RESULTS_LIMITER.slot() as slot:
+        try:
+            resp = requests.get(url, timeout=10)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            slot.outcome = THROTTLE
+            raise
+        slot.outcome = classify_http_status(resp.status_code)
+        resp.raise_for_status()
+        field_size = field_size_from_results(decode_html(resp.content, encoding=resp.encoding))
+        if field_size <= 0:
+            # HKJC serves an empty results page when it is shedding load
+            slot.outcome = THROTTLE
+            return None
+        return field_size
+
 def get_race_field_size(race_date_str, race_no, race_course):
     """Derive field size for a race.
 
@@ -81,62 +189,63 @@ def get_race_field_size(race_date_str, race_no, race_course):
     create_race_field_size_table()
 
     # 1) Try the local cache
-    try:
-        conn = sqlite3.connect("hkjc_horses_dynamic_special.db")
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT FieldSize FROM race_field_size WHERE RaceDate=? AND RaceNo=? AND RaceCourse=?",
-            (race_date_str, str(race_no), race_course),
-        )
-        row = cur.fetchone()
-        conn.close()
-        if row and row[0]:
-            return int(row[0])
-    except Exception as e:
-        log("DEBUG", f"Field size DB lookup failed: {e}")
+    field_size = _cached_field_size(race_date_str, race_no, race_course)
+    if field_size:
+        return field_size
 
     # 2) Fallback to scraping the race result page
     try:
-        url = (
-            "https://racing.hkjc.com/racing/information/English/racing/"
-            f"LocalResults.aspx?RaceDate={race_date_str}&Racecourse={race_course}&RaceNo={race_no}"
-        )
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        dammit = UnicodeDammit(resp.content, ["utf-8", "big5", "latin-1"])
-        soup = BeautifulSoup(dammit.unicode_markup, "html.parser")
-
-        table = soup.find("table", class_="bigborder")
-        if not table:
-            for t in soup.find_all("table"):
-                header = t.find("tr")
-                if header and "Horse" in header.get_text():
-                    table = t
-                    break
-
-        if table:
-            rows = [r for r in table.find_all("tr") if r.find_all("td")]
-            field_size = len(rows) - 1  # exclude header
-            if field_size > 0:
-                try:
-                    conn = sqlite3.connect("hkjc_horses_dynamic_special.db")
-                    cur = conn.cursor()
-                    cur.execute(
-                        "INSERT OR REPLACE INTO race_field_size (RaceDate, RaceNo, RaceCourse, FieldSize) VALUES (?, ?, ?, ?)",
-                        (race_date_str, str(race_no), race_course, field_size),
-                    )
-                    conn.commit()
-                    conn.close()
-                except Exception as e:
-                    log("DEBUG", f"Failed to cache field size: {e}")
-                return field_size
+        field_size = _scrape_field_size(race_date_str, race_no, race_course)
+        if field_size:
+            try:
+                conn = sqlite3.connect(stats.DB_PATH)
+                cur = conn.cursor()
+                cur.execute(
+                    "INSERT OR REPLACE INTO race_field_size (RaceDate, RaceNo, RaceCourse, FieldSize) VALUES (?, ?, ?, ?)",
+                    (race_date_str, str(race_no), race_course, field_size),
+                )
+                conn.commit()
+                conn.close()
+            except Exception as e:
+                log("DEBUG", f"Failed to cache field size: {e}")
+            return field_size
     except Exception as e:
         log("DEBUG", f"Field size scrape failed: {e}")
 
     return None
 
+def prefetch_field_sizes(race_keys):
+    """
+    Scrape the uncached field sizes for ``race_keys`` concurrently; the
+    AIMD limiter decides how many LocalResults requests are in flight.
+    Results are scraped on worker threads and cached on the calling thread.
+    """
+    create_race_field_size_table()
+    missing = [key for key in dict.fromkeys(race_keys) if not _cached_field_size(*key)]
+    if len(missing) < 2:
+        return 0
+
+    def _scrape(key):
+        try:
+            return _scrape_field_size(*key)
+        except Exception as e:
+            log("DEBUG", f"Field size scrape failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=LOCAL_RESULTS_LIMITER.max_limit) as pool:
+        found = [(key, size) for key, size in zip(missing, pool.map(_scrape, missing)) if size]
+
+    conn = sqlite3.connect(stats.DB_PATH)
+    conn.executemany(
+        "INSERT OR REPLACE INTO race_field_size (RaceDate, RaceNo, RaceCourse, FieldSize) VALUES (?, ?, ?, ?)",
+        [(d, str(n), c, size) for (d, n, c), size in found],
+    )
+    conn.commit()
+    conn.close()
+    return len(found)
+
 def create_going_pref_table():
-    conn = sqlite3.connect("hkjc_horses_dynamic_special.db")
+    conn = sqlite3.connect(stats.DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS horse_going_pref (
@@ -163,7 +272,7 @@ def upsert_dynamic_stats(
     course_pref,
     running_style
 ):
-    conn = sqlite3.connect('hkjc_horses_dynamic_special.db')
+    conn = sqlite3.connect(stats.DB_PATH)
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -231,10 +340,7 @@ def build_trainer_combo(rows):
             continue
 
         # Build season code
-        if race_date.month >= 9:
-            season_code = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}"
-        else:
-            season_code = f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
+        season_code = get_season_code(race_date)
 
         combo[season_code][trainer]["TotalRuns"] += 1
         if placing <= 3:
@@ -242,6 +348,54 @@ def build_trainer_combo(rows):
 
     return combo
 
+def build_jockey_trainer_combo(rows):
+    """[upsert_jockey_trainer_combo() kwargs] per (season, jockey, trainer)."""
+    jt_combo_map = defaultdict(lambda: {"top3": 0, "total": 0, "last_date": None})
+
+    for row in rows:
+        cols = row.find_all("td")
+        if len(cols) < 11:
+            continue
+
+        place_text = sanitize_text(cols[1].get_text())
+        place_clean = re.sub(r'[^\d]', '', place_text)
+        placing = int(place_clean) if place_clean.isdigit() else None
+
+        date_str = sanitize_text(cols[2].get_text())
+        trainer = sanitize_text(cols[9].get_text()) if len(cols) > 9 else None
+        jockey = sanitize_text(cols[10].get_text()) if len(cols) > 10 else None
+
+        if placing is None or not jockey or not trainer:
+            continue
+
+        race_date = parse_hkjc_date(date_str)
+        if not race_date:
+            log("WARNING", f"Unable to parse date '{date_str}' for jockey-trainer combo; skipping row")
+            continue
+        season_code = get_season_code(race_date)
+
+        key = (season_code, jockey, trainer)
+        jt_combo_map[key]["total"] += 1
+        if placing in [1, 2, 3]:
+            jt_combo_map[key]["top3"] += 1
+
+        current_last = jt_combo_map[key]["last_date"]
+        if current_last is None or race_date > current_last:
+            jt_combo_map[key]["last_date"] = race_date
+
+    combos = []
+    for (season, jockey, trainer), result in jt_combo_map.items():
+        combos.append({
+            "season": season,
+            "jockey": jockey,
+            "trainer": trainer,
+            "top3_count": result["top3"],
+            "total_runs": result["total"],
+            # Store ISO for DB
+            "last_race_date": result["last_date"].strftime("%Y-%m-%d") if result["last_date"] else None,
+        })
+    return combos
+
 # -----------------------------
 # Parse course key from HTML (e.g., "ST / Turf / \"A\"")
 # -----------------------------
@@ -258,114 +412,265 @@ def parse_course_key(course_key_raw):
 # -----------------------------
 # SCRAPER / PROCESSOR
 # -----------------------------
-def extract_dynamic_stats(horse_url):
+def horse_page_url(horse_id):
+    return f"https://racing.hkjc.com/racing/information/English/Horse/OtherHorse.aspx?HorseId={horse_id.strip()}"
+
+# Bytes / ms per horse page, summarised at the end of a batch
+PAGE_COSTS = PageCostMeter("horse_pages")
+# Per-horse RSS of this process (parse workers are reported on exit)
+MEMORY = MemoryMeter("horses")
+# Per-horse stage timings -> run_metrics table + end-of-run summary
+METRICS = RunMetrics()
+
+def new_chrome_driver(block_resources=None, page_load_strategy=None):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    block_resources = BLOCK_RESOURCES if block_resources is None else block_resources
     service = Service(CHROME_DRIVER_PATH)
     options = webdriver.ChromeOptions()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
     options.add_argument('--no-sandbox')
+    configure_options(options, block_resources=block_resources,
+                      page_load_strategy=page_load_strategy or PAGE_LOAD_STRATEGY)
     driver = webdriver.Chrome(service=service, options=options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+    if block_resources:
+        apply_request_blocking(driver, blocked_url_patterns())
+    return driver
+
+def has_race_table(page_source):
+    """Cheap check (no parsing) that the race history table was rendered."""
+    return 'class="f_tac f_fs12' in page_source or 'class="bigborder' in page_source
+
+def load_horse_page(horse_url, driver, meter=PAGE_COSTS):
+    started = time.perf_counter()
+    driver.get(horse_url)
+    # Instead of a fixed sleep: returns as soon as the table is in the DOM
+    wait_for_selector(driver, RACE_TABLE_SELECTOR, RENDER_WAIT_SECONDS)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if meter is not None:
+        meter.add(page_cost(driver), elapsed_ms)
+
+def fetch_horse_html(horse_url, driver, meter=PAGE_COSTS):
+    from selenium.common.exceptions import TimeoutException
 
     try:
-        driver.get(horse_url)
-        time.sleep(3)
-
-        page_source = driver.execute_script("return document.documentElement.outerHTML")
-        page_source = sanitize_text(page_source)
-        soup = BeautifulSoup(page_source, "html.parser")
+        load_horse_page(horse_url, driver, meter)
+        return driver.execute_script("return document.documentElement.outerHTML")
+    except TimeoutException as e:
+        raise HorseTimeout(f"Browser timeout on {horse_url}: {e.msg}") from e
 
-        table = soup.find("table", class_="f_tac f_fs12 js_race_tab") or \
-                soup.find("table", class_="f_tac f_fs12") or \
-                soup.find("table", class_="bigborder")
-        if not table:
-            raise ValueError("Could not find race history table on page")
+def fetch_race_table_json(horse_url, driver, meter=PAGE_COSTS):
+    """Only the race table, as TABLE_ROWS_JS rows built in the page (None if missing)."""
+    from selenium.common.exceptions import TimeoutException
 
-        rows = table.find_all("tr")[1:]
-        if not rows:
-            raise ValueError("No race history data found in table")
-
-        # 🧠 Step: Sort race rows by date (latest first)
-        from special.utils_special import parse_hkjc_date  # make sure this is imported at the top
+    try:
+        load_horse_page(horse_url, driver, meter)
+        return driver.execute_script(TABLE_ROWS_JS, RACE_TABLE_SELECTORS)
+    except TimeoutException as e:
+        raise HorseTimeout(f"Browser timeout on {horse_url}: {e.msg}") from e
 
-        dated_rows = []
+def fetch_rendered_page(horse_url, driver):
+    """
+    Payload for parse_horse_payload(): JSON rows of the race table
+    (EXTRACT_MODE "table") or the whole DOM ("dom"). Raises
+    MissingTableError (transient) if the table is not there.
+    """
+    if EXTRACT_MODE == "dom":
+        page_source = fetch_horse_html(horse_url, driver)
+        if not has_race_table(page_source):
+            raise MissingTableError(f"No race table on {horse_url}", page_source)
+        return page_source
+
+    table_rows = fetch_race_table_json(horse_url, driver)
+    if not table_rows:
+        # Only now pay for the full DOM: it is the dead-letter snapshot
+        try:
+            snapshot = driver.execute_script("return document.documentElement.outerHTML")
+        except Exception:
+            snapshot = None
+        raise MissingTableError(f"No race table on {horse_url}", snapshot)
+    return table_rows
+
+def payload_snapshot(payload):
+    """Text form of a page payload for PageError / dead letters."""
+    return payload if isinstance(payload, str) else json.dumps(payload)
+
+def to_plain_dict(value):
+    """Recursively turn (default)dicts into plain dicts so results pickle."""
+    if isinstance(value, dict):
+        return {k: to_plain_dict(v) for k, v in value.items()}
+    return value
+
+def parse_horse_payload(payload, horse_url):
+    """Dispatch on what fetch_rendered_page() returned."""
+    if isinstance(payload, str):
+        return parse_horse_html(payload, horse_url)
+    return parse_horse_json(payload, horse_url)
+
+def parse_horse_json(table_rows, horse_url):
+    """parse_horse_html() for TABLE_ROWS_JS output: no HTML parsing at all."""
+    return parse_race_rows(rows_from_json(table_rows, clean=strip_non_ascii)[1:], horse_url)
+
+def parse_horse_html(page_source, horse_url):
+    """
+    CPU-only half of extract_dynamic_stats(): no browser and no DB access,
+    and the result (a HorseProfile) pickles, so it can run in a worker process.
+    Raises ValueError when the page has no usable race table.
+    """
+    # Plain rows from here on: picklable and independent of the parser.
+    # Cells are normalized once here instead of sanitizing the whole page.
+    table_rows = find_table_rows(page_source, RACE_TABLE_SELECTORS, clean=strip_non_ascii)
+    if table_rows is None:
+        raise ValueError("Could not find race history table on page")
+    return parse_race_rows(table_rows[1:], horse_url)
+
+def parse_race_rows(rows, horse_url):
+    """
+    HorseProfile over the race table's data rows (None when no row has a
+    readable date). Only the date check runs here; every stat is derived
+    on first access.
+    """
+    if not rows:
+        raise ValueError("No race history data found in table")
 
-        for row in rows:
-            cols = row.find_all("td")
-            if len(cols) < 3:
-                continue
+    dated = False
+    for row in rows:
+        cols = row.find_all("td")
+        if len(cols) < 3:
+            continue
 
-            date_str = cols[2].get_text(strip=True)
-            race_date = parse_hkjc_date(date_str)
+        date_str = cols[2].get_text(strip=True)
+        if parse_hkjc_date(date_str):
+            dated = True
+        elif DEBUG_LEVEL in ("DEBUG", "TRACE"):
+            log("DEBUG", f"[special] Unparsed date (header-sort): {date_str!r}")
 
-            if race_date:
-                dated_rows.append((race_date, row))
-            else:
-                if DEBUG_LEVEL in ("DEBUG", "TRACE"):
-                    log("DEBUG", f"[special] Unparsed date (header-sort): {date_str!r}")
-                continue  # skip bad row
+    if not dated:
+        log("WARNING", "No valid race dates found (special layout) — skipping horse")
+        return None
 
-        # ✅ this part must be OUTSIDE the loop
-        if not dated_rows:
-            log("WARNING", "No valid race dates found (special layout) — skipping horse")
-            return None
-        
-        # (optional) sort rows by date if needed
-        dated_rows.sort(key=lambda t: t[0], reverse=True)
-
-        # Sort descending (latest race first)
-        dated_rows.sort(key=lambda x: x[0], reverse=True)
-        sorted_rows = [r[1] for r in dated_rows]
-        hwtr_rows = list(reversed(sorted_rows))  # oldest to newest (for HWTR only)
-
-        # Process each row
-        processed_rows = []
-        for row in rows:
-            cols = row.find_all("td")
-            if len(cols) < 8:
-                continue  # Skip incomplete rows
-                
-            # Extract race details from link
-            race_link_tag = cols[0].find("a")
-            if race_link_tag and race_link_tag.has_attr("href"):
-                race_url = race_link_tag['href']
-                match = re.search(r'RaceDate=([\d/]+)&Racecourse=([A-Z]+)&RaceNo=(\d+)', race_url)
-                if match:
-                    race_date_str = match.group(1)
-                    race_course_code = match.group(2)
-                    race_no = int(match.group(3))
-                else:
-                    race_date_str = None
-                    race_course_code = None
-                    race_no = None
-            else:
-                race_date_str = None
-                race_course_code = None
-                race_no = None
-
-            # Do not set a placeholder here; let DB keep existing or fill later from CSV
-            processed_rows.append(row)
-
-        log("DEBUG", f"Running weight preference analysis for {horse_url}")
-
-        # 🏋️ Extract weight preference data
-        horse_id = horse_url.split("HorseId=")[-1]
-        
-        # Analyze processed rows
-        recent_form = []
-        race_dates = []
-        fitness_count = 0
-        distance_stats = defaultdict(lambda: {"total": 0, "wins": 0, "placing_sum": 0})
-        going_stats = defaultdict(lambda: {"total": 0, "wins": 0, "placing_sum": 0})
-        going_stats_seasonal = defaultdict(lambda: defaultdict(lambda: {"total": 0, "top3": 0}))
-        course_stats = defaultdict(lambda: {"total": 0, "wins": 0, "placing_sum": 0})
-        class_stats = defaultdict(lambda: {"total": 0, "placing_sum": 0})
+    return HorseProfile(horse_url, rows)
 
-        today = datetime.now().date()
+def get_best(stats_dict, type="win"):
+    """(key, rounded value) with the best win rate ("win") or lowest average placing ("avg")."""
+    best_key, best_value = None, -1
+    for key, stats in stats_dict.items():
+        if stats["total"] == 0:
+            continue
+        if type == "win":
+            win_rate = stats["wins"] / stats["total"]
+            if win_rate > best_value:
+                best_key = key
+                best_value = win_rate
+        elif type == "avg":
+            avg = stats["placing_sum"] / stats["total"]
+            if best_value == -1 or avg < best_value:
+                best_key = key
+                best_value = avg
+    return best_key, round(best_value, 2) if best_value != -1 else None
+
+class HorseProfile:
+    """
+    Everything derived from one horse's race table. Each stat is computed
+    on first access and cached, so a batch run only pays for what
+    persist_horse_data() reads; the Best* summaries and raw stat tables
+    are there for analysis. Dict-style access with the old result keys
+    (profile["BestGoing"], .get(), .to_dict()) still works.
+    Picklable, so it can come back from a parse worker process.
+    """
 
-        for row in processed_rows:
+    # Result key -> (attribute, index into a (key, value) pair or None)
+    FIELDS = {
+        "HorseID": ("horse_id", None),
+        "RecentForm": ("recent_form", None),
+        "NumRecentRuns": ("num_recent_runs", None),
+        "DaysSinceLastRun": ("days_since_last_run", None),
+        "FitnessIndicator": ("fitness_indicator", None),
+        "BestDistance": ("best_distance", 0),
+        "BestDistanceWinRate": ("best_distance", 1),
+        "BestGoing": ("best_going", 0),
+        "BestGoingWinRate": ("best_going", 1),
+        "BestCourse": ("best_course", 0),
+        "BestCourseWinRate": ("best_course", 1),
+        "BestClass": ("best_class", 0),
+        "BestClassAvgPlacing": ("best_class", 1),
+        "DistancePrefDetailed": ("distance_pref_detailed", None),
+        "GoingPrefSeasonal": ("going_stats_seasonal", None),
+        "CoursePrefDetailed": ("course_pref_detailed", None),
+        "RawRows": ("rows", None),
+        "RunningPositions": ("running_positions", None),
+        "Season": ("season", None),
+        "RaceHistory": ("race_history", None),
+        "HwtrPerClass": ("hwtr_per_class", None),
+        "HorseRating": ("horse_rating", None),
+        "ClassJumpPref": ("class_jump_pref", None),
+        "TrainerCombo": ("trainer_combo", None),
+        "JockeyCombo": ("jockey_combo", None),
+        "JockeyTrainerCombo": ("jockey_trainer_combo", None),
+        "WeightPref": ("weight_pref", None),
+        "BwrDistancePerf": ("bwr_distance_perf", None),
+        "DrawPref": ("draw_pref", None),
+    }
+
+    # What persist_horse_data() reads (computed up front by parse workers,
+    # so the writer only runs upserts)
+    PERSISTED = (
+        "RecentForm", "DaysSinceLastRun", "FitnessIndicator", "DistancePrefDetailed",
+        "GoingPrefSeasonal", "CoursePrefDetailed", "RunningPositions",
+        "Season", "RaceHistory", "HwtrPerClass", "HorseRating", "ClassJumpPref", "TrainerCombo",
+        "JockeyCombo", "JockeyTrainerCombo", "WeightPref", "BwrDistancePerf", "DrawPref",
+    )
+
+    def __init__(self, horse_url, rows, today=None):
+        self.horse_url = horse_url
+        self.horse_id = horse_url.split("HorseId=")[-1]
+        # RawRows: rows with fewer than 8 cells are incomplete
+        self.rows = [row for row in rows if len(row.find_all("td")) >= 8]
+        self.today = today or datetime.now().date()
+        # Seconds per stage when parsed in a worker (parse_horse_page)
+        self.stage_seconds = {}
+        # Result key -> error, for builders persist_horse_data() may skip
+        self.build_errors = {}
+
+    # -- dict-style access --
+    def __getitem__(self, key):
+        try:
+            attr, index = self.FIELDS[key]
+        except KeyError:
+            raise KeyError(key) from None
+        value = getattr(self, attr)
+        return value if index is None else value[index]
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS.keys()
+
+    def to_dict(self):
+        """Every field, i.e. the full (eager) result."""
+        return {key: self[key] for key in self.FIELDS}
+
+    def prefetch(self, keys=PERSISTED):
+        """Compute ``keys`` now (e.g. in a parse worker, before pickling)."""
+        for key in keys:
+            self[key]
+        return self
+
+    # -- per-race form --
+    @cached_property
+    def form_rows(self):
+        """(race_date, season, placing, course, distance, going, class) per placed, dated race."""
+        out = []
+        for row in self.rows:
             cols = row.find_all("td")
-            if len(cols) < 8:
-                continue
 
             class_val = sanitize_text(cols[7].get_text())
             placing_text = sanitize_text(cols[1].get_text())
@@ -385,89 +690,238 @@ def extract_dynamic_stats(horse_url):
                 if DEBUG_LEVEL in ("DEBUG", "TRACE"):
                     log("DEBUG", f"[special] Unparsed date (row-loop): {date_str!r}")
                 continue
-            # race_date is a datetime.date here (safe to use)
 
-            race_dates.append(race_date)
+            out.append((race_date, get_season_code(race_date), placing,
+                        course_str, distance_str, going_str, class_val))
+        return out
 
-            # Build season code
-            if race_date.month >= 9:
-                season_code = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}"
-            else:
-                season_code = f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
+    @cached_property
+    def recent_form(self):
+        """Placings of the last 5 races, latest first."""
+        return [placing for _, _, placing, *_ in self.form_rows[:5]]
+
+    @property
+    def num_recent_runs(self):
+        return len(self.recent_form)
 
-            # Recent form 1-5
-            if len(recent_form) < 5:
-                recent_form.append(placing)
+    @cached_property
+    def days_since_last_run(self):
+        race_dates = [race_date for race_date, *_ in self.form_rows]
+        return (self.today - max(race_dates)).days if race_dates else None
 
-            # Fitness count
-            if 0 <= (today - race_date).days <= 90:
-                fitness_count += 1
+    @cached_property
+    def fitness_indicator(self):
+        """Races in the last 90 days."""
+        return sum(1 for race_date, *_ in self.form_rows if 0 <= (self.today - race_date).days <= 90)
 
-            # Distance stats
+    # -- raw stat tables (plain dicts) --
+    @cached_property
+    def distance_stats(self):
+        distance_stats = defaultdict(lambda: {"total": 0, "wins": 0, "placing_sum": 0})
+        for _, _, placing, _, distance_str, _, _ in self.form_rows:
             if distance_str.isdigit():
                 d = int(distance_str)
                 distance_stats[d]["total"] += 1
                 distance_stats[d]["placing_sum"] += placing
                 if placing == 1:
                     distance_stats[d]["wins"] += 1
+        return to_plain_dict(distance_stats)
 
-            # Going stats
+    @cached_property
+    def going_stats(self):
+        going_stats = defaultdict(lambda: {"total": 0, "wins": 0, "placing_sum": 0})
+        for _, _, placing, _, _, going_str, _ in self.form_rows:
             if going_str:
-                going_stats_seasonal[season_code][going_str]["total"] += 1
-                if placing in [1, 2, 3]:
-                    going_stats_seasonal[season_code][going_str]["top3"] += 1
-
                 going_stats[going_str]["total"] += 1
                 going_stats[going_str]["placing_sum"] += placing
                 if placing == 1:
                     going_stats[going_str]["wins"] += 1
+        return to_plain_dict(going_stats)
 
-            # Course stats
+    @cached_property
+    def going_stats_seasonal(self):
+        going_stats_seasonal = defaultdict(lambda: defaultdict(lambda: {"total": 0, "top3": 0}))
+        for _, season_code, placing, _, _, going_str, _ in self.form_rows:
+            if going_str:
+                going_stats_seasonal[season_code][going_str]["total"] += 1
+                if placing in [1, 2, 3]:
+                    going_stats_seasonal[season_code][going_str]["top3"] += 1
+        return to_plain_dict(going_stats_seasonal)
+
+    @cached_property
+    def course_stats(self):
+        course_stats = defaultdict(lambda: {"total": 0, "wins": 0, "placing_sum": 0})
+        for _, _, placing, course_str, _, _, _ in self.form_rows:
             course_stats[course_str]["total"] += 1
             course_stats[course_str]["placing_sum"] += placing
             if placing == 1:
                 course_stats[course_str]["wins"] += 1
+        return to_plain_dict(course_stats)
 
-            # Class stats
+    @cached_property
+    def class_stats(self):
+        class_stats = defaultdict(lambda: {"total": 0, "placing_sum": 0})
+        for _, _, placing, _, _, _, class_val in self.form_rows:
             if class_val.isdigit():
                 c = int(class_val)
                 class_stats[c]["total"] += 1
                 class_stats[c]["placing_sum"] += placing
+        return to_plain_dict(class_stats)
+
+    # -- best performance, (key, rate) pairs --
+    @cached_property
+    def best_distance(self):
+        return get_best(self.distance_stats, type="win")
+
+    @cached_property
+    def best_going(self):
+        return get_best(self.going_stats, type="win")
+
+    @cached_property
+    def best_course(self):
+        return get_best(self.course_stats, type="win")
+
+    @cached_property
+    def best_class(self):
+        return get_best(self.class_stats, type="avg")
+
+    # -- detailed preferences --
+    @cached_property
+    def distance_pref_detailed(self):
+        return to_plain_dict(build_exact_distance_pref(self.rows))
+
+    @cached_property
+    def course_pref_detailed(self):
+        return to_plain_dict(build_course_pref(self.rows))
+
+    # -- per-table builder output (plain dicts / lists, upserted as-is) --
+    def _tolerant(self, key, build):
+        # A failing builder costs its own table, not the horse (as it always
+        # has in persist_horse_data()); the error is kept for the writer
+        try:
+            return build()
+        except Exception as e:
+            self.build_errors[key] = f"{type(e).__name__}: {e}"
+            return None
 
-        race_dates.sort(reverse=True)
-        days_since_last_run = (today - race_dates[0]).days if race_dates else None
-
-        def get_best(stats_dict, type="win"):
-            best_key, best_value = None, -1
-            for key, stats in stats_dict.items():
-                if stats["total"] == 0:
+    @cached_property
+    def rows_newest_first(self):
+        def _key_date(row):
+            try:
+                txt = row.find_all("td")[2].get_text(strip=True)
+                return parse_hkjc_date(txt) or datetime.min.date()
+            except Exception:
+                return datetime.min.date()
+        return sorted(self.rows, key=_key_date, reverse=True)
+
+    @cached_property
+    def season(self):
+        """Season of the first row with a readable date; gates HWTR and the rating snapshot."""
+        for r in self.rows:
+            cols = r.find_all("td")
+            if len(cols) >= 3:
+                date_str = cols[2].get_text().strip()
+                date_obj = parse_hkjc_date(date_str)
+                if not date_obj:
+                    log("WARNING", f"Unable to parse date '{date_str}' for season detection; skipping row")
                     continue
-                if type == "win":
-                    win_rate = stats["wins"] / stats["total"]
-                    if win_rate > best_value:
-                        best_key = key
-                        best_value = win_rate
-                elif type == "avg":
-                    avg = stats["placing_sum"] / stats["total"]
-                    if best_value == -1 or avg < best_value:
-                        best_key = key
-                        best_value = avg
-            return best_key, round(best_value, 2) if best_value != -1 else None
-
-        # Get best performance metrics
-        best_distance, best_distance_win_rate = get_best(distance_stats, type="win")
-        best_going, best_going_win_rate = get_best(going_stats, type="win")
-        best_course, best_course_win_rate = get_best(course_stats, type="win")
-        best_class, best_class_avg = get_best(class_stats, type="avg")
-
-        # Detailed preferences
-        detailed_distance_pref = build_exact_distance_pref(processed_rows)
-        detailed_course_pref = build_course_pref(processed_rows)
-
-        # ✅ Insert Running Position data per race
-        horse_id = horse_url.split("HorseId=")[-1]
-
-        for row in processed_rows:
+                return get_season_code(date_obj)
+        return None
+
+    @cached_property
+    def race_history(self):
+        return self._tolerant("RaceHistory", lambda: build_race_history(self.rows, self.horse_id))
+
+    @cached_property
+    def hwtr_per_class(self):
+        return self._tolerant("HwtrPerClass", lambda: build_hwtr_per_class(self.rows, self.horse_id))
+
+    @cached_property
+    def horse_rating(self):
+        """upsert_horse_rating() kwargs (minimal snapshot), or None without rated, dated races."""
+        return self._tolerant("HorseRating", self._build_horse_rating)
+
+    def _build_horse_rating(self):
+        season = self.season
+        if not season:
+            return None
+        rows = [r.find_all("td") for r in self.rows]
+        rows = [c for c in rows if len(c) > 8 and c[2].get_text(strip=True)]
+
+        def _parse_iso(dmy):
+            s = dmy.strip()
+            for fmt in ("%d/%m/%y", "%d/%m/%Y"):
+                try:
+                    return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
+                except ValueError:
+                    pass
+            return None
+
+        parsed = []
+        for c in rows:
+            iso = _parse_iso(c[2].get_text(strip=True))
+            rating_txt = c[8].get_text(strip=True)
+            try:
+                rating_val = float(rating_txt) if rating_txt else None
+            except ValueError:
+                rating_val = None
+            if iso and rating_val is not None:
+                parsed.append((iso, rating_val))
+
+        if not parsed:
+            return None
+        parsed.sort(key=lambda x: x[0])  # ascending by date
+
+        def _season_code(iso):
+            return get_season_code(datetime.strptime(iso, "%Y-%m-%d"))
+
+        as_of_date, official_rating = parsed[-1]
+        return {
+            "season": season,
+            "as_of_date": as_of_date,
+            "official_rating": official_rating,
+            "rating_start_season": next((rv for iso, rv in parsed if _season_code(iso) == season), parsed[0][1]),
+            "rating_start_career": parsed[0][1],
+        }
+
+    @cached_property
+    def class_jump_pref(self):
+        return self._tolerant("ClassJumpPref", lambda: to_plain_dict(build_class_jump_pref(self.rows)))
+
+    @cached_property
+    def trainer_combo(self):
+        return to_plain_dict(build_trainer_combo(self.rows))
+
+    @cached_property
+    def jockey_combo(self):
+        return build_horse_jockey_combo(self.rows)
+
+    @cached_property
+    def jockey_trainer_combo(self):
+        return build_jockey_trainer_combo(self.rows)
+
+    @cached_property
+    def weight_pref(self):
+        weight_pref = build_weight_pref_from_dict(self.rows_newest_first, self.horse_id)
+        for row in weight_pref:
+            row["Season"] = str(row.get("Season", "Unknown"))  # Force string type
+        return weight_pref
+
+    @cached_property
+    def bwr_distance_perf(self):
+        return self._tolerant("BwrDistancePerf", lambda: build_bwr_distance_perf(self.rows_newest_first))
+
+    @cached_property
+    def draw_pref(self):
+        return self._tolerant("DrawPref", lambda: to_plain_dict(build_draw_pref(self.rows)))
+
+    @cached_property
+    def running_positions(self):
+        """[((race_date_str, race_no, race_course), rp_data)], stored by store_running_positions()."""
+        horse_id = self.horse_id
+        running_positions = []
+
+        for row in self.rows:
             cols = row.find_all("td")
             if len(cols) < 18:
                 continue
@@ -487,13 +941,13 @@ def extract_dynamic_stats(horse_url):
 
                     # PROPER RaceID EXTRACTION - THIS IS THE KEY FIX
                     race_id = sanitize_text(race_link_tag.get_text(strip=True))
-                    
+
                     # Clean the extracted RaceID - remove all non-numeric characters
                     race_id = ''.join(c for c in race_id if c.isdigit())
-                    
+
                     # VALIDATION - Only use if we got a proper numeric ID
                     if race_id and len(race_id) >= 3:  # Real RaceIDs are at least 3 digits
-                        log("DEBUG", f"Using extracted RaceID: {race_id}")
+                        logger.debug("Using extracted RaceID: %s", race_id)
                     else:
                         # Only construct ID as last resort
                         race_date_obj = datetime.strptime(race_date_str, "%Y/%m/%d")
@@ -533,10 +987,7 @@ def extract_dynamic_stats(horse_url):
 
                 # -- Season
                 race_date = datetime.strptime(race_date_str, "%Y/%m/%d")
-                season = f"{race_date.year%100:02d}/{(race_date.year+1)%100:02d}" if race_date.month >= 9 else f"{(race_date.year-1)%100:02d}/{race_date.year%100:02d}"
-                
-                # Derive field size for this race
-                field_size = get_race_field_size(race_date_str, race_no, race_course)
+                season = get_season_code(race_date)
 
                 # -- Build data dict
                 race_date_obj = datetime.strptime(race_date_str, "%Y/%m/%d")
@@ -555,57 +1006,126 @@ def extract_dynamic_stats(horse_url):
                     "FinalPos": final_pos,
                     "FinishTime": finish_time,
                     "Placing": placing if placing is not None else final_pos,
-                    "FieldSize": field_size,
+                    "FieldSize": None,  # looked up at write time (cache DB / network)
                     # Separate display string if needed by consumers
                     "RaceDateDisplay": race_date_obj.strftime("%d/%m/%y"),
                 }
 
-
-                upsert_running_position(rp_data)
+                running_positions.append(((race_date_str, race_no, race_course), rp_data))
 
             except Exception as err:
                 log("WARNING", f"Skipped row for {horse_id} due to: {err}")
 
-        return {
-            "HorseID": horse_url.split("HorseId=")[-1],
-            "RecentForm": recent_form,
-            "NumRecentRuns": len(recent_form),
-            "DaysSinceLastRun": days_since_last_run,
-            "FitnessIndicator": fitness_count,
-            "BestDistance": best_distance,
-            "BestDistanceWinRate": best_distance_win_rate,
-            "BestGoing": best_going,
-            "BestGoingWinRate": best_going_win_rate,
-            "BestCourse": best_course,
-            "BestCourseWinRate": best_course_win_rate,
-            "BestClass": best_class,
-            "BestClassAvgPlacing": best_class_avg,
-            "DistancePrefDetailed": detailed_distance_pref,
-            "GoingPrefSeasonal": going_stats_seasonal,
-            "CoursePrefDetailed": detailed_course_pref,
-            "RawRows": processed_rows
-        }
+        return running_positions
 
+def store_running_positions(running_positions, timer=NULL_TIMER):
+    """Fill FieldSize and upsert the running-position rows from parse_horse_html()."""
+    try:
+        with timer.stage("field_size"):
+            prefetch_field_sizes([key for key, _ in running_positions])
+    except Exception as e:
+        log("DEBUG", f"Field size prefetch failed: {e}")
+    for (race_date_str, race_no, race_course), rp_data in running_positions:
+        try:
+            with timer.stage("field_size"):
+                field_size = get_race_field_size(race_date_str, race_no, race_course)
+            with timer.stage("running_positions"):
+                upsert_running_position(dict(rp_data, FieldSize=field_size))
+        except Exception as err:
+            log("WARNING", f"Skipped row for {rp_data.get('HorseID')} due to: {err}")
+
+def extract_dynamic_stats(horse_url, budget=HORSE_BUDGET_SECONDS, retries=DEFAULT_RETRIES,
+                          timer=NULL_TIMER):
+    """
+    Fetch + parse one horse page within ``budget`` seconds. Transient faults
+    are retried with backoff inside the budget. Raises HorseTimeout when the
+    budget runs out (the caller requeues) and PageError / MissingTableError,
+    carrying the page, when it cannot be parsed. Stages are timed on ``timer``.
+    """
+    driver = None
+    expired = threading.Event()
+    driver_lock = threading.Lock()  # expired vs. publishing a new driver
+
+    def _fetch():
+        nonlocal driver
+        if expired.is_set():
+            raise HorseTimeout(f"{horse_url} abandoned")
+        if driver is None:
+            with timer.stage("browser_start"):
+                started = new_chrome_driver()
+            with driver_lock:
+                if not expired.is_set():
+                    driver = started
+            if driver is not started:
+                # The budget ran out while Chrome started; nobody else has it
+                close_driver(started)
+                raise HorseTimeout(f"{horse_url} abandoned while starting Chrome")
+        with timer.stage("page_load"):
+            return fetch_rendered_page(horse_url, driver)
+
+    def _before_retry(error):
+        nonlocal driver
+        if expired.is_set():
+            raise error
+        if not isinstance(error, MissingTableError):
+            close_driver(driver)  # the browser may be dead; start a fresh one
+            driver = None
+
+    def _on_timeout():
+        with driver_lock:
+            expired.set()
+            abandoned = driver
+        close_driver(abandoned)
+
+    def _wait(delay):
+        with timer.stage("retry_wait"):
+            time.sleep(delay)
+
+    def _fetch_and_parse(slot):
+        try:
+            payload = retry_call(_fetch, attempts=retries, label=horse_url, on_retry=_before_retry,
+                                 sleep=_wait)
+        except MissingTableError:
+            slot.outcome = THROTTLE
+            raise
+        try:
+            with timer.stage("parse"):
+                return parse_horse_payload(payload, horse_url)
+        except Exception as e:
+            raise PageError(f"{type(e).__name__}: {e}", payload_snapshot(payload)) from e
+
+    try:
+        timer.mark()
+        with HORSE_PAGE_LIMITER.slot() as slot:
+            timer.lap("limiter_wait")
+            try:
+                # On timeout the browser is killed, which unblocks the stuck call
+                return call_with_budget(lambda: _fetch_and_parse(slot), budget,
+                                        on_timeout=_on_timeout, label=horse_url)
+            except HorseTimeout:
+                slot.outcome = THROTTLE
+                raise
+    except HorseTimeout as e:
+        log("WARNING", f"Timed out: {e}")
+        raise
     except Exception as e:
         log("ERROR", f"Failed to process {horse_url}: {str(e)}")
-        return None
+        raise
     finally:
-        driver.quit()
+        close_driver(driver)
 
 # -----------------------------
-# MAIN
+# BATCH DRIVER
 # -----------------------------
-if __name__ == "__main__":
-    print("\n[INFO] This module provides helper functions for processing HKJC horse data.")
-    print("       It's designed to be imported, not run directly.")
-
+def init_database():
+    """Create / migrate every table the batch writes to."""
     create_running_position_table()
     create_running_style_pref_table()
     migrate_turncount_to_real()
 
     # Optional one-off backfill for ALL horses
     try:
-        upserts, groups = rebuild_running_style_pref(horse_id=None)
+        upserts, groups = rebuild_running_style_pref_sql(horse_id=None)
         print(f"[BACKFILL] running_style_pref rebuilt. Groups={groups}, rows upserted={upserts}")
     except Exception as e:
         print(f"[ERROR] Backfill failed: {e}")
@@ -615,411 +1135,718 @@ if __name__ == "__main__":
     create_trainer_combo_table()
 
     # 2. Handle jockey-trainer table with migration
-    from special._horse_dynamic_stats_special import migrate_jockey_trainer_table
+    from _horse_dynamic_stats_special import migrate_jockey_trainer_table
     migrate_jockey_trainer_table()  # First migrate existing tables
     create_jockey_trainer_combo_table()  # Then ensure proper table structure
 
     # 3. Handle draw preferences
+    create_dead_letters_table()
     create_draw_pref_table()  # ✅ Ensure table exists
-    ensure_column_exists("hkjc_horses_dynamic_special.db", "horse_draw_pref", "ID", "INTEGER")
-    ensure_column_exists("hkjc_horses_dynamic_special.db", "horse_draw_pref", "RaceCourse", "TEXT")
-    ensure_column_exists("hkjc_horses_dynamic_special.db", "horse_draw_pref", "LastUpdate", "TIMESTAMP")
+    ensure_column_exists(stats.DB_PATH, "horse_draw_pref", "ID", "INTEGER")
+    ensure_column_exists(stats.DB_PATH, "horse_draw_pref", "RaceCourse", "TEXT")
+    ensure_column_exists(stats.DB_PATH, "horse_draw_pref", "LastUpdate", "TIMESTAMP")
 
     # 4. Create remaining tables
     create_running_position_table()  # ← Important: Keep this single call
     create_bwr_distance_perf_table()  # For BWR processing
     create_weight_pref_table()  # For weight preferences
     create_horse_rating_table()  # ensure horse_rating exists (with LastUpdate)
+    create_race_history_table()  # per-race rows for SQL-side rebuilds
 
-    # 5. Load and process horses
-    horse_id_df = pd.read_csv("horse_ids_to_update.csv")
-    horse_id_df = horse_id_df[horse_id_df['HorseID'].notna()]
-    horse_ids = horse_id_df['HorseID'].astype(str).str.strip().unique()
+    # Keep point-in-time history of every preference row
+    enable_pref_versioning()
 
-    log("INFO", f"\nStarting batch update at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    log("INFO", "Database tables initialized with LastRaceDate support")
+def _log_build_error(horse_data, key, what):
+    error = horse_data.build_errors.get(key)
+    log("ERROR", f"Failed to build {what} for {horse_data['HorseID']}: {error}")
+
+def persist_horse_data(horse_id, horse_data, timer=NULL_TIMER):
+    """
+    Write all per-horse tables from one HorseProfile. Every builder runs in
+    the profile (in a parse worker when pipelined); this only upserts.
+    Each step is a lap on ``timer``.
+    """
+    # 0) Running positions parsed from the race table
+    store_running_positions(horse_data.get("RunningPositions", []), timer)
+    timer.mark()
+
+    # 1) Dynamic stat row
+    upsert_dynamic_stats(
+        horse_id=horse_data["HorseID"],
+        recent_form=horse_data["RecentForm"],
+        days_since_last_run=horse_data["DaysSinceLastRun"],
+        fitness=str(horse_data["FitnessIndicator"]),
+        distance_pref=horse_data["DistancePrefDetailed"],
+        going_pref=horse_data["GoingPrefSeasonal"],
+        course_pref=horse_data["CoursePrefDetailed"],
+        running_style=None
+    )
+    timer.lap("dynamic_stats")
+
+    # Per-race history (source for the SQL-side class jump / HWTR rebuilds)
+    try:
+        race_history = horse_data["RaceHistory"]
+        if race_history is None:
+            _log_build_error(horse_data, "RaceHistory", "race history")
+        else:
+            upsert_race_history(horse_data["HorseID"], race_history)
+    except Exception as e:
+        log("ERROR", f"Failed to store race history for {horse_id}: {e}")
+    timer.lap("race_history")
+
+    # --- HWTR Insert ---
+    season = horse_data["Season"]
+    try:
+        if season:
+            hwtr_data = horse_data["HwtrPerClass"]
+            if hwtr_data is None:
+                _log_build_error(horse_data, "HwtrPerClass", "HWTR")
+            else:
+                upsert_hwtr_trend(hwtr_data)
+                log("DEBUG", f"HWTR data generated: {len(hwtr_data)} rows")
+            timer.lap("hwtr")
 
+            # --- Horse Rating snapshot upsert (minimal) ---
+            try:
+                rating = horse_data["HorseRating"]
+                if "HorseRating" in horse_data.build_errors:
+                    _log_build_error(horse_data, "HorseRating", "horse_rating")
+                elif rating:
+                    upsert_horse_rating(horse_id=horse_data["HorseID"], **rating)
+            except Exception as e:
+                log("ERROR", f"Failed to upsert horse_rating for {horse_data.get('HorseID')}: {e}")
+            timer.lap("horse_rating")
+
+            # ✅ INSERT DISTANCE PREF HERE
+            upsert_distance_pref(
+                horse_id=horse_data["HorseID"],
+                season=season,
+                distance_pref=horse_data["DistancePrefDetailed"]
+            )
+
+    except Exception as e:
+        log("ERROR", f"Failed to insert HWTR for {horse_id}: {e}")
+
+    # 2) Preferences tables
+    upsert_distance_pref(
+        horse_id=horse_data["HorseID"],
+        season=season,
+        distance_pref=horse_data["DistancePrefDetailed"]
+    )
+    timer.lap("distance_pref")
+
+    upsert_going_pref(
+        horse_id=horse_data["HorseID"],
+        going_pref_dict=horse_data["GoingPrefSeasonal"]
+    )
+    timer.lap("going_pref")
+
+    upsert_course_pref(
+        horse_id=horse_data["HorseID"],
+        course_pref=horse_data["CoursePrefDetailed"]
+    )
+    timer.lap("course_pref")
+
+    upsert_horse_jockey_combo(
+        horse_id=horse_data["HorseID"],
+        jockey_combo=horse_data["JockeyCombo"]
+    )
+    timer.lap("jockey_combo")
+
+    # Class Jump Preference
+    try:
+        class_jump_stats = horse_data["ClassJumpPref"]
+        if class_jump_stats is None:
+            _log_build_error(horse_data, "ClassJumpPref", "Class Jump Pref")
+        else:
+            upsert_class_jump_pref(horse_data["HorseID"], class_jump_stats)
+    except Exception as e:
+        log("ERROR", f"Failed to update Class Jump Pref for {horse_data['HorseID']}: {e}")
+
+    # Debug/verify: display newest → oldest seasons for Class Jump (no schema change)
+    if DEBUG_LEVEL in ("DEBUG", "TRACE"):
+        try:
+            from _horse_dynamic_stats_special import fetch_class_jump_pref_ordered
+            ordered = fetch_class_jump_pref_ordered(horse_data["HorseID"])
+            log("DEBUG", f"ClassJump (newest→oldest) for {horse_data['HorseID']}: {ordered}")
+        except Exception as qerr:
+            log("DEBUG", f"ClassJump verify query failed: {qerr}")
+    timer.lap("class_jump")
+
+    upsert_trainer_combo(
+        horse_id=horse_data["HorseID"],
+        trainer_combo_dict=horse_data["TrainerCombo"]
+    )
+    timer.lap("trainer_combo")
+
+    # BWR × Distance Preference (built from rows newest first)
+    try:
+        bwr_perf = horse_data["BwrDistancePerf"]
+        if bwr_perf is None:
+            _log_build_error(horse_data, "BwrDistancePerf", "BWR Distance Pref")
+        else:
+            upsert_bwr_distance_perf(
+                horse_id=horse_data["HorseID"],
+                bwr_perf_list=bwr_perf
+            )
+    except Exception as e:
+        log("ERROR", f"Failed to update BWR Distance Pref for {horse_id}: {e}")
+    timer.lap("bwr_distance")
+
+    # ✅ Weight Preference
+    weight_pref = horse_data["WeightPref"]
+    logger.debug("Upserting %d weight preference records", len(weight_pref))
+    upsert_weight_pref(horse_id=horse_data["HorseID"], weight_pref_list=weight_pref)
+    timer.lap("weight_pref")
+
+    # Draw preference
+    try:
+        draw_pref_dict = horse_data["DrawPref"]
+        if draw_pref_dict is None:
+            _log_build_error(horse_data, "DrawPref", "draw pref")
+        else:
+            upsert_draw_pref(horse_data["HorseID"], draw_pref_dict)
+        if DEBUG_LEVEL in ("DEBUG", "TRACE"):
+            from _horse_dynamic_stats_special import fetch_draw_pref_ordered
+            ordered = fetch_draw_pref_ordered(horse_data["HorseID"])
+            log("DEBUG", f"DrawPref (newest first) for {horse_data['HorseID']}: {ordered[:3]}")
+    except Exception as e:
+        log("ERROR", f"Failed to update draw pref for {horse_data['HorseID']}: {e}")
+    timer.lap("draw_pref")
+
+    # Running Style Preference (aggregated from horse_running_position)
+    try:
+        upserts, groups = rebuild_running_style_pref_sql(horse_id)
+        if DEBUG_LEVEL in ("DEBUG", "TRACE"):
+            log("DEBUG", f"RunningStylePref updated for {horse_id}: {upserts} rows across {groups} groups")
+            try:
+                from _horse_dynamic_stats_special import fetch_running_style_pref_ordered
+                ordered = fetch_running_style_pref_ordered(horse_id)
+                # Display seasons in proper order
+                seasons = sorted(set(row[1] for row in ordered), 
+                            key=lambda s: int(s[:2]), 
+                            reverse=True)
+                log("DEBUG", f"RunningStylePref seasons (newest→oldest): {seasons}")
+                log("DEBUG", f"Sample style data: {ordered[0] if ordered else 'None'}")    
+            except Exception as qerr:
+                log("DEBUG", f"RunningStylePref verify query failed: {qerr}")
+    except Exception as e:
+        log("ERROR", f"Failed to update running_style_pref for {horse_id}: {e}")
+    timer.lap("running_style")
+
+    # Jockey-Trainer combo
+    for combo in horse_data["JockeyTrainerCombo"]:
+        upsert_jockey_trainer_combo(horse_id=horse_data["HorseID"], **combo)
+    timer.lap("jockey_trainer")
+
+def is_valid_horse_id(horse_id):
+    return isinstance(horse_id, str) and horse_id.startswith("HK_") and "_" in horse_id
+
+class ChromeFetcher:
+    """Fetch callable for run_pipeline(): one long-lived browser per fetch thread."""
+
+    def __init__(self, retries=DEFAULT_RETRIES):
+        self.driver = None
+        self.retries = retries
+        self._lock = threading.Lock()  # expired vs. publishing a new driver
+
+    def _start_driver(self, horse_id, expired):
+        driver = new_chrome_driver()
+        with self._lock:
+            if not expired.is_set():
+                self.driver = driver
+                return driver
+        # The budget ran out while Chrome started: publishing it now would
+        # hand an abandoned browser to the next horse on this thread
+        close_driver(driver)
+        raise HorseTimeout(f"{horse_id} abandoned while starting Chrome")
+
+    def _fetch(self, horse_id, expired, timer):
+        if expired.is_set():
+            raise HorseTimeout(f"{horse_id} abandoned")
+        driver = self.driver
+        if driver is None:
+            with timer.stage("browser_start"):
+                driver = self._start_driver(horse_id, expired)
+        with timer.stage("page_load"):
+            return fetch_rendered_page(horse_page_url(horse_id), driver)
+
+    def __call__(self, horse_id):
+        expired = threading.Event()
+        timer = METRICS.timer(horse_id)
+
+        def _before_retry(error):
+            if expired.is_set():
+                raise error
+            if not isinstance(error, MissingTableError):
+                self.close()
+
+        def _on_timeout():
+            with self._lock:
+                expired.set()
+            self.close()
+
+        def _wait(delay):
+            with timer.stage("retry_wait"):
+                time.sleep(delay)
+
+        def _fetch_with_retries():
+            return retry_call(lambda: self._fetch(horse_id, expired, timer), attempts=self.retries,
+                              label=horse_id, on_retry=_before_retry, sleep=_wait)
+
+        # Fetch threads beyond the current AIMD limit wait here
+        timer.mark()
+        with HORSE_PAGE_LIMITER.slot() as slot:
+            timer.lap("limiter_wait")
+            try:
+                return call_with_budget(_fetch_with_retries, HORSE_BUDGET_SECONDS,
+                                        on_timeout=_on_timeout, label=horse_id)
+            except Exception as e:
+                if isinstance(e, (HorseTimeout, MissingTableError)):
+                    slot.outcome = THROTTLE
+                if not isinstance(e, MissingTableError):
+                    self.close()  # browser may be wedged; start a fresh one next time
+                raise
+
+    def close(self):
+        with self._lock:
+            driver, self.driver = self.driver, None
+        close_driver(driver)
+
+def parse_horse_page(horse_id, payload):
+    """
+    Process-pool entry point (must stay top-level so it pickles). Everything
+    the writer persists, including every per-table builder, is computed here,
+    in the worker, not lazily in the writer; the time it took travels back
+    in profile.stage_seconds.
+    """
+    try:
+        started = time.perf_counter()
+        profile = parse_horse_payload(payload, horse_page_url(horse_id))
+        if profile is None:
+            return None
+        parsed = time.perf_counter()
+        profile.prefetch()
+        profile.stage_seconds = {"parse": parsed - started, "derive": time.perf_counter() - parsed}
+        return profile
+    except Exception as e:
+        # Keep the page with the error so it can be dead-lettered
+        raise PageError(f"{type(e).__name__}: {e}", payload_snapshot(payload)) from e
+
+def _run_sequential(run_id, horse_ids):
+    """Returns (success, failure, timed_out); timed-out horses are not counted as failures yet."""
     success = 0
     failure = 0
+    timed_out = []
 
     for horse_id in horse_ids:
-        if not isinstance(horse_id, str) or not horse_id.startswith("HK_") or "_" not in horse_id:
+        mark_started(run_id, horse_id)
+
+        if not is_valid_horse_id(horse_id):
             log("WARNING", f"Skipping invalid HorseID: {horse_id}")
+            mark_failed(run_id, horse_id, "Invalid HorseID")
             failure += 1
             continue
 
-        horse_url = f"https://racing.hkjc.com/racing/information/English/Horse/OtherHorse.aspx?HorseId={horse_id.strip()}"
+        horse_url = horse_page_url(horse_id)
+        timer = METRICS.timer(horse_id)
+        status = "failed"
         try:
             log("INFO", f"\nProcessing: {horse_id}")
-            horse_data = extract_dynamic_stats(horse_url)
+            horse_data = extract_dynamic_stats(horse_url, timer=timer)
 
             if horse_data:
-                # 1) Dynamic stat row
-                upsert_dynamic_stats(
-                    horse_id=horse_data["HorseID"],
-                    recent_form=horse_data["RecentForm"],
-                    days_since_last_run=horse_data["DaysSinceLastRun"],
-                    fitness=str(horse_data["FitnessIndicator"]),
-                    distance_pref=horse_data["DistancePrefDetailed"],
-                    going_pref=horse_data["GoingPrefSeasonal"],
-                    course_pref=horse_data["CoursePrefDetailed"],
-                    running_style=None
-                )
-
-                # --- HWTR Build and Insert ---
-                try:
-                    season = None
-                    for r in horse_data["RawRows"]:
-                        cols = r.find_all("td")
-                        if len(cols) >= 3:
-                            try:
-                                date_str = cols[2].get_text().strip()
-                                date_obj = parse_hkjc_date(date_str)
-                                if not date_obj:
-                                    log("WARNING", f"Unable to parse date '{date_str}' for season detection; skipping row")
-                                    continue
-                                season = get_season_code(date_obj)
-                                break
-                            except Exception:
-                                continue
-
-                    if season:
-                        hwtr_data = build_hwtr_per_class(horse_data["RawRows"], horse_data["HorseID"])
-                        upsert_hwtr_trend(hwtr_data)
-                        log("DEBUG", f"HWTR data generated: {len(hwtr_data)} rows")
-
-                        # --- Horse Rating snapshot upsert (minimal) ---
-                        try:
-                            rows = [r.find_all("td") for r in horse_data["RawRows"]]
-                            rows = [c for c in rows if len(c) > 8 and c[2].get_text(strip=True)]
-
-                            def _parse_iso(dmy):
-                                from datetime import datetime
-                                s = dmy.strip()
-                                for fmt in ("%d/%m/%y", "%d/%m/%Y"):
-                                    try:
-                                        return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
-                                    except:
-                                        pass
-                                return None
-
-                            parsed = []
-                            for c in rows:
-                                date_txt = c[2].get_text(strip=True)
-                                iso = _parse_iso(date_txt)
-                                rating_txt = c[8].get_text(strip=True) if len(c) > 8 else ""
-                                try:
-                                    rating_val = float(rating_txt) if rating_txt else None
-                                except:
-                                    rating_val = None
-                                if iso and rating_val is not None:
-                                    parsed.append((iso, rating_val))
-
-                            if parsed:
-                                parsed.sort(key=lambda x: x[0])  # ascending by date
-                                rating_start_career = parsed[0][1]
-
-                                from datetime import datetime
-                                def _season_code(iso):
-                                    dt = datetime.strptime(iso, "%Y-%m-%d")
-                                    return f"{dt.year%100:02d}/{(dt.year+1)%100:02d}" if dt.month >= 9 else f"{(dt.year-1)%100:02d}/{dt.year%100:02d}"
-
-                                season_start = next((rv for iso, rv in parsed if _season_code(iso) == season), parsed[0][1])
-                                rating_start_season = season_start
-
-                                as_of_date, official_rating = parsed[-1]
-
-                                upsert_horse_rating(
-                                    horse_id=horse_data["HorseID"],
-                                    season=season,
-                                    as_of_date=as_of_date,
-                                    official_rating=official_rating,
-                                    rating_start_season=rating_start_season,
-                                    rating_start_career=rating_start_career
-                                )
-                        except Exception as e:
-                            log("ERROR", f"Failed to upsert horse_rating for {horse_data.get('HorseID')}: {e}")
-
-                        # ✅ INSERT DISTANCE PREF HERE
-                        upsert_distance_pref(
-                            horse_id=horse_data["HorseID"],
-                            season=season,
-                            distance_pref=horse_data["DistancePrefDetailed"]
-                        )
-
-                except Exception as e:
-                    log("ERROR", f"Failed to insert HWTR for {horse_id}: {e}")
-
-                # 2) Preferences tables
-                upsert_distance_pref(
-                    horse_id=horse_data["HorseID"],
-                    season=season,
-                    distance_pref=horse_data["DistancePrefDetailed"]
-                )
-
-                upsert_going_pref(
-                    horse_id=horse_data["HorseID"],
-                    going_pref_dict=horse_data["GoingPrefSeasonal"]
-                )
+                persist_horse_data(horse_id, horse_data, timer)
+                mark_done(run_id, horse_id)
+                clear_dead_letter(horse_id)
+                log("INFO", f"Processed: {horse_id}")
+                status = "done"
+                success += 1
+            else:
+                log("WARNING", f"No data: {horse_id}")
+                mark_failed(run_id, horse_id, "No data")
+                failure += 1
 
-                upsert_course_pref(
-                    horse_id=horse_data["HorseID"],
-                    course_pref=horse_data["CoursePrefDetailed"]
-                )
+        except HorseTimeout as e:
+            mark_failed(run_id, horse_id, e)
+            timed_out.append(horse_id)
+            status = "timeout"
 
-                upsert_horse_jockey_combo(
-                    horse_id=horse_data["HorseID"],
-                    rows=horse_data["RawRows"]
-                )
+        except Exception as e:
+            import traceback
+            log("ERROR", traceback.format_exc())
+            log("ERROR", f"Critical error processing {horse_id}: {e}")
+            mark_failed(run_id, horse_id, e)
+            record_dead_letter(horse_id, e, run_id=run_id)
+            failure += 1
 
-                # Class Jump Preference
-                try:
-                    class_jump_stats = build_class_jump_pref(horse_data["RawRows"])
-                    upsert_class_jump_pref(horse_data["HorseID"], class_jump_stats)
-                except Exception as e:
-                    log("ERROR", f"Failed to update Class Jump Pref for {horse_data['HorseID']}: {e}")
+        METRICS.finish(horse_id, status)
+        MEMORY.sample(horse_id)
 
-                # Debug/verify: display newest → oldest seasons for Class Jump (no schema change)
-                if DEBUG_LEVEL in ("DEBUG", "TRACE"):
-                    try:
-                        from special._horse_dynamic_stats_special import fetch_class_jump_pref_ordered
-                        ordered = fetch_class_jump_pref_ordered(horse_data["HorseID"])
-                        log("DEBUG", f"ClassJump (newest→oldest) for {horse_data['HorseID']}: {ordered}")
-                    except Exception as qerr:
-                        log("DEBUG", f"ClassJump verify query failed: {qerr}")
-
-                trainer_combo = build_trainer_combo(horse_data["RawRows"])
-                upsert_trainer_combo(
-                    horse_id=horse_data["HorseID"],
-                    trainer_combo_dict=trainer_combo
-                )
+    return success, failure, timed_out
 
-                # ✅ Weight Preference
-                weight_race_history = []
-                log("TRACE", f"Total races in RawRows: {len(horse_data['RawRows'])}")
+def _run_pipelined(run_id, horse_ids, fetch_workers, parse_workers, queue_size):
+    """Same contract as _run_sequential()."""
+    invalid = []
+    timed_out = []
 
-                for row in horse_data["RawRows"]:
-                    cols = row.find_all("td")
-                    if len(cols) < 14:
-                        log("DEBUG", f"Skipping incomplete row: only {len(cols)} columns")
-                        continue
+    def _work_items():
+        # Consumed by the fetch threads (run_pipeline serializes next())
+        for horse_id in horse_ids:
+            mark_started(run_id, horse_id)
+            if not is_valid_horse_id(horse_id):
+                log("WARNING", f"Skipping invalid HorseID: {horse_id}")
+                mark_failed(run_id, horse_id, "Invalid HorseID")
+                invalid.append(horse_id)
+                continue
+            yield horse_id
+
+    def _write(horse_id, horse_data):
+        if not horse_data:
+            raise ValueError("No data")
+        timer = METRICS.timer(horse_id)
+        timer.merge(horse_data.stage_seconds)
+        persist_horse_data(horse_id, horse_data, timer)
+        mark_done(run_id, horse_id)
+        clear_dead_letter(horse_id)
+        log("INFO", f"Processed: {horse_id}")
+        METRICS.finish(horse_id, "done")
+        MEMORY.sample(horse_id)
+
+    def _fail(horse_id, error):
+        if isinstance(error, HorseTimeout):
+            log("WARNING", f"Timed out: {error}")
+            timed_out.append(horse_id)
+        else:
+            log("ERROR", f"Critical error processing {horse_id}: {error}")
+            record_dead_letter(horse_id, error, run_id=run_id)
+        mark_failed(run_id, horse_id, error)
+        METRICS.finish(horse_id, "timeout" if isinstance(error, HorseTimeout) else "failed")
+        MEMORY.sample(horse_id)
+
+    # --fetch-workers is the ceiling; the limiter finds the sustainable level
+    HORSE_PAGE_LIMITER.max_limit = max(1, fetch_workers)
+    success, failure = run_pipeline(
+        _work_items(), ChromeFetcher, parse_horse_page, _write, _fail,
+        fetch_workers=fetch_workers, parse_workers=parse_workers, queue_size=queue_size,
+    )
+    log_child_peak("parse workers")
+    return success, failure - len(timed_out) + len(invalid), timed_out
+
+def run_batch(input_path="horse_ids_to_update.csv", resume=False, max_attempts=DEFAULT_MAX_ATTEMPTS,
+              fetch_workers=1, parse_workers=0, queue_size=32):
+    """
+    Scrape every horse in ``input_path``, journaling progress per horse.
+    With resume=True, horses already finished by the last interrupted run
+    over the same file are skipped and failed ones are retried.
+    parse_workers > 0 switches to the staged fetch/parse/write pipeline.
+    """
+    horse_ids = HorseIdStream(input_path)
+    run_id = start_run(input_path, resume=resume)
+    METRICS.start(run_id)
 
-                    placing = clean_placing(cols[1].get_text())
-                    date_str = sanitize_text(cols[2].get_text())
-                    actual_wt_str = sanitize_text(cols[13].get_text())
-                    try:
-                        actual_wt = float(actual_wt_str) if actual_wt_str else None
-                    except ValueError:
-                        log("WARNING", f"Invalid weight value: {actual_wt_str}")
-                        continue
-                    distance_str = sanitize_text(cols[4].get_text())
-                    course_info = sanitize_text(cols[3].get_text())
-            
-                    if not actual_wt or not distance_str.isdigit():
-                        log("DEBUG", f"Skipping - missing ActualWT or distance at date {date_str}")
-                        continue
+    log("INFO", f"\nStarting batch update at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log("INFO", "Database tables initialized with LastRaceDate support")
+    reap_orphaned_browsers()
+
+    def _run(pending):
+        if parse_workers > 0:
+            return _run_pipelined(run_id, pending, fetch_workers, parse_workers, queue_size)
+        return _run_sequential(run_id, pending)
+
+    success, failure, timed_out = _run(iter_unfinished(run_id, horse_ids, max_attempts=max_attempts))
+
+    # Requeue timed-out horses at the end of the batch while attempts remain
+    requeue_round = 0
+    while timed_out:
+        retry = list(iter_unfinished(run_id, timed_out, max_attempts=max_attempts))
+        for horse_id in set(timed_out) - set(retry):
+            record_dead_letter(horse_id, HorseTimeout(f"Timed out {max_attempts} times"), run_id=run_id)
+        failure += len(timed_out) - len(retry)
+        if not retry:
+            break
+        delay = backoff_delay(requeue_round)
+        requeue_round += 1
+        log("INFO", f"[WATCHDOG] Requeueing {len(retry)} timed-out horses in {delay:.1f}s")
+        time.sleep(delay)
+        reap_orphaned_browsers()
+        more_success, more_failure, timed_out = _run(retry)
+        success += more_success
+        failure += more_failure
+
+    log("INFO", f"\nSummary: {success} succeeded, {failure} failed out of {horse_ids.count}")
+    log("INFO", f"[JOURNAL] Run {run_id}: {run_summary(run_id)}")
+    PAGE_COSTS.log_summary()
+    MEMORY.log_summary()
+    METRICS.log_summary()
+    for name, m in limiter_metrics().items():
+        log("INFO", f"[AIMD] {name}: limit={m['limit']} error_rate={m['error_rate']:.0%} "
+                    f"p95={m['p95']}s")
+    if has_unfinished(run_id, max_attempts=max_attempts):
+        log("INFO", f"[JOURNAL] Run {run_id} has retryable failures, rerun with --resume")
+    else:
+        finish_run(run_id)
+
+    # Merge unchanged re-scrapes so version history stays bounded
+    try:
+        compact_pref_versions()
+    except Exception as e:
+        log("ERROR", f"Version compaction failed: {e}")
+    log("INFO", f"Batch completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    return run_id
+
+def bench_browser_profiles(input_path, pages=5):
+    """Fetch the first ``pages`` horses with a default and a lean browser and log the savings."""
+    urls = [horse_page_url(h) for h in islice(HorseIdStream(input_path), pages)]
+    profiles = {
+        "full": dict(block_resources=False, page_load_strategy="normal"),
+        "lean": dict(block_resources=True, page_load_strategy="eager"),
+    }
+    drivers = {}
+
+    def _fetch(url, name, meter):
+        if name not in drivers:
+            drivers[name] = new_chrome_driver(**profiles[name])
+        fetch_horse_html(url, drivers[name], meter=meter)
 
-                    if placing is None:
-                        log("DEBUG", f"Skipping -  invalid placing '{cols[1].get_text()}' at date {date_str}")
-                        continue
+    try:
+        return compare_profiles(_fetch, urls, list(profiles))
+    finally:
+        for driver in drivers.values():
+            close_driver(driver)
+
+def bench_parsers(paths, repeat=3):
+    """Time the parser backends on saved horse pages and check their rows agree."""
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            pages.append(fh.read())
+    return html_parser.bench_backends(pages, RACE_TABLE_SELECTORS, repeat=repeat, clean=strip_non_ascii)
+
+def run_dead_letters(**batch_kwargs):
+    """Reprocess only the dead-lettered horses; each success leaves the list."""
+    path, count = export_dead_letters()
+    if not count:
+        log("INFO", "[DEAD LETTER] Nothing to reprocess")
+        return None
+    log("INFO", f"[DEAD LETTER] Reprocessing {count} horses from {path}")
+    return run_batch(path, **batch_kwargs)
 
-                    try:
-                        race_date = parse_hkjc_date(date_str)
-                        if not race_date:
-                            log("WARNING", f"Unable to parse date '{date_str}' for weight preference; skipping row")
-                            continue
-                        season_code = get_season_code(race_date)
-                        
-                        # Parse course info to get race course and type
-                        if "AWT" in course_info:
-                            race_course = "ST"
-                            course_type = "AWT"
-                        else:
-                            parts = course_info.split("/")
-                            race_course = parts[0].strip() if len(parts) > 0 else "Unknown"
-                            course_type = parts[2].strip() if len(parts) > 2 else "Turf"
-
-                        distance = int(distance_str)
-                        distance_group = get_distance_group(race_course, course_type, distance)
-                        if distance_group == "Unknown":
-                            log("WARNING", f"Unknown distance group for {race_course}/{course_type} {distance}m")
-
-                        weight_race_history.append({
-                            "season": season_code,
-                            "finish": placing,
-                            "actual_wt": float(actual_wt),
-                            "distance_group": distance_group,
-                            "race_course": race_course,
-                            "course_type": course_type,
-                            "distance": distance
-                        })
-                    except Exception as e:
-                        log("WARNING", f"Failed to parse race data: {e}")
-
-                # INSERT DEBUG CODE RIGHT HERE (after the loop ends)
-                log("DEBUG", f"\nCollected {len(weight_race_history)} weight records")
-                if weight_race_history:
-                    log("TRACE", "First 3 weight records:")
-                    for i, record in enumerate(weight_race_history[:3]):
-                        log("TRACE", f"Record {i+1}:")
-                        log("TRACE", f"  Season: {record['season']}")
-                        log("TRACE", f"  Finish: {record['finish']}")
-                        log("TRACE", f"  ActualWT: {record['actual_wt']} (Type: {type(record['actual_wt'])})")
-                        log("TRACE", f"  DistanceGroup: {record['distance_group']}")
-                        log("TRACE", f"  Course: {record['race_course']}/{record['course_type']}")
-                        log("TRACE", f"  Distance: {record['distance']}m")
-                
-                # ✅ Sort RawRows by race date descending (latest first)
-                def _key_date(row):
-                    try:
-                        txt = row.find_all("td")[2].get_text(strip=True)
-                        return parse_hkjc_date(txt) or datetime.min.date()
-                    except Exception:
-                        return datetime.min.date()
-
-                sorted_raw_rows = sorted(
-                    horse_data["RawRows"],
-                    key=_key_date,
-                    reverse=True  # Newest first
-                )
-                # Then use this sorted list for BWR processing
-                try:
-                    bwr_perf = build_bwr_distance_perf(sorted_raw_rows)
-                    upsert_bwr_distance_perf(
-                        horse_id=horse_data["HorseID"], 
-                        bwr_perf_list=bwr_perf
-                    )              
-                except Exception as e:
-                    log("ERROR", f"Failed to update BWR Distance Pref for {horse_id}: {e}")    
-                    try:
-                        if sorted_raw_rows:
-                            newest_date = sorted_raw_rows[0].find_all("td")[2].get_text(strip=True)
-                            oldest_date = sorted_raw_rows[-1].find_all("td")[2].get_text(strip=True)
-                            log("DEBUG", f"Processing {len(sorted_raw_rows)} races")
-                            log("DEBUG", f"Date range: {newest_date} (newest) to {oldest_date} (oldest)")
-                    except Exception as debug_e:
-                        log("DEBUG", f"Couldn't get debug info: {debug_e}")
-
-                # Optional: assign for weight functions if used elsewhere
-                weight_race_history = sorted(
-                    horse_data["RawRows"],
-                    key=lambda row: (
-                        parse_hkjc_date(row.find_all("td")[2].get_text(strip=True)) or datetime.min.date()
-                    ),
-                    reverse=True  # This ensures newest races come first
-                )
-                
-                # Build & Upsert
-                weight_pref = build_weight_pref_from_dict(weight_race_history, horse_data["HorseID"])
-                log("DEBUG", f"\nSending {len(weight_race_history)} races to build_weight_pref_from_dict")
-
-                # Ensure data consistency (optional safety check)
-                for row in weight_pref:
-                    row["HorseID"] = horse_data["HorseID"]  # Already set by build_weight_pref_from_dict, but kept for safety
-                    row["Season"] = str(row.get("Season", "Unknown"))  # Force string type
-
-                upsert_weight_pref(horse_id=horse_data["HorseID"], weight_pref_list=weight_pref)
-                
-                # ✅ BWR × Distance Preference
-                try:
-                    # ✅ Sort RawRows by race date descending
-                    bwr_perf = build_bwr_distance_perf(sorted_raw_rows)
-                    upsert_bwr_distance_perf(horse_id=horse_data["HorseID"], bwr_perf_list=bwr_perf)              
-                except Exception as e:
-                    log("ERROR", f"Failed to update BWR Distance Pref for {horse_id}: {e}")
+def run_queue_worker(worker_id=None, shard_path=None, batch_size=5,
+                     lease_seconds=job_queue.DEFAULT_LEASE_SECONDS,
+                     max_attempts=job_queue.DEFAULT_MAX_ATTEMPTS, poll_seconds=30):
+    """
+    Claim batches from the shared job queue until it is drained. Results go
+    to ``shard_path`` (merge later with --merge) or, without one, straight
+    into the main DB. Returns (success, failure).
+    """
+    worker_id = worker_id or job_queue.default_worker_id()
+    if shard_path:
+        main_path = stats.DB_PATH
+        use_shard(shard_path)
+        init_shard_schema(main_path)  # seeds the field-size cache too
+    else:
+        init_database()
+    job_queue.create_job_queue_table()
+    reap_orphaned_browsers()
+
+    log("INFO", f"[QUEUE] Worker {worker_id} started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    memory = MemoryMeter(f"worker {worker_id}")
+    METRICS.start(f"{worker_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    success = 0
+    failure = 0
 
-                # Draw preference
-                try:
-                    draw_pref_dict = build_draw_pref(horse_data["RawRows"])
-                    upsert_draw_pref(horse_data["HorseID"], draw_pref_dict)
-                    if DEBUG_LEVEL in ("DEBUG", "TRACE"):
-                        from special._horse_dynamic_stats_special import fetch_draw_pref_ordered
-                        ordered = fetch_draw_pref_ordered(horse_data["HorseID"])
-                        log("DEBUG", f"DrawPref (newest first) for {horse_data['HorseID']}: {ordered[:3]}")
-                except Exception as e:
-                    log("ERROR", f"Failed to update draw pref for {horse_data['HorseID']}: {e}")
+    with job_queue.LeaseHeartbeat(worker_id, lease_seconds) as hb:
+        while True:
+            batch = job_queue.claim_batch(worker_id, batch_size, lease_seconds, max_attempts)
+            if not batch:
+                if not job_queue.has_open_jobs(max_attempts):
+                    break
+                # Other workers still hold leases: wait for them to finish or expire
+                time.sleep(poll_seconds)
+                continue
 
-                # Running Style Preference (aggregated from horse_running_position)
+            hb.track(batch)
+            for horse_id in batch:
+                if not is_valid_horse_id(horse_id):
+                    log("WARNING", f"Skipping invalid HorseID: {horse_id}")
+                    job_queue.fail_job(worker_id, horse_id, "Invalid HorseID", max_attempts=0)
+                    failure += 1
+                    continue
+                timer = METRICS.timer(horse_id)
+                status = "failed"
                 try:
-                    upserts, groups = rebuild_running_style_pref(horse_id)
-                    if DEBUG_LEVEL in ("DEBUG", "TRACE"):
-                        log("DEBUG", f"RunningStylePref updated for {horse_id}: {upserts} rows across {groups} groups")
-                        try:
-                            from special._horse_dynamic_stats_special import fetch_running_style_pref_ordered
-                            ordered = fetch_running_style_pref_ordered(horse_id)
-                            # Display seasons in proper order
-                            seasons = sorted(set(row[1] for row in ordered), 
-                                        key=lambda s: int(s[:2]), 
-                                        reverse=True)
-                            log("DEBUG", f"RunningStylePref seasons (newest→oldest): {seasons}")
-                            log("DEBUG", f"Sample style data: {ordered[0] if ordered else 'None'}")    
-                        except Exception as qerr:
-                            log("DEBUG", f"RunningStylePref verify query failed: {qerr}")
+                    log("INFO", f"\nProcessing: {horse_id}")
+                    horse_data = extract_dynamic_stats(horse_page_url(horse_id), timer=timer)
+                    if not horse_data:
+                        raise ValueError("No data")
+                    persist_horse_data(horse_id, horse_data, timer)
+                    job_queue.complete_job(worker_id, horse_id, shard=stats.DB_PATH)
+                    log("INFO", f"Processed: {horse_id}")
+                    status = "done"
+                    success += 1
                 except Exception as e:
-                    log("ERROR", f"Failed to update running_style_pref for {horse_id}: {e}")
-
-                # Jockey-Trainer combo
-                jt_combo_map = defaultdict(lambda: {"top3": 0, "total": 0, "last_date": None})
-
-                for row in horse_data["RawRows"]:
-                    cols = row.find_all("td")
-                    if len(cols) < 11:
-                        continue
-
-                    place_text = sanitize_text(cols[1].get_text())
-                    place_clean = re.sub(r'[^\d]', '', place_text)
-                    placing = int(place_clean) if place_clean.isdigit() else None
-
-                    date_str = sanitize_text(cols[2].get_text())
-                    trainer = sanitize_text(cols[9].get_text()) if len(cols) > 9 else None
-                    jockey = sanitize_text(cols[10].get_text()) if len(cols) > 10 else None
-                    
-                    if placing is None or not jockey or not trainer:
-                        continue
-
-                    race_date = parse_hkjc_date(date_str)
-                    if not race_date:
-                        log("WARNING", f"Unable to parse date '{date_str}' for jockey-trainer combo; skipping row")
-                        continue
-                    season_code = get_season_code(race_date)
-
-                    key = (season_code, jockey, trainer)
-                    jt_combo_map[key]["total"] += 1
-                    if placing in [1, 2, 3]:
-                        jt_combo_map[key]["top3"] += 1
-
-                    current_last = jt_combo_map[key]["last_date"]
-                    if current_last is None or race_date > current_last:
-                        jt_combo_map[key]["last_date"] = race_date
-
-                for (season, jockey, trainer), result in jt_combo_map.items():
-                    top3 = result["top3"]
-                    total = result["total"]
-                    # Store ISO for DB; keep display string separate if needed
-                    last_date_iso = result["last_date"].strftime("%Y-%m-%d") if result["last_date"] else None
-                    _last_date_display = result["last_date"].strftime("%d/%m/%y") if result["last_date"] else None
-
-                    upsert_jockey_trainer_combo(
-                        horse_id=horse_data["HorseID"],
-                        season=season,
-                        jockey=jockey,
-                        trainer=trainer,
-                        top3_count=top3,
-                        total_runs=total,
-                        last_race_date=last_date_iso,
-                    )
-
-                log("INFO", f"Processed: {horse_id}")
-                success += 1
-            else:
-                log("WARNING", f"No data: {horse_id}")
-                failure += 1
+                    log("ERROR", f"Critical error processing {horse_id}: {e}")
+                    job_queue.fail_job(worker_id, horse_id, e, max_attempts=max_attempts)
+                    if isinstance(e, HorseTimeout):
+                        status = "timeout"
+                    failure += 1
+                METRICS.finish(horse_id, status)
+                memory.sample(horse_id)
+            hb.track([])
+
+    log("INFO", f"[QUEUE] Worker {worker_id} done: {success} succeeded, {failure} failed")
+    memory.log_summary()
+    METRICS.log_summary()
+    return success, failure
+
+def run_sharded(input_path, workers, batch_size=5, max_attempts=job_queue.DEFAULT_MAX_ATTEMPTS):
+    """
+    Full refresh with ``workers`` local processes, each writing to its own
+    shard DB (no lock contention on the main file), then one merge.
+    """
+    import multiprocessing
+    import socket
+
+    job_queue.enqueue_horses(HorseIdStream(input_path), requeue=True)
+
+    worker_ids = [f"{socket.gethostname()}-local{i}" for i in range(workers)]
+    shards = [shard_path_for(w) for w in worker_ids]
+    for path in shards:
+        if os.path.exists(path):
+            os.remove(path)  # stale rows from an earlier run must not be merged again
+
+    procs = [
+        multiprocessing.Process(
+            target=run_queue_worker, name=w,
+            kwargs=dict(worker_id=w, shard_path=path, batch_size=batch_size,
+                        max_attempts=max_attempts, poll_seconds=5))
+        for w, path in zip(worker_ids, shards)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        if p.exitcode:
+            log("ERROR", f"[SHARD] Worker {p.name} exited with code {p.exitcode}")
+    log_child_peak("shard workers")
+
+    init_database()
+    merged = merge_shards(shards)
+    log("INFO", f"[QUEUE] {job_queue.queue_status()}")
+    return merged
 
-        except Exception as e:
-            import traceback
-            log("ERROR", traceback.format_exc())
-            log("ERROR", f"Critical error processing {horse_id}: {e}")
-            failure += 1
+# -----------------------------
+# MAIN
+# -----------------------------
+def main(argv=None, prog=None):
+    """Scraper command line (also ``_cli_special.py scrape``)."""
+    global BLOCK_RESOURCES, PAGE_LOAD_STRATEGY, EXTRACT_MODE, DEBUG_LEVEL
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="Batch update HKJC horse dynamic stats")
+    parser.add_argument("--input", default="horse_ids_to_update.csv",
+                        help='CSV with a HorseID column, "-" for stdin (CSV or one ID per line) '
+                             'or "recent:N" for horses that raced in the last N days')
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last interrupted run over the same input file")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="attempts per horse before it is left as failed")
+    parser.add_argument("--fetch-workers", type=int, default=1,
+                        help="browser threads (pipeline mode); the AIMD limit adapts up to this")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="parser processes; 0 = fetch, parse and write inline")
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="fetched pages buffered ahead of the parsers")
+    parser.add_argument("--no-block-resources", action="store_true",
+                        help="let Chrome download images, css, fonts and trackers")
+    parser.add_argument("--page-load-strategy", choices=["normal", "eager"], default=PAGE_LOAD_STRATEGY,
+                        help="when driver.get() returns (default %(default)s)")
+    parser.add_argument("--full-dom", action="store_true",
+                        help="ship the whole page HTML instead of extracting the race table in the browser")
+    parser.add_argument("--bench-browser", type=int, metavar="N",
+                        help="compare default vs lean browser on the first N horses of --input and exit")
+    parser.add_argument("--parser", choices=html_parser.BACKENDS,
+                        help="HTML parser backend (default: fastest installed)")
+    parser.add_argument("--bench-parsers", nargs="+", metavar="HTML",
+                        help="time the parser backends on saved pages and exit")
+    parser.add_argument("--dead-letters", action="store_true",
+                        help="reprocess only the horses in the dead_letters table")
+    parser.add_argument("--list-dead-letters", action="store_true",
+                        help="print the dead_letters table and exit")
+
+    # Multi-node: shared job queue + per-worker shard DBs
+    parser.add_argument("--enqueue", action="store_true",
+                        help="add the horses in --input to the job queue and exit")
+    parser.add_argument("--requeue", action="store_true",
+                        help="with --enqueue: reset horses already in the queue")
+    parser.add_argument("--worker", action="store_true",
+                        help="process horses from the job queue until it is drained")
+    parser.add_argument("--merge", nargs="+", metavar="SHARD",
+                        help="merge shard DBs into the main DB and exit")
+    parser.add_argument("--queue", help=f"job queue DB (default {job_queue.QUEUE_DB_PATH})")
+    parser.add_argument("--shard", nargs="?", const="auto",
+                        help="with --worker: write to this shard DB (no value: one per worker id)")
+    parser.add_argument("--worker-id", help="lease owner name (default host:pid)")
+    parser.add_argument("--local-workers", type=int, default=0,
+                        help="full refresh with N local worker processes on shard DBs, then merge")
+    parser.add_argument("--batch-size", type=int, default=5, help="horses claimed per lease")
+    parser.add_argument("--lease-seconds", type=int, default=job_queue.DEFAULT_LEASE_SECONDS,
+                        help="lease length; heartbeats renew it every third of this")
+    parser.add_argument("--log-level", choices=["OFF", "INFO", "DEBUG", "TRACE"],
+                        help="DEBUG_LEVEL for the scraper and the stats builders")
+    parser.add_argument("--json-log", metavar="PATH",
+                        help="also append every log message to PATH as JSON lines")
+    parser.add_argument("--profile-sql", action="store_true",
+                        help="count calls, rows and time per SQL statement in this process and log the top ones")
+    args = parser.parse_args(argv)
+
+    if args.log_level:
+        DEBUG_LEVEL = stats.DEBUG_LEVEL = args.log_level
+    if args.json_log:
+        set_json_log(args.json_log)
+
+    if args.queue:
+        job_queue.QUEUE_DB_PATH = args.queue
+    BLOCK_RESOURCES = not args.no_block_resources
+    PAGE_LOAD_STRATEGY = args.page_load_strategy
+    if args.full_dom:
+        EXTRACT_MODE = "dom"
+    if args.parser:
+        html_parser.PARSER_BACKEND = args.parser
+
+    with profiling(stats, sys.modules[__name__], enabled=args.profile_sql):
+        if args.bench_parsers:
+            bench_parsers(args.bench_parsers)
+        elif args.bench_browser:
+            bench_browser_profiles(args.input, pages=args.bench_browser)
+        elif args.enqueue:
+            job_queue.enqueue_horses(HorseIdStream(args.input), requeue=args.requeue)
+            log("INFO", f"[QUEUE] {job_queue.queue_status()}")
+        elif args.worker:
+            worker_id = args.worker_id or job_queue.default_worker_id()
+            shard = shard_path_for(worker_id) if args.shard == "auto" else args.shard
+            run_queue_worker(worker_id, shard_path=shard, batch_size=args.batch_size,
+                             lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+        elif args.merge:
+            init_database()
+            merge_shards(args.merge)
+        elif args.list_dead_letters:
+            for horse_id, error_type, reason, occurrences, failed_at in list_dead_letters():
+                print(f"{horse_id}\t{failed_at}\tx{occurrences}\t{error_type}: {reason}")
+        elif args.dead_letters:
+            init_database()
+            run_dead_letters(resume=args.resume, max_attempts=args.max_attempts,
+                             fetch_workers=args.fetch_workers, parse_workers=args.parse_workers,
+                             queue_size=args.queue_size)
+        elif args.local_workers > 0:
+            run_sharded(args.input, args.local_workers, batch_size=args.batch_size,
+                        max_attempts=args.max_attempts)
+        else:
+            init_database()
+            run_batch(args.input, resume=args.resume, max_attempts=args.max_attempts,
+                      fetch_workers=args.fetch_workers, parse_workers=args.parse_workers,
+                      queue_size=args.queue_size)
 
-    log("INFO", f"\nSummary: {success} succeeded, {failure} failed out of {len(horse_ids)}")
-    log("INFO", f"Batch completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# -----------------------------
+# SHARD DATABASES
+# -----------------------------
+# Parallel writers on one hkjc_horses_dynamic_special.db serialize on its
+# file lock. In shard mode every worker writes to its own file with the same
+# schema, and merge_shards() folds them back into the main DB: shards are
+# ATTACHed and each table is bulk-copied with INSERT ... SELECT, one
+# transaction per table, using the same conflict rules as the upserts.
+#
+# Every DB helper reads stats.DB_PATH at call time, so use_shard() is all a
+# worker has to do before writing. Cache tables (race_field_size) are seeded
+# from the main DB, or each shard would re-download every LocalResults page.
+
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+from special.utils_special import log
+import _horse_dynamic_stats_special as stats
+
+# Bookkeeping tables that stay local to each DB
+SKIP_TABLES = {"sqlite_sequence", "run_journal", "run_journal_items", "scrape_jobs"}
+
+# Read-through caches copied from the main DB into a new shard
+SEED_TABLES = ("race_field_size",)
+
+# Surrogate row ids: never copied, the main DB assigns its own
+SURROGATE_COLUMNS = {"ID", "VersionID"}
+
+# SQLite's default SQLITE_MAX_ATTACHED
+MAX_ATTACHED = 10
+
+# Table -> (rule, conflict key, {column: UPDATE expression}) mirroring the
+# upsert that writes the table:
+#   "replace" - INSERT OR REPLACE (whole row replaced)
+#   "update"  - INSERT ... ON CONFLICT(key) DO UPDATE SET non-key columns
+#   "append"  - plain INSERT (history-style tables keyed by ID)
+# Tables not listed fall back to "replace".
+MERGE_RULES = {
+    "horse_dynamic_stats": ("replace", None, {}),
+    "race_field_size": ("replace", None, {}),
+    "horse_distance_pref": ("replace", None, {}),
+    "horse_going_pref": ("replace", None, {}),
+    "horse_course_pref": ("replace", None, {}),
+    "horse_jockey_combo": ("replace", None, {}),
+    "horse_hwtr_trend": ("replace", None, {}),
+    "horse_running_style_pref": ("replace", None, {}),
+    "horse_draw_pref": ("append", None, {}),
+    "horse_trainer_combo": ("update", ("HorseID", "Season", "Trainer"), {}),
+    "horse_jockey_trainer_combo": ("update", ("HorseID", "Season", "Jockey", "Trainer"), {}),
+    "horse_bwr_distance_pref": ("update", ("HorseID", "Season", "Distance", "BWRGroup"), {}),
+    "horse_weight_pref": ("update", ("HorseID", "Season", "DistanceGroup", "WeightGroup"), {}),
+    "horse_class_jump_pref": ("update", ("HorseID", "Season", "JumpType"), {}),
+    "horse_rating": ("update", ("HorseID", "Season", "AsOfDate"), {}),
+    "horse_race_history": ("update", ("HorseID", "RaceDate"), {}),
+    "horse_running_position": ("update", ("HorseID", "RaceID"), {
+        # Same as upsert_running_position: keep a known field size
+        "FieldSize": "CASE WHEN horse_running_position.FieldSize IS NULL "
+                     "OR horse_running_position.FieldSize = 0 "
+                     "THEN excluded.FieldSize ELSE horse_running_position.FieldSize END",
+    }),
+}
+
+def shard_path_for(worker_id):
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", worker_id)
+    main = Path(stats.DB_PATH)
+    return str(main.with_name(f"{main.stem}.shard-{safe}{main.suffix}"))
+
+def use_shard(path):
+    """Point every DB helper at ``path`` for the rest of this process."""
+    stats.DB_PATH = str(path)
+    log("INFO", f"[SHARD] Writing to {stats.DB_PATH}")
+    return stats.DB_PATH
+
+def init_shard_schema(main_path=None):
+    """
+    Run every create_*_table() so the shard has the main DB's schema, then
+    copy the SEED_TABLES rows from ``main_path`` (opened read-only).
+    """
+    created = []
+    for name in sorted(dir(stats)):
+        if name.startswith("create_") and name.endswith("_table"):
+            getattr(stats, name)()
+            created.append(name)
+    log("DEBUG", f"[SHARD] Schema ready in {stats.DB_PATH}: {', '.join(created)}")
+    if main_path and os.path.exists(main_path) and \
+            os.path.abspath(main_path) != os.path.abspath(stats.DB_PATH):
+        seed_shard(main_path)
+    return created
+
+def seed_shard(main_path):
+    """Copy the SEED_TABLES rows the main DB has into the current shard; returns {table: rows}."""
+    seeded = {}
+    conn = sqlite3.connect(stats.DB_PATH, uri=True)
+    try:
+        conn.execute("ATTACH DATABASE ? AS main_db", (f"file:{main_path}?mode=ro",))
+        for table in SEED_TABLES:
+            main_cols = set(_table_columns(conn, table, "main_db"))
+            columns = [c for c in _table_columns(conn, table) if c in main_cols]
+            if not columns:
+                continue
+            col_list = ", ".join(columns)
+            cur = conn.execute(f"INSERT OR IGNORE INTO main.{table} ({col_list}) "
+                               f"SELECT {col_list} FROM main_db.{table}")
+            seeded[table] = max(cur.rowcount, 0)
+        conn.commit()
+        conn.execute("DETACH DATABASE main_db")
+    finally:
+        conn.close()
+    log("INFO", f"[SHARD] Seeded from {main_path}: {seeded}")
+    return seeded
+
+def _table_columns(conn, table, schema="main"):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def _merge_sql(table, columns, schema):
+    rule, key, overrides = MERGE_RULES.get(table, ("replace", None, {}))
+    col_list = ", ".join(columns)
+    select = f"SELECT {col_list} FROM {schema}.{table}"
+    if rule == "replace":
+        return f"INSERT OR REPLACE INTO main.{table} ({col_list}) {select}"
+    if rule == "append":
+        return f"INSERT INTO main.{table} ({col_list}) {select}"
+    updates = ", ".join(
+        f"{c} = {overrides.get(c, f'excluded.{c}')}" for c in columns if c not in key)
+    # "WHERE true" keeps the SELECT's ON from being parsed as a join clause
+    return (f"INSERT INTO main.{table} ({col_list}) {select} WHERE true "
+            f"ON CONFLICT({', '.join(key)}) DO UPDATE SET {updates}")
+
+def _merge_group(conn, shard_paths, merged):
+    schemas = []
+    for i, path in enumerate(shard_paths):
+        schema = f"shard{i}"
+        conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+        schemas.append(schema)
+
+    try:
+        tables = {}
+        for schema in schemas:
+            for name, ddl in conn.execute(
+                    f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'table'"):
+                if name not in SKIP_TABLES and not name.endswith("_versions"):
+                    tables.setdefault(name, ddl)
+
+        for table in sorted(tables):
+            if not _table_columns(conn, table):
+                conn.execute(re.sub(r"^CREATE TABLE\s+", "CREATE TABLE IF NOT EXISTS ",
+                                    tables[table], flags=re.I))
+            main_cols = set(_table_columns(conn, table))
+
+            # One transaction per table across the whole group of shards
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for schema in schemas:
+                    shard_cols = _table_columns(conn, table, schema)
+                    columns = [c for c in shard_cols
+                               if c in main_cols and c not in SURROGATE_COLUMNS]
+                    if not columns:
+                        continue
+                    cur = conn.execute(_merge_sql(table, columns, schema))
+                    merged[table] = merged.get(table, 0) + max(cur.rowcount, 0)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        for schema in schemas:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+def merge_shards(shard_paths, main_path=None):
+    """
+    Fold shard DBs into the main DB. Shards are applied oldest first (by
+    file mtime), so if a horse was scraped twice after a lease expired the
+    newer result wins. Tables missing from the main DB are created from the
+    shard's DDL. Returns {table: rows merged}.
+    """
+    main_path = main_path or stats.DB_PATH
+    shard_paths = sorted((p for p in shard_paths if os.path.exists(p)), key=os.path.getmtime)
+    merged = {}
+
+    conn = sqlite3.connect(main_path, timeout=60, isolation_level=None)
+    try:
+        for start in range(0, len(shard_paths), MAX_ATTACHED):
+            group = shard_paths[start:start + MAX_ATTACHED]
+            _merge_group(conn, group, merged)
+            log("INFO", f"[SHARD] Merged {len(group)} shards into {main_path}")
+    finally:
+        conn.close()
+
+    log("INFO", f"[SHARD] Merge complete: {merged}")
+    return merged
@@ -0,0 +1,268 @@
+# -----------------------------
+# SQLITE STATEMENT PROFILE / QUERY PLAN AUDIT
+# -----------------------------
+# Two tools for the SQLite side of a run:
+#
+#   install(stats, scraper)  swaps the ``sqlite3`` name inside those modules
+#       for a shim whose connect() returns a ProfilingConnection, so every
+#       execute / executemany / executescript, on a cursor or through the
+#       conn.execute() shortcuts, adds its calls, rows and seconds
+#       to PROFILE under its whitespace-normalised SQL text. Rows are the
+#       rows fetched for a SELECT and rowcount for writes; seconds include
+#       the fetches. PROFILE.log_report() prints the top statements by time;
+#       ``with profiling(stats, scraper):`` does both around a block.
+#
+#   audit_query_plans()  runs EXPLAIN QUERY PLAN on every query registered
+#       with register_read_query() (the fetch_*_ordered reads, the running
+#       style rebuild, the race_field_size lookup) and flags
+#         scan        "SCAN <table>" without an index, i.e. a full table scan
+#         temp_btree  "USE TEMP B-TREE FOR ..." - a sort SQLite cannot take
+#                     from an index
+#       A query may list the findings it is known to live with (expect=);
+#       anything else is reported as unexpected, so a dropped index or a
+#       rewritten WHERE shows up before it shows up in run_metrics.
+#
+# Nothing is wrapped unless install() is called; the audit only reads.
+
+import sqlite3 as _sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from special.utils_special import log
+
+def normalize_sql(sql):
+    return " ".join(sql.split())
+
+class SqlProfile:
+    """Calls, rows and seconds per SQL text; thread-safe."""
+
+    def __init__(self):
+        self._stats = {}  # sql -> [calls, rows, seconds]
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows=0, calls=1):
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = [0, 0, 0.0]
+            entry[0] += calls
+            entry[1] += rows
+            entry[2] += seconds
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def report(self, top=None):
+        """[(sql, calls, rows, seconds)], most total time first."""
+        with self._lock:
+            items = [(sql, *entry) for sql, entry in self._stats.items()]
+        items.sort(key=lambda item: item[3], reverse=True)
+        return items[:top] if top else items
+
+    def log_report(self, top=20, width=90):
+        items = self.report()
+        if not items:
+            return
+        total = sum(seconds for _, _, _, seconds in items)
+        log("INFO", f"[SQL] {len(items)} statements, {sum(i[1] for i in items)} calls, {total:.2f}s")
+        log("INFO", f"[SQL] {'calls':>7} {'rows':>9} {'sum':>8} {'mean':>9}  statement")
+        for sql, calls, rows, seconds in items[:top]:
+            text = sql if len(sql) <= width else sql[:width - 3] + "..."
+            log("INFO", f"[SQL] {calls:>7} {rows:>9} {seconds:>7.2f}s {seconds / calls * 1000:>7.2f}ms  {text}")
+
+PROFILE = SqlProfile()
+
+class ProfilingCursor(_sqlite3.Cursor):
+    """Cursor that charges execute and fetch time to the statement it ran."""
+
+    profile = PROFILE
+
+    def _run(self, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            seconds = time.perf_counter() - started
+            rows = 0 if self.description is not None else max(self.rowcount, 0)
+            self._sql = sql
+            self.profile.record(sql, seconds, rows)
+
+    def execute(self, sql, parameters=()):
+        return self._run(_sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(_sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(_sqlite3.Cursor.executescript, sql_script)
+
+    def _fetched(self, started, rows):
+        sql = getattr(self, "_sql", None)
+        if sql is not None:
+            self.profile.record(sql, time.perf_counter() - started, rows, calls=0)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+class ProfilingConnection(_sqlite3.Connection):
+    # The C shortcuts build a plain Cursor internally, so route them
+    # through cursor() to keep conn.execute(...) callers profiled
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+class _ProfilingSqlite3:
+    """Stands in for the sqlite3 module: connect() profiles, the rest is sqlite3."""
+
+    def connect(self, *args, **kwargs):
+        kwargs.setdefault("factory", ProfilingConnection)
+        return _sqlite3.connect(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(_sqlite3, name)
+
+_installed = []  # modules whose sqlite3 was swapped
+
+def install(*modules):
+    """Profile every connection the given modules open from now on."""
+    shim = _ProfilingSqlite3()
+    for module in modules:
+        if not isinstance(getattr(module, "sqlite3", None), _ProfilingSqlite3):
+            module.sqlite3 = shim
+            _installed.append(module)
+
+def uninstall():
+    while _installed:
+        _installed.pop().sqlite3 = _sqlite3
+
+@contextmanager
+def profiling(*modules, enabled=True, top=20):
+    """install() for the block, then log the top statements and uninstall()."""
+    if not enabled:
+        yield None
+        return
+    install(*modules)
+    try:
+        yield PROFILE
+    finally:
+        PROFILE.log_report(top)
+        uninstall()
+
+# -----------------------------
+# EXPLAIN QUERY PLAN AUDIT
+# -----------------------------
+
+READ_QUERIES = {}  # name -> (sql, sample params, accepted finding kinds)
+
+def register_read_query(name, sql, params=(), expect=()):
+    """Register a read query for audit_query_plans(); returns ``sql`` unchanged."""
+    READ_QUERIES[name] = (sql, params, tuple(expect))
+    return sql
+
+def plan_findings(plan):
+    """[(kind, detail)] for the full scans and temp B-tree sorts in a plan."""
+    findings = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and " USING " not in detail and "CONSTANT ROW" not in detail:
+            # "SCAN (subquery-1)" / co-routines are the outer side of a
+            # subquery; the table scans inside them are listed separately
+            if not detail.startswith("SCAN (") and "CO-ROUTINE" not in detail:
+                findings.append(("scan", detail))
+        elif "USE TEMP B-TREE" in detail:
+            findings.append(("temp_btree", detail))
+    return findings
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN details, indented by depth."""
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    depth = {0: -1}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+    return plan
+
+def audit_query_plans(db_path=None, names=None):
+    """
+    {name: {"plan", "findings", "unexpected", "error"}} for every registered
+    query (or just ``names``), planned against db_path opened read-only.
+    """
+    if db_path is None:
+        import _horse_dynamic_stats_special as stats
+        db_path = stats.DB_PATH
+    conn = _sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    results = {}
+    try:
+        for name, (sql, params, expect) in READ_QUERIES.items():
+            if names and name not in names:
+                continue
+            result = results[name] = {"plan": [], "findings": [], "unexpected": [], "error": None}
+            try:
+                result["plan"] = explain(conn, sql, params)
+            except _sqlite3.Error as e:
+                result["error"] = str(e)
+                continue
+            result["findings"] = plan_findings(d.strip() for d in result["plan"])
+            result["unexpected"] = [f for f in result["findings"] if f[0] not in expect]
+    finally:
+        conn.close()
+    return results
+
+def log_audit(results, verbose=False):
+    """Log the audit; returns the number of queries with errors or unexpected findings."""
+    bad = 0
+    for name, result in results.items():
+        if result["error"]:
+            bad += 1
+            log("WARNING", f"[SQL AUDIT] {name}: {result['error']}")
+            continue
+        if result["unexpected"]:
+            bad += 1
+            for kind, detail in result["unexpected"]:
+                log("WARNING", f"[SQL AUDIT] {name}: {kind} - {detail}")
+        else:
+            accepted = ", ".join(sorted({kind for kind, _ in result["findings"]}))
+            log("INFO", f"[SQL AUDIT] {name}: ok" + (f" (expected {accepted})" if accepted else ""))
+        if verbose or result["unexpected"]:
+            for line in result["plan"]:
+                log("INFO", f"[SQL AUDIT]     {line}")
+    return bad
@@ -0,0 +1,265 @@
+# -----------------------------
+# SYNTHETIC HKJC PAGES
+# -----------------------------
+# Benchmarks and tests need horse pages without hitting HKJC. The generator
+# here writes N horses x M races of seeded, repeatable pages in the shapes
+# the scraper reads:
+#   - OtherHorse.aspx: a profile block plus the race history table, either
+#     the current 'f_tac f_fs12 js_race_tab' table or the older bigborder
+#     one, with season separator rows;
+#   - the same table as TABLE_ROWS_JS output (what EXTRACT_MODE "table"
+#     gets from the browser), rendered from the same rows;
+#   - LocalResults.aspx: one bigborder results table per race, so field
+#     sizes come from the same counting code as a live run.
+#
+# Rows mix what real histories contain: 19-cell rows, rows without the
+# video column, short 14-cell rows from old pages, overseas runs without a
+# race link, Group / Griffin / 4YO classes, AWT, dd/mm/yyyy, dashed and
+# RTL-marked dates, missing draw / rating / running position / finish time
+# cells and non-finishing placings (WV, PU, DH). Everything derives from
+# the seed, so two runs on the same seed see identical pages.
+
+import html as _html
+import json
+import os
+import random
+from datetime import date, timedelta
+
+RESULTS_URL = "/racing/information/English/Racing/LocalResults.aspx"
+
+HORSE_COLUMNS = [
+    "Race Index", "Pla.", "Date", "RC/Track/ Course", "Dist.", "G", "Race Class",
+    "Dr.", "Rtg.", "Trainer", "Jockey", "LBW", "Win Odds", "Act. Wt.",
+    "Running Position", "Finish Time", "Declar. Horse Wt.", "Gear", "Video Replay",
+]
+
+RESULTS_COLUMNS = [
+    "Pla.", "Horse No.", "Horse", "Jockey", "Trainer", "Act. Wt.",
+    "Declar. Horse Wt.", "Dr.", "LBW", "Running Position", "Finish Time", "Win Odds",
+]
+
+# (course, surface, tracks, distances)
+TRACKS = [
+    ("ST", "Turf", ['"A"', '"A+3"', '"B"', '"B+2"', '"C"', '"C+3"'],
+     [1000, 1200, 1400, 1600, 1800, 2000, 2200, 2400]),
+    ("HV", "Turf", ['"A"', '"B"', '"B+2"', '"C"', '"C+3"'], [1000, 1200, 1650, 1800, 2200, 2400]),
+    ("ST", "AWT", None, [1200, 1650, 1800, 2000]),
+]
+TURF_GOING = ["G", "G", "G", "GF", "GF", "GY", "Y", "S", "F"]
+AWT_GOING = ["WF", "WF", "G", "GF", "WS"]
+CLASSES = ["1", "2", "3", "3", "4", "4", "4", "5", "5", "G1", "G2", "G3", "GRIFFIN", "4YO"]
+NON_FINISHERS = ["WV", "WV-A", "PU", "UR", "FE", "DNF", "TNP"]
+OVERSEAS = [("MEY", "Turf"), ("TOK", "Turf"), ("SIN", "Turf"), ("ASC", "Turf")]
+TRAINERS = ["J Size", "F C Lor", "C S Shum", "P F Yiu", "A S Cruz", "D J Whyte", "C Fownes", "K W Lui"]
+JOCKEYS = ["Z Purton", "H Bowman", "K Teetan", "A Badel", "L Ferraris", "V Borges", "M Chadwick", "C Y Ho"]
+GEAR = ["--", "--", "B", "TT", "B/TT", "H", "XB", "CP-/TT"]
+
+class SyntheticFixtures:
+    """Generated pages, keyed like the live ones."""
+
+    def __init__(self):
+        self.horse_pages = {}    # horse_id -> OtherHorse.aspx HTML
+        self.horse_json = {}     # horse_id -> TABLE_ROWS_JS rows
+        self.results_pages = {}  # (race_date "YYYY/MM/DD", race_no, course) -> LocalResults.aspx HTML
+        self.field_sizes = {}    # same key -> runners
+
+    def horse_url(self, horse_id):
+        return f"https://racing.hkjc.com/racing/information/English/Horse/OtherHorse.aspx?HorseId={horse_id}"
+
+def _cell(text="", href=None):
+    # (text, href): a linked cell's text is the link's text
+    return (text, href)
+
+def _render_cell(cell):
+    text, href = cell
+    inner = _html.escape(text) if text else "&nbsp;"
+    if href is not None:
+        inner = f'<a href="{_html.escape(href)}">{_html.escape(text)}</a>' if text else \
+                f'<a href="{_html.escape(href)}"><img src="/images/video.png" alt=""></a>'
+    return f"<td>{inner}</td>"
+
+def _json_cell(cell):
+    text, href = cell
+    strings = [text] if text else ["\xa0"]
+    if href is None:
+        return {"strings": strings, "link": None}
+    return {"strings": [text] if text else [], "link": {"strings": [text] if text else [], "attrs": {"href": href}}}
+
+def _render_table(css_class, header, rows):
+    lines = [f'<table class="{css_class}" cellpadding="0" cellspacing="0">',
+             "<tr>" + "".join(f"<td>{_html.escape(h)}</td>" for h in header) + "</tr>"]
+    for cells, colspan in rows:
+        if colspan:
+            lines.append(f'<tr><td colspan="{colspan}" class="htable_eng_text">{_html.escape(cells)}</td></tr>')
+        else:
+            lines.append("<tr>" + "".join(_render_cell(c) for c in cells) + "</tr>")
+    lines.append("</table>")
+    return "\n".join(lines)
+
+def _json_rows(header, rows):
+    out = [{"attrs": {}, "cells": [{"strings": [h], "link": None} for h in header]}]
+    for cells, colspan in rows:
+        if colspan:
+            out.append({"attrs": {}, "cells": [{"strings": [cells], "link": None}]})
+        else:
+            out.append({"attrs": {}, "cells": [_json_cell(c) for c in cells]})
+    return out
+
+def _season_label(day):
+    start = day.year if day.month >= 9 else day.year - 1
+    return f"{start % 100:02d}/{(start + 1) % 100:02d} Season"
+
+def _odd_date(rng, day):
+    return rng.choice([
+        day.strftime("%d/%m/%Y"),
+        day.strftime("%d-%m-%y"),
+        day.strftime("%d.%m.%Y"),
+        "\u200f" + day.strftime("%d/%m/%y"),
+        "",
+    ])
+
+def _finish_time(rng, distance):
+    seconds = distance / 16.7 + rng.uniform(-1.5, 2.5)
+    return f"{int(seconds // 60)}:{seconds % 60:05.2f}" if seconds >= 60 else f"{seconds:.2f}"
+
+def _race_row(rng, fixtures, day, race_index, layout):
+    course, surface, tracks, distances = rng.choice(TRACKS)
+    distance = rng.choice(distances)
+    track = f"{course} / Turf / {rng.choice(tracks)}" if tracks else f"{course} / AWT"
+    going = rng.choice(AWT_GOING if surface == "AWT" else TURF_GOING)
+    race_no = rng.randint(1, 11)
+    key = (day.strftime("%Y/%m/%d"), str(race_no), course)
+    field_size = fixtures.field_sizes.setdefault(key, rng.randint(6, 14))
+
+    final = rng.randint(1, field_size)
+    if rng.random() < 0.04:
+        placing, positions, finish = rng.choice(NON_FINISHERS), "", "---"
+    else:
+        placing = f"{final} DH" if rng.random() < 0.02 else f"{final:02d}" if rng.random() < 0.3 else str(final)
+        calls = 4 if distance >= 1600 else 3
+        walk = [rng.randint(1, field_size) for _ in range(calls - 1)] + [final]
+        positions = " ".join(map(str, walk)) if rng.random() > 0.05 else ""
+        finish = _finish_time(rng, distance) if rng.random() > 0.03 else "---"
+
+    href = f"{RESULTS_URL}?RaceDate={key[0]}&Racecourse={course}&RaceNo={race_no}"
+    cells = [
+        _cell(str(race_index), href),
+        _cell(placing),
+        _cell(day.strftime("%d/%m/%y") if rng.random() > 0.05 else _odd_date(rng, day)),
+        _cell(track),
+        _cell(str(distance)),
+        _cell(going),
+        _cell(rng.choice(CLASSES)),
+        _cell(str(rng.randint(1, field_size)) if rng.random() > 0.03 else ""),
+        _cell(str(rng.randint(40, 120)) if rng.random() > 0.05 else "--"),
+        _cell(rng.choice(TRAINERS), f"/racing/information/English/Trainers/TrainerWinStat.aspx?t={rng.randint(1, 99)}"),
+        _cell(rng.choice(JOCKEYS), f"/racing/information/English/Jockey/JockeyWinStat.aspx?j={rng.randint(1, 99)}"),
+        _cell(rng.choice(["-", "N", "SH", "HD", "1/2", "1-1/4", "3-3/4", "12"])),
+        _cell(f"{rng.uniform(1.5, 99):.1f}"),
+        _cell(str(rng.randint(113, 135))),
+        _cell(positions),
+        _cell(finish),
+        _cell(str(rng.randint(1000, 1250)) if rng.random() > 0.03 else "--"),
+        _cell(rng.choice(GEAR)),
+        _cell("", f"/racing/video/{key[0].replace('/', '')}{race_no:02d}.html"),
+    ]
+    if layout == "no_video":
+        cells = cells[:18]
+    elif layout == "short":
+        cells = cells[:14]
+    return cells
+
+def _overseas_row(rng, day):
+    course, surface = rng.choice(OVERSEAS)
+    return [
+        _cell(""), _cell(str(rng.randint(1, 14))), _cell(day.strftime("%d/%m/%y")),
+        _cell(f"{course} / {surface}"), _cell(str(rng.choice([1200, 1600, 2000, 2400]))),
+        _cell("G"), _cell(rng.choice(["G1", "G2", "G3"])), _cell(str(rng.randint(1, 14))),
+        _cell("--"), _cell(rng.choice(TRAINERS)), _cell(rng.choice(JOCKEYS)), _cell("2"),
+        _cell(f"{rng.uniform(2, 60):.1f}"), _cell("126"), _cell(""), _cell(""),
+        _cell(str(rng.randint(1000, 1250))), _cell("--"), _cell(""),
+    ]
+
+def _horse_page(horse_id, name, table_html):
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{name} - Horse - Horses - Racing - The Hong Kong Jockey Club</title>
+<link rel="stylesheet" href="/racing/content/css/racing.css"><script src="/racing/content/js/jquery.js"></script>
+<script>var horseId = "{horse_id}";</script></head>
+<body><div id="header"><ul class="nav"><li><a href="/">Home</a></li><li><a href="/racing">Racing</a></li></ul></div>
+<div class="horseProfile"><table class="horseProfile"><tr><td class="title_eng_text">{name} ({horse_id.split("_")[-1]})</td></tr>
+<tr><td>Country of Origin / Age</td><td>: AUS / 6</td></tr><tr><td>Colour / Sex</td><td>: Bay / Gelding</td></tr>
+<tr><td>Owner</td><td>: 快樂馬主 Syndicate</td></tr></table></div>
+<div class="performance">
+{table_html}
+</div>
+<div id="footer">© The Hong Kong Jockey Club</div></body></html>
+"""
+
+def _results_page(key, field_size):
+    race_date, race_no, course = key
+    rows = []
+    for place in range(1, field_size + 1):
+        rows.append(([_cell(str(place)), _cell(str(place)), _cell(f"RUNNER {place}", "/horse"),
+                      _cell(JOCKEYS[place % len(JOCKEYS)]), _cell(TRAINERS[place % len(TRAINERS)]),
+                      _cell("126"), _cell("1100"), _cell(str(place)), _cell("-"),
+                      _cell("1 1 1"), _cell("1:09.45"), _cell("4.5")], None))
+    table = _render_table("bigborder", RESULTS_COLUMNS, rows)
+    return f"""<!DOCTYPE html>
+<html><head><title>Race Results - {course} {race_date} Race {race_no}</title></head>
+<body><div class="race_tab"><table><tr><td>RACE {race_no}</td></tr></table></div>
+<div class="performance">
+{table}
+</div></body></html>
+"""
+
+def generate_fixtures(horses=20, races=30, seed=0, today=None):
+    """SyntheticFixtures for ``horses`` horses with about ``races`` runs each."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    fixtures = SyntheticFixtures()
+
+    for i in range(horses):
+        horse_id = f"HK_{2016 + i % 8}_{'ABCDEGHJKL'[i % 10]}{i:03d}"
+        name = f"SYNTHETIC {i:03d}"
+        layout_mix = rng.choice([("full",), ("full", "no_video"), ("full", "short")])
+        day = today - timedelta(days=rng.randint(3, 60))
+        rows = []
+        season = None
+        for n in range(races):
+            label = _season_label(day)
+            if label != season:
+                rows.append((label, len(HORSE_COLUMNS)))
+                season = label
+            if rng.random() < 0.03:
+                rows.append((_overseas_row(rng, day), None))
+            else:
+                rows.append((_race_row(rng, fixtures, day, 900 - n, rng.choice(layout_mix)), None))
+            day -= timedelta(days=rng.randint(10, 45))
+
+        css = "f_tac f_fs12 js_race_tab" if i % 3 else "bigborder"
+        fixtures.horse_pages[horse_id] = _horse_page(horse_id, name, _render_table(css, HORSE_COLUMNS, rows))
+        fixtures.horse_json[horse_id] = _json_rows(HORSE_COLUMNS, rows)
+
+    for key, field_size in fixtures.field_sizes.items():
+        fixtures.results_pages[key] = _results_page(key, field_size)
+    return fixtures
+
+def write_fixtures(fixtures, directory):
+    """
+    OtherHorse_<HorseID>.html / .json and LocalResults_<date>_<course>_<no>.html
+    under ``directory``. Returns the number of files written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for horse_id, page in fixtures.horse_pages.items():
+        with open(os.path.join(directory, f"OtherHorse_{horse_id}.html"), "w", encoding="utf-8") as fh:
+            fh.write(page)
+        with open(os.path.join(directory, f"OtherHorse_{horse_id}.json"), "w", encoding="utf-8") as fh:
+            json.dump(fixtures.horse_json[horse_id], fh)
+        written += 2
+    for (race_date, race_no, course), page in fixtures.results_pages.items():
+        name = f"LocalResults_{race_date.replace('/', '')}_{course}_{race_no}.html"
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as fh:
+            fh.write(page)
+        written += 1
+    return written
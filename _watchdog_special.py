@@ -0,0 +1,155 @@
+# -----------------------------
+# PER-HORSE WATCHDOG / BROWSER CLEANUP
+# -----------------------------
+# A page that never finishes loading can block driver.get() forever and a
+# killed run leaves chromedriver + Chrome processes behind. The helpers here
+# bound every horse by a wall-clock budget and make sure browser process
+# trees are really gone afterwards.
+
+import os
+import signal
+import subprocess
+import threading
+
+from special.utils_special import log
+
+DRIVER_PROCESS_NAMES = ("chromedriver",)
+# Chrome started by chromedriver carries this switch; a user's own browser does not
+AUTOMATION_FLAG = "--enable-automation"
+
+class HorseTimeout(Exception):
+    """A horse exceeded its wall-clock budget or a browser timeout."""
+
+def _process_table():
+    """
+    Return [(pid, ppid, command line)] for every live process (POSIX ``ps``).
+    Zombies are left out: they are already dead and cannot be killed.
+    """
+    out = subprocess.run(["ps", "-A", "-o", "pid=,ppid=,stat=,args="],
+                         capture_output=True, text=True, timeout=10).stdout
+    table = []
+    for line in out.splitlines():
+        parts = line.split(None, 3)
+        if len(parts) == 4 and parts[0].isdigit() and parts[1].isdigit() and not parts[2].startswith("Z"):
+            table.append((int(parts[0]), int(parts[1]), parts[3].strip()))
+    return table
+
+def _is_our_browser(args):
+    exe = os.path.basename(args.split()[0]) if args else ""
+    return exe in DRIVER_PROCESS_NAMES or AUTOMATION_FLAG in args
+
+def _descendants(pid, table):
+    children = {}
+    for child, parent, _ in table:
+        children.setdefault(parent, []).append(child)
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+def kill_process_tree(pid):
+    """SIGKILL ``pid`` and all of its descendants (children first)."""
+    if not pid:
+        return 0
+    try:
+        victims = _descendants(pid, _process_table())[::-1] + [pid]
+    except Exception as e:
+        log("DEBUG", f"[WATCHDOG] Could not list processes: {e}")
+        victims = [pid]
+    killed = 0
+    for victim in victims:
+        try:
+            os.kill(victim, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+def driver_pid(driver):
+    try:
+        return driver.service.process.pid
+    except AttributeError:
+        return None
+
+def close_driver(driver, quit_timeout=10):
+    """
+    driver.quit() with a deadline, then kill whatever is left of the
+    chromedriver process tree (Chrome renderers, crashpad, ...).
+    """
+    if driver is None:
+        return
+    pid = driver_pid(driver)
+    tree = []
+    if pid:
+        try:
+            tree = _descendants(pid, _process_table())
+        except Exception:
+            pass
+
+    quitter = threading.Thread(target=_quiet_quit, args=(driver,), daemon=True)
+    quitter.start()
+    quitter.join(quit_timeout)
+    if quitter.is_alive():
+        log("WARNING", f"[WATCHDOG] driver.quit() hung for {quit_timeout}s, killing pid {pid}")
+
+    # Chrome children may already be re-parented, so use the tree taken above
+    for leftover in ([pid] + tree) if pid else []:
+        try:
+            os.kill(leftover, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+def _quiet_quit(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        log("DEBUG", f"[WATCHDOG] driver.quit() failed: {e}")
+
+def reap_orphaned_browsers():
+    """
+    Kill chromedriver / automation Chrome trees re-parented to init (pid 1),
+    i.e. left behind by a crashed or killed run. Returns the number of
+    processes killed.
+    """
+    try:
+        table = _process_table()
+    except Exception as e:
+        log("DEBUG", f"[WATCHDOG] Could not list processes: {e}")
+        return 0
+    killed = 0
+    for pid, ppid, args in table:
+        if ppid == 1 and _is_our_browser(args):
+            killed += kill_process_tree(pid)
+    if killed:
+        log("WARNING", f"[WATCHDOG] Killed {killed} orphaned browser processes")
+    return killed
+
+def call_with_budget(fn, budget, on_timeout=None, label="call"):
+    """
+    Run fn() on a worker thread and wait at most ``budget`` seconds.
+    On timeout on_timeout() is called (e.g. to kill the browser so the
+    blocked call returns) and HorseTimeout is raised.
+    """
+    result = {}
+
+    def _target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+
+    worker = threading.Thread(target=_target, name=f"budget-{label}", daemon=True)
+    worker.start()
+    worker.join(budget)
+    if worker.is_alive():
+        if on_timeout:
+            try:
+                on_timeout()
+            except Exception as e:
+                log("DEBUG", f"[WATCHDOG] on_timeout failed: {e}")
+        raise HorseTimeout(f"{label} exceeded its {budget}s budget")
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
@@ -0,0 +1,62 @@
+import threading
+
+
+def _import_aimd_module():
+    import _aimd_special as aimd
+    return aimd
+
+
+def test_limit_grows_while_healthy_and_halves_on_throttle():
+    aimd = _import_aimd_module()
+    limiter = aimd.AimdLimiter("test_grow", initial=2, max_limit=6, window=4, cooldown=0)
+
+    for _ in range(40):
+        with limiter.slot():
+            pass
+    assert limiter.metrics()["limit"] == 6
+
+    with limiter.slot() as slot:
+        slot.outcome = aimd.THROTTLE
+    assert limiter.metrics()["limit"] == 3
+    assert "test_grow" in aimd.limiter_metrics()
+
+
+def test_errors_back_off_and_limit_gates_concurrency():
+    aimd = _import_aimd_module()
+    limiter = aimd.AimdLimiter("test_gate", initial=4, window=4, max_error_rate=0.2, cooldown=0)
+
+    for _ in range(4):
+        try:
+            with limiter.slot():
+                raise IOError("reset")
+        except IOError:
+            pass
+    assert limiter.metrics()["limit"] == 2
+    assert limiter.metrics()["error_rate"] == 1.0
+
+    peak, active, lock = [0], [0], threading.Lock()
+    gate = threading.Event()
+
+    def _work():
+        with limiter.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            gate.wait(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=_work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] <= 2
+
+
+def test_http_status_classification():
+    aimd = _import_aimd_module()
+    assert aimd.classify_http_status(200) == aimd.OK
+    assert aimd.classify_http_status(404) == aimd.ERROR
+    assert aimd.classify_http_status(429) == aimd.THROTTLE
+    assert aimd.classify_http_status(503) == aimd.THROTTLE
@@ -0,0 +1,87 @@
+import random
+import sqlite3
+
+
+def _import_asof_module():
+    import _asof_features_special as asof
+    return asof
+
+
+def _races(horse_id="HK_A", n=30, seed=11):
+    rng = random.Random(seed)
+    races = []
+    for i in range(n):
+        year = 2021 + i // 10
+        races.append({
+            "HorseID": horse_id,
+            "RaceID": str(500 + i),
+            "RaceDate": f"{year}-{1 + (i % 10):02d}-15",
+            "Season": f"{(year - 1) % 100:02d}/{year % 100:02d}",
+            "RaceCourse": rng.choice(["ST", "HV"]),
+            "CourseType": rng.choice(["A", "C+3", "AWT"]),
+            "Distance": rng.choice([1000, 1200, 1650, 1800]),
+            "Going": rng.choice(["G", "GF", "Y"]),
+            "ClassNum": rng.choice([3, 4, 5, None]),
+            "Draw": rng.randint(1, 14),
+            "Trainer": rng.choice(["T One", "T Two"]),
+            "Jockey": rng.choice(["J One", "J Two", None]),
+            "ActualWt": rng.choice([115.0, 121.0, 128.0, 133.0]),
+            "DeclaredWt": rng.choice([1050.0, 1100.0, None]),
+            "Placing": rng.choice([1, 2, 3, 5, 9, None]),
+            "StyleCourse": "ST",
+            "StyleCourseType": "A",
+            "StyleDistanceGroup": "Mid",
+            "TurnCount": 1.0,
+            "EarlyPos": rng.randint(1, 14),
+            "FieldSize": 14,
+        })
+    return races
+
+
+def test_features_only_use_earlier_races():
+    asof = _import_asof_module()
+    races = _races()
+
+    fast = list(asof.iter_horse_asof_features(races))
+    assert len(fast) == len(races)
+    assert all(fast[0][f"{name}Runs"] == 0 for name in [*asof.FEATURE_KEYS, "ClassJump", "Style"])
+
+    # Naive O(n^2) reference: recompute from the prefix for every race
+    for k, race in enumerate(races):
+        naive = list(asof.iter_horse_asof_features(races[:k] + [race]))[-1]
+        assert fast[k] == naive
+
+    # Changing a later result must not change earlier features
+    changed = [dict(r) for r in races]
+    changed[20]["Placing"] = 1 if races[20]["Placing"] != 1 else 9
+    assert list(asof.iter_horse_asof_features(changed))[:21] == fast[:21]
+
+
+def test_rebuild_writes_one_row_per_race(tmp_path):
+    asof = _import_asof_module()
+    asof.stats.DB_PATH = str(tmp_path / "test.db")
+
+    asof.stats.create_race_history_table()
+    columns = ["HorseID", "RaceDate", "RaceID", "Season", "RaceCourse", "CourseType",
+               "Distance", "Going", "ClassNum", "Draw", "Trainer", "Jockey",
+               "ActualWt", "DeclaredWt", "Placing"]
+    conn = sqlite3.connect(asof.stats.DB_PATH)
+    for horse_id, seed in (("HK_A", 1), ("HK_B", 2)):
+        for r in _races(horse_id, n=12, seed=seed):
+            conn.execute(
+                f"INSERT INTO horse_race_history ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [r[c] for c in columns],
+            )
+    conn.commit()
+    conn.close()
+
+    assert asof.rebuild_asof_features() == 24
+    conn = sqlite3.connect(asof.stats.DB_PATH)
+    first = conn.execute(
+        "SELECT DistanceRuns, JockeyRuns FROM horse_asof_features "
+        "WHERE HorseID = 'HK_B' ORDER BY RaceDate LIMIT 1"
+    ).fetchone()
+    conn.close()
+    assert first == (0, 0)
+    assert len(list(asof.iter_asof_features("HK_A"))) == 12
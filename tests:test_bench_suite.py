@@ -0,0 +1,60 @@
+import json
+from datetime import date
+
+import pytest
+
+
+def _import_bench_modules():
+    pytest.importorskip("bs4")
+
+    import _bench_suite_special as suite
+    import _scrape_horses_dynamic_data_special2 as scraper
+    import _synthetic_pages_special as pages
+    return suite, scraper, pages
+
+
+def test_fixtures_are_seeded_and_parse_the_same_from_html_and_json():
+    _, scraper, pages = _import_bench_modules()
+    import _html_parser_special as html_parser
+
+    fixtures = pages.generate_fixtures(horses=4, races=25, seed=7, today=date(2024, 6, 1))
+    again = pages.generate_fixtures(horses=4, races=25, seed=7, today=date(2024, 6, 1))
+    assert fixtures.horse_pages == again.horse_pages and fixtures.field_sizes == again.field_sizes
+
+    for key, page in fixtures.results_pages.items():
+        assert scraper.field_size_from_results(page) == fixtures.field_sizes[key]
+
+    for horse_id, page in fixtures.horse_pages.items():
+        url = fixtures.horse_url(horse_id)
+        from_html = scraper.parse_horse_html(page, url)
+        from_json = scraper.parse_horse_json(fixtures.horse_json[horse_id], url)
+        assert html_parser.row_signature(from_html.rows) == html_parser.row_signature(from_json.rows)
+        assert {len(row.find_all("td")) for row in from_html.rows} <= {14, 18, 19}
+        html_result, json_result = from_html.to_dict(), from_json.to_dict()
+        del html_result["RawRows"], json_result["RawRows"]
+        assert html_result == json_result
+        assert from_html["RunningPositions"]
+
+
+def test_suite_times_every_stage_and_flags_regressions(tmp_path):
+    suite, scraper, _ = _import_bench_modules()
+    scraper.stats.DB_PATH = db_path = str(tmp_path / "main.db")
+
+    result = suite.run_suite(horses=2, races=12, seed=3)
+    assert scraper.stats.DB_PATH == db_path
+    assert not (tmp_path / "main.db").exists()  # written to a temporary DB
+
+    stages = result["stages"]
+    for stage in ("parse_html", "parse_json", "derive", "build_draw_pref", "build_race_history",
+                  "results_parse", "field_size", "dynamic_stats", "jockey_trainer", "total"):
+        assert stages[stage]["n"] >= 1, stage
+    assert stages["parse_html"]["n"] == 2
+    # Every builder produces records for every horse (bar the BWR one on short rows)
+    assert set(result["errors"]) <= {"build_bwr_distance_perf"}, result["errors"]
+
+    path = tmp_path / "bench.json"
+    suite.write_results(result, str(path))
+    baseline = json.loads(path.read_text())
+    assert suite.compare_results(baseline, result) == []
+    baseline["stages"]["parse_html"]["p50"] /= 2
+    assert [stage for stage, *_ in suite.compare_results(baseline, result)] == ["parse_html"]
@@ -0,0 +1,62 @@
+
+
+def _import_browser_module():
+    import _browser_special as browser
+    return browser
+
+
+class _Options:
+    def __init__(self):
+        self.arguments, self.experimental = [], {}
+        self.page_load_strategy = "normal"
+
+    def add_argument(self, arg):
+        self.arguments.append(arg)
+
+    def add_experimental_option(self, name, value):
+        self.experimental[name] = value
+
+
+class _Driver:
+    def __init__(self, renders_after=0):
+        self.cdp = []
+        self.polls = 0
+        self.renders_after = renders_after
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp.append((cmd, params))
+
+    def execute_script(self, script, *args):
+        if "querySelector" in script:
+            self.polls += 1
+            return self.polls > self.renders_after
+        return {"bytes": 2048, "requests": 3, "dom_ms": 120}
+
+
+def test_lean_profile_blocks_assets_and_trackers():
+    browser = _import_browser_module()
+    options = browser.configure_options(_Options())
+    assert options.page_load_strategy == "eager"
+    assert options.experimental["prefs"]["profile.managed_default_content_settings.images"] == 2
+
+    driver = _Driver()
+    patterns = browser.blocked_url_patterns()
+    assert browser.apply_request_blocking(driver, patterns)
+    blocked = dict(driver.cdp)["Network.setBlockedURLs"]["urls"]
+    assert "*.css" in blocked and "*.woff2" in blocked and "*google-analytics.com*" in blocked
+
+    full = browser.configure_options(_Options(), block_resources=False, page_load_strategy="normal")
+    assert full.page_load_strategy == "normal" and not full.experimental
+
+
+def test_wait_for_selector_and_page_cost_meter():
+    browser = _import_browser_module()
+    driver = _Driver(renders_after=2)
+    assert browser.wait_for_selector(driver, "table.bigborder", timeout=1, poll=0.001)
+    assert driver.polls == 3
+    assert not browser.wait_for_selector(_Driver(renders_after=10 ** 6), "table", timeout=0.01, poll=0.001)
+
+    meter = browser.PageCostMeter("test")
+    meter.add(browser.page_cost(driver), 100.0)
+    meter.add(browser.page_cost(driver), 300.0)
+    assert meter.averages() == {"pages": 2, "bytes": 2048, "requests": 3.0, "ms": 200}
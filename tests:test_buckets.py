@@ -0,0 +1,103 @@
+
+
+def _import_stats_module():
+    import _horse_dynamic_stats_special as stats
+    return stats
+
+
+# Reference ladders (the if/elif chains the tables replaced)
+def _distance_ladder(race_course, course_type, distance):
+    race_course, course_type = race_course.upper(), course_type.upper()
+    if race_course == "ST" and course_type == "AWT":
+        bounds = (1000, 1400, 1650, 2000)
+    elif race_course == "ST":
+        bounds = (1000, 1400, 1800, 2200)
+    elif race_course == "HV":
+        bounds = (1000, 1200, 1800, 2200)
+    else:
+        return "Unknown"
+    for bound, label in zip(bounds, ("Sprint", "Short", "Mid", "Long")):
+        if distance <= bound:
+            return label
+    return "Endurance"
+
+
+def _weight_ladder(w):
+    return ("Light" if w < 110 else "Low-Mid" if w <= 116 else "Mid" if w <= 123
+            else "High-Mid" if w <= 130 else "Heavy")
+
+
+def _hwtr_ladder(h):
+    for bound, label in ((0.85, "0.75–0.85"), (0.95, "0.85–0.95"), (1.05, "0.95–1.05"),
+                         (1.15, "1.05–1.15"), (1.25, "1.15–1.25")):
+        if h < bound:
+            return label
+    return "1.25+"
+
+
+def test_tables_match_the_old_ladders_on_every_edge():
+    stats = _import_stats_module()
+    for course in ("ST", "st", "HV", "Hv", "XX"):
+        for surface in ("AWT", "awt", "Turf"):
+            for distance in range(900, 2500, 25):
+                assert stats.get_distance_group(course, surface, distance) == \
+                    _distance_ladder(course, surface, distance)
+                assert stats.get_distance_group(course, surface, distance + 0.5) == \
+                    _distance_ladder(course, surface, distance + 0.5)
+
+    for weight in [w / 2 for w in range(200, 280)]:
+        assert stats.get_weight_group(weight) == _weight_ladder(weight)
+
+    for i in range(600, 1400):
+        hwtr = i / 1000
+        assert stats.get_hwtr_group(hwtr) == _hwtr_ladder(hwtr)
+
+    # Mixed < / <= bounds and exact float edges
+    assert [stats.get_distance_group_simple(d) for d in (999, 1000, 1400, 1401, 1799, 1800, 2200)] == \
+        ["Sprint", "Short", "Short", "Mid", "Mid", "Long", "Endurance"]
+    assert [stats.get_bwr_group(b) for b in (0.90, 0.9000001, 1.34, 1.35)] == \
+        ["Very Low", "Low", "High", "Very High"]
+    assert stats.get_hwtr_group(float("nan")) == "1.25+"
+
+    # Case-sensitive variant keeps its own AWT ladder
+    assert stats.get_distance_group_special("ST", "AWT", 1000) == "Short"
+    assert stats.get_distance_group_special("st", "AWT", 1000) == "Unknown"
+    assert stats.get_distance_group_special("HV", "Turf", 1000) == "Sprint"
+
+    assert [stats.get_draw_group(d) for d in (None, "-", " 3 ", 0, 4, 9, 12, 14)] == \
+        [None, None, "Inside", None, "InnerMid", "OuterMid", "Wide", "Outer"]
+
+
+def test_vectorized_api_matches_scalar_calls():
+    stats = _import_stats_module()
+    import _buckets_special as buckets
+
+    courses = ["ST", "HV", "ST", "XX", "hv"] * 40
+    surfaces = ["AWT", "Turf", "Turf", "Turf", "turf"] * 40
+    distances = [1000 + 25 * i for i in range(200)]
+    assert buckets.distance_groups(courses, surfaces, distances) == [
+        stats.get_distance_group(c, s, d) for c, s, d in zip(courses, surfaces, distances)
+    ]
+
+    weights = [100 + i * 0.5 for i in range(80)]
+    assert buckets.WEIGHT_GROUP.many(weights) == [stats.get_weight_group(w) for w in weights]
+
+    draws = [None, "x", " 1 ", 0, 5, 8, 11, 14]
+    assert buckets.draw_groups(draws) == [stats.get_draw_group(d) for d in draws]
+
+
+def test_lookup_keeps_the_ladder_edges():
+    import _buckets_special as buckets
+
+    bounds = [(b, buckets.LE if b % 2 else buckets.LT) for b in range(1, 20)]
+    table = buckets.Buckets(bounds, list(range(20)))
+
+    def ladder(x):
+        for i, (b, op) in enumerate(bounds):
+            if (x <= b) if op == buckets.LE else (x < b):
+                return i
+        return len(bounds)
+
+    values = [x / 4 for x in range(-4, 90)]
+    assert [table.lookup(x) for x in values] == [ladder(x) for x in values]
+    assert table.many(values) == [ladder(x) for x in values]
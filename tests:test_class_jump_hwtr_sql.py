@@ -0,0 +1,129 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+
+
+def _import_stats_module():
+    import _horse_dynamic_stats_special as hw
+    return hw
+
+
+class _Cell:
+    """Minimal stand-in for a bs4 <td>: just the calls the builders make."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def get_text(self, strip=False):
+        return self.text.strip() if strip else self.text
+
+    def find(self, name):
+        return None
+
+
+class _Row:
+    def __init__(self, texts):
+        self.cells = [_Cell(t) for t in texts]
+        self.attrs = {}
+
+    def find_all(self, name):
+        return self.cells
+
+
+def _race_rows(seed=7, n=45):
+    rng = random.Random(seed)
+    rows = []
+    day = date(2021, 9, 12)
+    for i in range(n):
+        day += timedelta(days=rng.randint(10, 40))
+        texts = [""] * 18
+        texts[0] = str(100 + i)
+        texts[1] = rng.choice(["1", "2", "3", "4", "7", "11", "3 DH", "WV"])
+        texts[2] = day.strftime("%d/%m/%y")
+        texts[3] = rng.choice(["ST / Turf / \"A\"", "HV / Turf / \"C+3\"", "ST / AWT"])
+        texts[4] = rng.choice(["1200", "1650", "1800"])
+        texts[5] = "G"
+        texts[6] = rng.choice(["4", "3", "5", "G2", "Griffin", ""])
+        texts[7] = str(rng.randint(1, 14))
+        texts[13] = rng.choice(["118", "121", "126", "133", "115", ""])
+        texts[16] = rng.choice(["1080", "1102", "1121", "", "0"])
+        rows.append(_Row(texts))
+    rows.reverse()  # HKJC lists newest first
+    return rows
+
+
+def _table_rows(hw, table, cols):
+    conn = sqlite3.connect(hw.DB_PATH)
+    rows = conn.execute(f"SELECT {cols} FROM {table} ORDER BY {cols}").fetchall()
+    conn.execute(f"DELETE FROM {table}")
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def _store_history(hw, rows_by_horse):
+    for horse_id, rows in rows_by_horse.items():
+        hw.upsert_race_history(horse_id, hw.build_race_history(rows, horse_id))
+
+
+def test_class_jump_sql_matches_python_builder(tmp_path):
+    hw = _import_stats_module()
+    hw.DB_PATH = str(tmp_path / "test.db")
+    rows_by_horse = {"HK_A": _race_rows(1), "HK_B": _race_rows(2)}
+
+    for horse_id, rows in rows_by_horse.items():
+        hw.upsert_class_jump_pref(horse_id, hw.build_class_jump_pref(rows))
+    cols = "HorseID, Season, JumpType, Top3Rate, Top3Count, TotalRuns"
+    expected = _table_rows(hw, "horse_class_jump_pref", cols)
+    assert expected
+
+    _store_history(hw, rows_by_horse)
+    hw.rebuild_class_jump_pref_sql()
+    assert _table_rows(hw, "horse_class_jump_pref", cols) == expected
+
+    hw.rebuild_class_jump_pref_sql("HK_B")
+    assert _table_rows(hw, "horse_class_jump_pref", cols) == [r for r in expected if r[0] == "HK_B"]
+
+
+def test_hwtr_sql_matches_python_builder(tmp_path):
+    hw = _import_stats_module()
+    hw.DB_PATH = str(tmp_path / "test.db")
+    rows_by_horse = {"HK_A": _race_rows(3), "HK_B": _race_rows(4)}
+
+    for horse_id, rows in rows_by_horse.items():
+        hw.upsert_hwtr_trend(hw.build_hwtr_per_class(rows, horse_id))
+    cols = "HorseID, Season, Class, HWTRGroup, Top3Rate, Top3Count, TotalRuns"
+    expected = _table_rows(hw, "horse_hwtr_trend", cols)
+    assert expected
+
+    _store_history(hw, rows_by_horse)
+    hw.rebuild_hwtr_trend_sql()
+    assert _table_rows(hw, "horse_hwtr_trend", cols) == expected
+
+    hw.rebuild_hwtr_trend_sql("HK_A")
+    assert _table_rows(hw, "horse_hwtr_trend", cols) == [r for r in expected if r[0] == "HK_A"]
+
+
+def test_hwtr_sql_matches_python_builder_on_synthetic_pages(tmp_path):
+    # Short 14-cell rows, odd / missing dates and "--" weights: both paths
+    # must drop the same rows before looking back at previous weights
+    hw = _import_stats_module()
+    import _scrape_horses_dynamic_data_special2 as scraper
+    import _synthetic_pages_special as pages
+
+    hw.DB_PATH = str(tmp_path / "test.db")
+    fixtures = pages.generate_fixtures(horses=12, races=30, seed=11, today=date(2024, 6, 1))
+    rows_by_horse = {
+        horse_id: scraper.parse_horse_json(table_rows, fixtures.horse_url(horse_id)).rows
+        for horse_id, table_rows in fixtures.horse_json.items()
+    }
+
+    for horse_id, rows in rows_by_horse.items():
+        hw.upsert_hwtr_trend(hw.build_hwtr_per_class(rows, horse_id))
+    cols = "HorseID, Season, Class, HWTRGroup, Top3Rate, Top3Count, TotalRuns"
+    expected = _table_rows(hw, "horse_hwtr_trend", cols)
+    assert expected
+
+    _store_history(hw, rows_by_horse)
+    hw.rebuild_hwtr_trend_sql()
+    assert _table_rows(hw, "horse_hwtr_trend", cols) == expected
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY = ("selenium", "requests", "pandas", "bs4", "ftfy", "numpy")
+
+
+def test_modules_import_without_heavy_dependencies():
+    # Fresh interpreter: no stubs, nothing preloaded by other tests
+    code = (
+        "import sys\n"
+        "import _cli_special, _horse_dynamic_stats_special, _scrape_horses_dynamic_data_special2\n"
+        f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_status_and_export_on_an_empty_database(tmp_path, capsys):
+    import _cli_special as cli
+    import _horse_dynamic_stats_special as stats
+
+    stats.DB_PATH = str(tmp_path / "test.db")
+    assert cli.main(["status"]) == 0
+    out = capsys.readouterr().out
+    assert "Last run:     none" in out
+    assert "Dead letters: 0" in out
+
+    csv_path = tmp_path / "dead.csv"
+    cli.main(["export", "dead-letters", "-o", str(csv_path)])
+    assert csv_path.read_text().splitlines() == ["HorseID,ErrorType,Reason"]
@@ -0,0 +1,31 @@
+from datetime import date, datetime
+
+
+def _import_utils_module():
+    import utils_special as utils
+    return utils
+
+
+def test_fast_path_matches_strptime_rules():
+    utils = _import_utils_module()
+    assert utils.parse_hkjc_date("28/06/23") == date(2023, 6, 28)
+    assert utils.parse_hkjc_date(" 28/06/2023 ") == date(2023, 6, 28)
+    assert utils.parse_hkjc_date("15/07/70") == date(1970, 7, 15)  # %y pivot
+    assert utils.parse_hkjc_date("29/02/24") == date(2024, 2, 29)
+    assert utils.parse_hkjc_date("29/02/23") is None
+    # Other formats still go through the slow path
+    assert utils.parse_hkjc_date("1/6/23") == date(2023, 6, 1)
+    assert utils.parse_hkjc_date("2023-06-28") == date(2023, 6, 28)
+    assert utils.parse_hkjc_date("‏28.06.2023") == date(2023, 6, 28)
+    assert utils.parse_hkjc_date("") is None
+
+
+def test_dates_and_seasons_are_memoized():
+    utils = _import_utils_module()
+    first = utils.parse_hkjc_date("01/09/23")
+    assert utils.parse_hkjc_date("01/09/23") is first
+
+    assert utils.get_season_code(date(2023, 9, 1)) == "23/24"
+    assert utils.get_season_code(datetime(2024, 8, 31)) == "23/24"
+    assert utils.get_season_code(date(1999, 12, 1)) == "99/00"
+    assert utils.get_season_code(date(2024, 1, 1)) is utils.get_season_code(date(2024, 3, 1))
@@ -0,0 +1,84 @@
+import io
+import sqlite3
+from datetime import date
+
+
+def _import_horse_ids_module():
+    import _horse_ids_special as horse_ids
+    return horse_ids
+
+
+def test_csv_ids_are_stripped_deduplicated_and_blank_rows_dropped(tmp_path):
+    horse_ids = _import_horse_ids_module()
+    csv_path = tmp_path / "ids.csv"
+    csv_path.write_text("Name,HorseID\nA, HK_A \nB,\nC,HK_B\nD,HK_A\nE,NaN\nF\n",
+                        encoding="utf-8-sig")
+
+    stream = horse_ids.HorseIdStream(str(csv_path))
+    assert list(stream) == ["HK_A", "HK_B"]
+    assert (stream.count, stream.duplicates, stream.blank) == (2, 1, 2)
+
+
+def test_stream_is_lazy(tmp_path):
+    horse_ids = _import_horse_ids_module()
+    consumed = []
+
+    def source():
+        for horse_id in ["HK_A", "HK_B", "HK_C"]:
+            consumed.append(horse_id)
+            yield horse_id
+
+    first = next(iter(horse_ids.HorseIdStream(source())))
+    assert first == "HK_A" and consumed == ["HK_A"]
+
+
+def test_stdin_accepts_csv_or_bare_ids():
+    horse_ids = _import_horse_ids_module()
+    assert list(horse_ids.iter_stdin_ids(io.StringIO("HorseID\nHK_A\nHK_B\n"))) == ["HK_A", "HK_B"]
+    assert list(horse_ids.iter_stdin_ids(io.StringIO("H123\nHK_A\n\n"))) == ["H123", "HK_A"]
+
+
+def test_missing_column_is_reported(tmp_path):
+    horse_ids = _import_horse_ids_module()
+    csv_path = tmp_path / "ids.csv"
+    csv_path.write_text("Name\nA\n")
+    try:
+        list(horse_ids.HorseIdStream(str(csv_path)))
+    except ValueError as e:
+        assert "HorseID" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_recent_runners_are_paged_from_race_history(tmp_path):
+    horse_ids = _import_horse_ids_module()
+    horse_ids.stats.DB_PATH = str(tmp_path / "test.db")
+    horse_ids.stats.create_race_history_table()
+    conn = sqlite3.connect(horse_ids.stats.DB_PATH)
+    conn.executemany(
+        "INSERT INTO horse_race_history (HorseID, RaceDate) VALUES (?, ?)",
+        [("HK_A", "2024-05-01"), ("HK_A", "2024-05-20"), ("HK_B", "2024-05-10"),
+         ("HK_C", "2024-01-01"), ("HK_D", "2024-05-30")],
+    )
+    conn.commit()
+    conn.close()
+
+    recent = horse_ids.iter_recent_runner_ids(30, today=date(2024, 6, 1), chunk_size=1)
+    assert list(recent) == ["HK_A", "HK_B", "HK_D"]
+    try:
+        horse_ids.open_source("recent:month")
+    except ValueError as e:
+        assert "recent:" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_journal_fingerprint_per_input_kind(tmp_path):
+    _import_horse_ids_module()
+    import _run_journal_special as journal
+
+    csv_path = tmp_path / "ids.csv"
+    csv_path.write_text("HorseID\nHK_A\n")
+    assert journal.input_fingerprint(str(csv_path)) == journal.file_sha256(str(csv_path))
+    assert journal.input_fingerprint("-") is None
+    assert journal.input_fingerprint("recent:30") != journal.input_fingerprint("recent:7")
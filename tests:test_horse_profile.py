@@ -0,0 +1,85 @@
+import pickle
+from datetime import date
+
+
+def _import_scraper_module():
+    import _scrape_horses_dynamic_data_special2 as scraper
+    from _html_rows_special import HtmlCell, HtmlLink, HtmlRow
+    return scraper, HtmlCell, HtmlLink, HtmlRow
+
+
+def _rows(HtmlCell, HtmlLink, HtmlRow):
+    races = [
+        # (date, placing, course, distance, going, class)
+        ("01/06/24", "1", 'ST / Turf / "A"', "1200", "G", "4"),
+        ("15/05/24", "5", 'HV / Turf / "C"', "1650", "GF", "4"),
+        ("01/01/24", "2", 'ST / Turf / "A"', "1200", "G", "3"),
+    ]
+    rows = []
+    for i, (day, placing, course, distance, going, klass) in enumerate(races):
+        cells = [HtmlCell(["x"]) for _ in range(19)]
+        cells[0] = HtmlCell([f"{100 + i}"], HtmlLink([f"{100 + i}"], {"href": "/r?RaceDate=2024/06/01"}))
+        for index, value in ((1, placing), (2, day), (3, course), (4, distance), (5, going), (7, klass)):
+            cells[index] = HtmlCell([value])
+        rows.append(HtmlRow(cells))
+    rows.append(HtmlRow([HtmlCell(["incomplete"])]))
+    return rows
+
+
+def test_profile_computes_stats_on_first_access_only():
+    scraper, HtmlCell, HtmlLink, HtmlRow = _import_scraper_module()
+    profile = scraper.HorseProfile("https://x/Horse.aspx?HorseId=HK_2020_A123",
+                                   _rows(HtmlCell, HtmlLink, HtmlRow), today=date(2024, 6, 11))
+
+    assert "form_rows" not in vars(profile) and "best_distance" not in vars(profile)
+    assert profile["RecentForm"] == [1, 5, 2]
+    assert "form_rows" in vars(profile) and "best_distance" not in vars(profile)
+
+    assert profile["HorseID"] == "HK_2020_A123"
+    assert len(profile["RawRows"]) == 3
+    assert profile["DaysSinceLastRun"] == 10
+    assert profile["FitnessIndicator"] == 2
+    assert (profile["BestDistance"], profile["BestDistanceWinRate"]) == (1200, 0.5)
+    assert (profile["BestClass"], profile["BestClassAvgPlacing"]) == (3, 2.0)
+    assert profile.get("Missing", "n/a") == "n/a"
+    assert set(profile.to_dict()) == set(scraper.HorseProfile.FIELDS)
+
+
+def test_prefetched_profile_pickles_with_its_cached_fields():
+    scraper, HtmlCell, HtmlLink, HtmlRow = _import_scraper_module()
+    profile = scraper.HorseProfile("https://x/Horse.aspx?HorseId=HK_2020_A123",
+                                   _rows(HtmlCell, HtmlLink, HtmlRow), today=date(2024, 6, 11))
+
+    restored = pickle.loads(pickle.dumps(profile.prefetch()))
+    assert "going_stats_seasonal" in vars(restored)
+    assert "best_going" not in vars(restored)
+    assert restored["GoingPrefSeasonal"] == profile["GoingPrefSeasonal"]
+
+
+def test_weight_pref_builder_converts_html_rows():
+    scraper, HtmlCell, HtmlLink, HtmlRow = _import_scraper_module()
+    rows = _rows(HtmlCell, HtmlLink, HtmlRow)
+    for row in rows[:3]:
+        row.cells[13] = HtmlCell(["126"])
+
+    records = scraper.stats.build_weight_pref_from_dict(rows, "HK_2020_A123")
+    assert records, "HtmlRows were not converted"
+    assert sum(r["TotalRuns"] for r in records) == 3
+    assert sum(r["Top3Count"] for r in records) == 2
+    assert {r["CarriedWeight"] for r in records} == {126.0}
+    assert {r["HorseID"] for r in records} == {"HK_2020_A123"}
+
+
+def test_prefetch_runs_every_builder_the_writer_upserts():
+    scraper, HtmlCell, HtmlLink, HtmlRow = _import_scraper_module()
+    profile = scraper.HorseProfile("https://x/Horse.aspx?HorseId=HK_2020_A123",
+                                   _rows(HtmlCell, HtmlLink, HtmlRow), today=date(2024, 6, 11))
+
+    restored = pickle.loads(pickle.dumps(profile.prefetch()))
+    for key in ("RaceHistory", "HwtrPerClass", "ClassJumpPref", "TrainerCombo", "JockeyCombo",
+                "JockeyTrainerCombo", "WeightPref", "BwrDistancePerf", "DrawPref"):
+        attr, _ = scraper.HorseProfile.FIELDS[key]
+        assert attr in vars(restored), key
+    assert restored["Season"] == "23/24"
+    assert len(restored["RaceHistory"]) == 3
+    assert restored.build_errors == {}
@@ -0,0 +1,96 @@
+import pytest
+
+
+def _import_parser_module():
+    pytest.importorskip("bs4")
+
+    import _html_parser_special as html_parser
+    return html_parser
+
+
+PAGE = """
+<html><body>
+<div class="nav"><table class="menu"><tr><td><a href="/home">Home</a></td></tr></table></div>
+<table class="f_tac f_fs12">
+  <tr><td>Race Index</td><td>Pla.</td></tr>
+  <tr class="row"><td><a href="/r?RaceNo=3"> 123 </a></td><td>\n 1 &nbsp;DH\n</td></tr>
+  <tr><td>456</td><td><!-- void --> 5 <span>/14</span></td></tr>
+</table>
+</body></html>
+"""
+
+RESULTS = """
+<table class="x"><tr><td>Pla.</td><td>Horse</td></tr>
+<tr><td>1</td><td>A</td></tr><tr><td>2</td><td>B</td></tr></table>
+"""
+
+
+def test_backends_return_identical_rows():
+    html_parser = _import_parser_module()
+    selectors = ['table[class="f_tac f_fs12 js_race_tab"]', 'table[class="f_tac f_fs12"]', "table.bigborder"]
+
+    signatures = {}
+    for backend in html_parser.available_backends():
+        rows = html_parser.find_table_rows(PAGE, selectors, backend=backend)
+        signatures[backend] = html_parser.row_signature(rows)
+        assert len(rows) == 3
+        assert rows[1].attrs == {"class": ["row"]}
+        assert rows[1].find_all("td")[0].find("a")["href"] == "/r?RaceNo=3"
+        assert rows[2].find_all("td")[1].get_text(strip=True) == "5/14"
+    assert len({repr(s) for s in signatures.values()}) == 1
+
+
+def test_header_fallback_and_missing_table():
+    html_parser = _import_parser_module()
+    for backend in html_parser.available_backends():
+        rows = html_parser.find_table_rows(RESULTS, ["table.bigborder"], fallback_header="Horse", backend=backend)
+        assert len([r for r in rows if r.find_all("td")]) - 1 == 2
+        assert html_parser.find_table_rows("<p>empty</p>", ["table.bigborder"], backend=backend) is None
+
+
+def test_bench_reports_every_backend():
+    html_parser = _import_parser_module()
+    results = html_parser.bench_backends([PAGE], ["table.f_fs12"], repeat=1)
+    assert set(html_parser.available_backends()) <= set(results)
+    assert all(r["identical"] for r in results.values())
+
+
+def test_cells_are_cleaned_once_and_decoding_prefers_utf8():
+    html_parser = _import_parser_module()
+    import _html_rows_special as html_rows
+
+    page = '<table class="bigborder"><tr><td>T&nbsp;One中</td><td>1é</td></tr></table>'
+    for backend in html_parser.available_backends():
+        rows = html_parser.find_table_rows(page, ["table.bigborder"], backend=backend,
+                                           clean=html_rows.strip_non_ascii)
+        cells = rows[0].find_all("td")
+        assert cells[0].strings == ("T\xa0One",)
+        assert cells[1].get_text() == "1"
+        assert cells[1].get_text() is cells[1].get_text()  # computed once
+
+    assert html_parser.decode_html("hé".encode("utf-8"), encoding="ISO-8859-1") == "hé"
+    assert html_parser.decode_html("中".encode("big5")) == "中"
+
+
+def test_bs4_trees_are_freed_without_cyclic_gc():
+    import gc
+
+    html_parser = _import_parser_module()
+    from bs4 import Tag
+
+    selectors = ['table[class="f_tac f_fs12"]']
+    gc.collect()
+    gc.disable()
+    try:
+        for backend in ("lxml", "html.parser"):
+            if backend not in html_parser.available_backends():
+                continue
+            rows = html_parser.find_table_rows(PAGE, selectors, backend=backend)
+            assert rows[1].find_all("td")[0].find("a")["href"] == "/r?RaceNo=3"
+        gc.set_debug(gc.DEBUG_SAVEALL)
+        gc.collect()
+        assert not [o for o in gc.garbage if isinstance(o, Tag)]
+    finally:
+        gc.set_debug(0)
+        gc.garbage.clear()
+        gc.enable()
@@ -0,0 +1,98 @@
+import sqlite3
+import time
+
+
+def _import_queue_modules():
+    import _job_queue_special as job_queue
+    import _shards_special as shards
+    return job_queue, shards
+
+
+def test_claims_are_exclusive_and_expired_leases_are_reclaimed(tmp_path):
+    job_queue, _ = _import_queue_modules()
+    job_queue.QUEUE_DB_PATH = str(tmp_path / "queue.db")
+
+    assert job_queue.enqueue_horses(["HK_A", "HK_B", "HK_C"]) == 3
+    assert job_queue.enqueue_horses(["HK_A"]) == 0
+
+    first = job_queue.claim_batch("node1", batch_size=2, lease_seconds=60)
+    second = job_queue.claim_batch("node2", batch_size=2, lease_seconds=60)
+    assert first == ["HK_A", "HK_B"] and second == ["HK_C"]
+    assert job_queue.claim_batch("node3", batch_size=2) == []
+
+    job_queue.complete_job("node1", "HK_A", shard="s1.db")
+    job_queue.fail_job("node1", "HK_B", "timeout", max_attempts=3)
+    # node2 dies: its lease expires and node3 picks HK_C up
+    assert job_queue.heartbeat("node2", ["HK_C"], lease_seconds=-1) == 1
+    assert sorted(job_queue.claim_batch("node3", batch_size=5)) == ["HK_B", "HK_C"]
+
+    # The stale worker can no longer complete a job it lost
+    job_queue.complete_job("node2", "HK_C")
+    assert job_queue.queue_status() == {"done": 1, "leased": 2}
+
+    job_queue.fail_job("node3", "HK_B", "still broken", max_attempts=2)
+    job_queue.complete_job("node3", "HK_C")
+    assert job_queue.queue_status() == {"done": 2, "failed": 1}
+    assert not job_queue.has_open_jobs()
+
+
+def test_lease_heartbeat_keeps_lease_alive(tmp_path):
+    job_queue, _ = _import_queue_modules()
+    job_queue.QUEUE_DB_PATH = str(tmp_path / "queue.db")
+    job_queue.enqueue_horses(["HK_A"])
+    job_queue.claim_batch("node1", lease_seconds=1)
+
+    with job_queue.LeaseHeartbeat("node1", lease_seconds=3) as hb:
+        hb.track(["HK_A"])
+        time.sleep(1.5)
+    assert job_queue.claim_batch("node2") == []
+
+
+def test_merge_shards_into_main(tmp_path):
+    _, shards = _import_queue_modules()
+    hw = shards.stats
+    main = str(tmp_path / "main.db")
+
+    paths = []
+    for name, top3, field_size in (("a", 1, 12), ("b", 2, 14)):
+        hw.DB_PATH = str(tmp_path / f"{name}.db")
+        assert "create_running_position_table" in shards.init_shard_schema()
+        hw.upsert_class_jump_pref("HK_A", {"24/25": {"Up": {"Top3Count": top3, "TotalRuns": 4}}})
+        hw.upsert_draw_pref("HK_" + name.upper(), {"24/25": {("ST", "Mid", "Inner"): {"Top3Count": 1, "TotalRuns": 2}}})
+        hw.upsert_running_position({
+            "HorseID": "HK_A", "RaceDate": "2024-10-01", "RaceID": "101", "RaceNo": "3",
+            "Season": "24/25", "EarlyPos": top3, "FieldSize": field_size,
+        })
+        paths.append(hw.DB_PATH)
+        time.sleep(0.01)  # shards merge in mtime order
+
+    hw.DB_PATH = main
+    merged = shards.merge_shards(paths)
+    assert merged["horse_class_jump_pref"] == 2
+    assert merged["horse_draw_pref"] == 2
+
+    conn = sqlite3.connect(main)
+    # Newest shard wins for upserted rows...
+    assert conn.execute("SELECT Top3Count FROM horse_class_jump_pref").fetchall() == [(2,)]
+    # ...append-only rows get fresh IDs...
+    assert conn.execute("SELECT ID, HorseID FROM horse_draw_pref ORDER BY ID").fetchall() == [(1, "HK_A"), (2, "HK_B")]
+    # ...and a known field size is kept, as in upsert_running_position
+    assert conn.execute("SELECT EarlyPos, FieldSize FROM horse_running_position").fetchall() == [(2, 12)]
+    conn.close()
+
+
+def test_new_shard_starts_with_the_main_field_size_cache(tmp_path):
+    _, shards = _import_queue_modules()
+    hw = shards.stats
+    hw.DB_PATH = main = str(tmp_path / "main.db")
+    hw.create_race_field_size_table()
+    conn = sqlite3.connect(main)
+    conn.execute("INSERT INTO race_field_size VALUES ('2024/06/01', '1', 'ST', 14)")
+    conn.commit()
+    conn.close()
+
+    shards.use_shard(str(tmp_path / "main.shard-a.db"))
+    shards.init_shard_schema(main)
+    conn = sqlite3.connect(hw.DB_PATH)
+    assert conn.execute("SELECT * FROM race_field_size").fetchall() == [("2024/06/01", "1", "ST", 14)]
+    conn.close()
@@ -0,0 +1,65 @@
+import json
+import sys
+import types
+
+
+def _import_utils_module():
+    import utils_special as utils
+    return utils
+
+
+class _Expensive:
+    formatted = 0
+
+    def __str__(self):
+        _Expensive.formatted += 1
+        return "expensive"
+
+
+def test_logger_is_gated_by_module_level_and_formats_lazily(capsys):
+    utils = _import_utils_module()
+    module = types.ModuleType("fake_builder")
+    module.DEBUG_LEVEL = "INFO"
+    sys.modules["fake_builder"] = module
+    logger = utils.get_logger("fake_builder")
+    assert utils.get_logger("fake_builder") is logger
+
+    value = _Expensive()
+    assert not logger.isEnabledFor("DEBUG")
+    logger.debug("row %s", value)
+    logger.trace("row %s", value)
+    logger.info("kept %d", 3)
+    logger.warning("always %s", "shown")
+    assert _Expensive.formatted == 0
+    assert capsys.readouterr().out.splitlines() == ["[INFO] kept 3", "[WARNING] always shown"]
+
+    # DEBUG_LEVEL changes are picked up without re-resolving the module
+    module.DEBUG_LEVEL = "DEBUG"
+    logger.debug("row %s", value)
+    logger.trace("row %s", value)
+    assert _Expensive.formatted == 1
+    assert capsys.readouterr().out == "[DEBUG] row expensive\n"
+
+    module.DEBUG_LEVEL = "OFF"
+    logger.info("hidden")
+    logger.error("still %s", "shown")
+    assert capsys.readouterr().out == "[ERROR] still shown\n"
+    del sys.modules["fake_builder"]
+
+
+def test_json_log_copies_emitted_messages(tmp_path, capsys):
+    utils = _import_utils_module()
+    path = tmp_path / "run.jsonl"
+    utils.set_json_log(str(path))
+    try:
+        utils.log("INFO", "plain", 42)
+        utils.log("DEBUG", "filtered out")
+        utils.get_logger("not_imported").warning("lazy %s", "args")
+    finally:
+        utils.set_json_log(None)
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(r["level"], r["msg"]) for r in records] == [("INFO", "plain 42"), ("WARNING", "lazy args")]
+    assert records[0]["logger"] == __name__
+    assert records[1]["logger"] == "not_imported"
+    assert capsys.readouterr().out == "[INFO] plain 42\n[WARNING] lazy args\n"
@@ -0,0 +1,26 @@
+
+
+def _import_memory_module():
+    import _memory_special as memory
+    return memory
+
+
+def test_meter_tracks_which_horse_raised_the_peak():
+    memory = _import_memory_module()
+    if memory.peak_rss_mb() is None:
+        return  # no getrusage on this platform
+
+    meter = memory.MemoryMeter("test")
+    meter.sample("HK_A")
+    # Enough to push past any earlier high-water mark of this process
+    headroom = memory.peak_rss_mb() - (memory.current_rss_mb() or 0)
+    ballast = bytearray(int(headroom + 64) * 1024 * 1024)
+    ballast[::4096] = b"x" * len(ballast[::4096])  # touch every page so it is resident
+    meter.sample("HK_BIG")
+    del ballast
+
+    summary = meter.summary()
+    assert summary["horses"] == 2
+    assert summary["max_peak_horse"] == "HK_BIG"
+    assert summary["max_peak_rise_mb"] >= 32
+    assert summary["peak_mb"] >= summary["max_peak_rise_mb"]
@@ -0,0 +1,187 @@
+import pickle
+
+
+def _import_pipeline_modules():
+    import _html_rows_special as html_rows
+    import _pipeline_special as pipeline
+    return html_rows, pipeline
+
+
+def _parse_page(item, payload):
+    # Runs in a worker process
+    if item == 7:
+        raise ValueError("bad page")
+    return {"item": item, "length": len(payload)}
+
+
+class _Fetcher:
+    closed = 0
+
+    def __call__(self, item):
+        if item == 3:
+            raise IOError("timeout")
+        return "x" * item
+
+    def close(self):
+        _Fetcher.closed += 1
+
+
+def test_pipeline_parses_in_processes_and_writes_on_caller():
+    _, pipeline = _import_pipeline_modules()
+    written, errors = {}, {}
+
+    ok, failed = pipeline.run_pipeline(
+        range(40), _Fetcher, _parse_page,
+        on_result=lambda item, result: written.__setitem__(item, result),
+        on_error=lambda item, error: errors.__setitem__(item, str(error)),
+        fetch_workers=3, parse_workers=2, queue_size=4,
+    )
+
+    assert (ok, failed) == (38, 2)
+    assert errors == {3: "timeout", 7: "bad page"}
+    assert written[39] == {"item": 39, "length": 39}
+    assert _Fetcher.closed == 3
+
+
+def _kill_worker(item, payload):
+    # Takes the whole pool down (BrokenProcessPool)
+    import os
+    os._exit(1)
+
+
+class _FailingStart:
+    started = 0
+
+    def __init__(self):
+        _FailingStart.started += 1
+        if _FailingStart.started == 1:
+            raise RuntimeError("no browser")
+
+    def __call__(self, item):
+        return "x"
+
+
+def test_pipeline_reports_failed_fetcher_start_and_broken_pool():
+    _, pipeline = _import_pipeline_modules()
+    errors = {}
+
+    ok, failed = pipeline.run_pipeline(
+        range(12), _FailingStart, _parse_page,
+        on_result=lambda item, result: None,
+        on_error=lambda item, error: errors.__setitem__(item, str(error)),
+        fetch_workers=2, parse_workers=1, queue_size=2,
+    )
+    assert ok + failed == 12
+    assert set(errors.values()) <= {"no browser", "bad page"}
+
+    errors.clear()
+    ok, failed = pipeline.run_pipeline(
+        range(6), _Fetcher, _kill_worker,
+        on_result=lambda item, result: None,
+        on_error=lambda item, error: errors.__setitem__(item, type(error).__name__),
+        fetch_workers=1, parse_workers=1, queue_size=2,
+    )
+    assert (ok, failed) == (0, 6)
+    assert errors[0] == "BrokenProcessPool" and errors[3] == "OSError"
+
+
+def _items_then_locked():
+    yield 1
+    yield 2
+    raise RuntimeError("database is locked")
+
+
+def test_pipeline_reraises_when_the_items_fail():
+    _, pipeline = _import_pipeline_modules()
+    written = []
+
+    try:
+        pipeline.run_pipeline(
+            _items_then_locked(), _Fetcher, _parse_page,
+            on_result=lambda item, result: written.append(item),
+            on_error=lambda item, error: None,
+            fetch_workers=2, parse_workers=1, queue_size=2,
+        )
+    except RuntimeError as e:
+        assert str(e) == "database is locked"
+    else:
+        raise AssertionError("run_pipeline() swallowed the items error")
+    assert sorted(written) == [1, 2]  # already fetched, still written
+
+
+class _Tag:
+    """Minimal stand-in for a bs4 Tag (strings / attrs / find / find_all)."""
+
+    def __init__(self, name, strings=(), children=(), attrs=None):
+        self.name = name
+        self.strings = list(strings)
+        self.children = list(children)
+        self.attrs = attrs or {}
+        for child in self.children:
+            self.strings += child.strings
+
+    def find_all(self, name):
+        found = []
+        for child in self.children:
+            if child.name == name:
+                found.append(child)
+            found += child.find_all(name)
+        return found
+
+    def find(self, name):
+        found = self.find_all(name)
+        return found[0] if found else None
+
+
+def test_plain_rows_keep_text_and_links_and_pickle():
+    html_rows, _ = _import_pipeline_modules()
+    link = _Tag("a", [" 123 "], attrs={"href": "/r?RaceNo=3"})
+    table = _Tag("table", children=[
+        _Tag("tr", children=[_Tag("td", ["Race"])]),
+        _Tag("tr", attrs={"class": ["r"]}, children=[
+            _Tag("td", children=[link]),
+            _Tag("td", ["\n 1 ", "DH", "\n"]),
+        ]),
+    ])
+
+    rows = pickle.loads(pickle.dumps(html_rows.rows_from_table(table)))
+    assert len(rows) == 2
+    cells = rows[1].find_all("td")
+    assert rows[1].attrs == {"class": ["r"]}
+    assert cells[0].find("a")["href"] == "/r?RaceNo=3"
+    assert cells[0].find("a").get_text(strip=True) == "123"
+    assert cells[1].get_text() == "\n 1 DH\n"
+    assert cells[1].get_text(strip=True) == "1DH"
+    assert cells[1].find("a") is None
+
+
+def test_rows_from_browser_json_match_tag_rows():
+    html_rows, _ = _import_pipeline_modules()
+    link = _Tag("a", [" 123 "], attrs={"href": "/r?RaceNo=3"})
+    table = _Tag("table", children=[
+        _Tag("tr", children=[_Tag("td", ["Race"])]),
+        _Tag("tr", attrs={"class": ["r"]}, children=[
+            _Tag("td", children=[link]),
+            _Tag("td", ["\n 1 ", "DHé", "\n"]),
+        ]),
+    ])
+    # What TABLE_ROWS_JS returns for the same table
+    table_json = [
+        {"attrs": {}, "cells": [{"strings": ["Race"], "link": None}]},
+        {"attrs": {"class": ["r"]}, "cells": [
+            {"strings": [" 123 "], "link": {"strings": [" 123 "], "attrs": {"href": "/r?RaceNo=3"}}},
+            {"strings": ["\n 1 ", "DHé", "\n"], "link": None},
+        ]},
+    ]
+
+    from_tags = html_rows.rows_from_table(table)
+    from_json = html_rows.rows_from_json(table_json)
+    assert [r.attrs for r in from_json] == [r.attrs for r in from_tags]
+    for tag_row, json_row in zip(from_tags, from_json):
+        for tag_cell, json_cell in zip(tag_row.find_all("td"), json_row.find_all("td")):
+            assert json_cell.get_text() == tag_cell.get_text()
+            assert (json_cell.find("a") is None) == (tag_cell.find("a") is None)
+    assert from_json[1].find_all("td")[0].find("a")["href"] == "/r?RaceNo=3"
+
+    cleaned = html_rows.rows_from_json(table_json, clean=lambda s: s.replace("é", ""))
+    assert cleaned[1].find_all("td")[1].get_text(strip=True) == "1DH"
@@ -0,0 +1,55 @@
+import sqlite3
+import time
+
+
+def _import_versions_module():
+    import _pref_versions_special as versions
+    return versions
+
+
+def _versions(versions):
+    conn = sqlite3.connect(versions.stats.DB_PATH)
+    rows = conn.execute(
+        "SELECT JumpType, Top3Count, TotalRuns, ValidFrom, ValidTo "
+        "FROM horse_class_jump_pref_versions ORDER BY JumpType, ValidFrom, VersionID"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_versions_time_travel_and_compaction(tmp_path):
+    versions = _import_versions_module()
+    hw = versions.stats
+    hw.DB_PATH = str(tmp_path / "test.db")
+
+    hw.create_class_jump_pref_table()
+    assert versions.enable_pref_versioning() == ["horse_class_jump_pref"]
+
+    hw.upsert_class_jump_pref("HK_A", {"24/25": {"Up": {"Top3Count": 1, "TotalRuns": 2}}})
+    time.sleep(0.01)
+    hw.upsert_class_jump_pref("HK_A", {"24/25": {"Up": {"Top3Count": 2, "TotalRuns": 3}}})
+    time.sleep(0.01)
+    # Unchanged re-scrape: new version until compaction merges it
+    hw.upsert_class_jump_pref("HK_A", {"24/25": {"Up": {"Top3Count": 2, "TotalRuns": 3}}})
+
+    history = _versions(versions)
+    assert [(r[1], r[2]) for r in history] == [(1, 2), (2, 3), (2, 3)]
+    assert history[0][4] == history[1][3]       # contiguous validity
+    assert history[-1][4] is None               # current version is open
+
+    # "Morning of race day": between first and second upsert
+    _, rows = versions.fetch_pref_as_of("horse_class_jump_pref", "HK_A", history[0][3])
+    assert [(r[2], r[4], r[5]) for r in rows] == [("Up", 1, 2)]
+    _, rows = versions.fetch_pref_as_of("horse_class_jump_pref", "HK_A", "1999-01-01 00:00")
+    assert rows == []
+
+    assert versions.compact_pref_versions() == 1
+    history = _versions(versions)
+    assert [(r[1], r[2], r[4]) for r in history] == [(1, 2, history[1][3]), (2, 3, None)]
+
+    # Deleting the live row closes its version
+    conn = sqlite3.connect(hw.DB_PATH)
+    conn.execute("DELETE FROM horse_class_jump_pref")
+    conn.commit()
+    conn.close()
+    assert _versions(versions)[-1][4] is not None
@@ -0,0 +1,91 @@
+import csv
+import pickle
+
+
+def _import_retry_modules():
+    import _retry_special as retry
+    import _dead_letters_special as dead_letters
+    return retry, dead_letters
+
+
+def test_transient_errors_are_retried_with_backoff():
+    retry, _ = _import_retry_modules()
+    calls, delays, retried = [], [], []
+
+    def _flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionResetError("Connection reset by peer")
+        if len(calls) == 2:
+            raise retry.MissingTableError("No race table", "<html></html>")
+        return "page"
+
+    result = retry.retry_call(_flaky, attempts=3, base=1.0, cap=4.0,
+                              on_retry=retried.append, sleep=delays.append)
+    assert result == "page"
+    assert len(calls) == 3
+    assert [type(e).__name__ for e in retried] == ["ConnectionResetError", "MissingTableError"]
+    assert 0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0
+
+
+def test_permanent_errors_fail_immediately():
+    retry, _ = _import_retry_modules()
+    calls = []
+
+    def _broken():
+        calls.append(1)
+        raise ValueError("Could not parse distance")
+
+    try:
+        retry.retry_call(_broken, attempts=5, sleep=lambda _: None)
+    except ValueError:
+        pass
+    assert len(calls) == 1
+    assert retry.classify_error(ValueError("x")) == retry.PERMANENT
+    assert retry.classify_error(TimeoutError()) == retry.TRANSIENT
+
+
+def test_only_transient_selenium_errors_are_retried():
+    retry, _ = _import_retry_modules()
+    # Selenium's hierarchy: every error subclasses WebDriverException
+    WebDriverException = type("WebDriverException", (Exception,), {})
+    TimeoutException = type("TimeoutException", (WebDriverException,), {})
+    NoSuchElementException = type("NoSuchElementException", (WebDriverException,), {})
+    InvalidArgumentException = type("InvalidArgumentException", (WebDriverException,), {})
+
+    assert retry.classify_error(TimeoutException("page load")) == retry.TRANSIENT
+    assert retry.classify_error(NoSuchElementException("no such element: table")) == retry.PERMANENT
+    assert retry.classify_error(InvalidArgumentException("invalid argument: url")) == retry.PERMANENT
+    assert retry.classify_error(WebDriverException("unknown error")) == retry.PERMANENT
+    assert retry.classify_error(
+        WebDriverException("unknown error: net::ERR_CONNECTION_RESET")) == retry.TRANSIENT
+
+
+def test_page_error_pickles_with_its_snapshot():
+    retry, _ = _import_retry_modules()
+    error = pickle.loads(pickle.dumps(retry.PageError("bad row", "<table/>")))
+    assert str(error) == "bad row"
+    assert error.page_source == "<table/>"
+
+
+def test_dead_letters_keep_reason_and_snapshot(tmp_path):
+    retry, dead_letters = _import_retry_modules()
+    dead_letters.stats.DB_PATH = str(tmp_path / "test.db")
+
+    dead_letters.record_dead_letter("HK_A", retry.PageError("ValueError: bad row", "<html>A</html>"), run_id="r1")
+    dead_letters.record_dead_letter("HK_B", TimeoutError("Timed out 3 times"), run_id="r1")
+    dead_letters.record_dead_letter("HK_A", retry.PageError("ValueError: bad row again"), run_id="r2")
+
+    rows = {row[0]: row for row in dead_letters.list_dead_letters()}
+    assert rows["HK_A"][1:4] == ("PageError", "ValueError: bad row again", 2)
+    # A later failure without a page keeps the last snapshot
+    assert dead_letters.load_snapshot("HK_A") == "<html>A</html>"
+    assert dead_letters.load_snapshot("HK_B") is None
+
+    path, count = dead_letters.export_dead_letters()
+    assert count == 2
+    with open(path, newline="") as fh:
+        assert sorted(r["HorseID"] for r in csv.DictReader(fh)) == ["HK_A", "HK_B"]
+
+    dead_letters.clear_dead_letter("HK_A")
+    assert [row[0] for row in dead_letters.list_dead_letters()] == ["HK_B"]
@@ -0,0 +1,38 @@
+
+
+def _import_journal_module():
+    import _run_journal_special as journal
+    return journal
+
+
+def test_resume_skips_done_and_retries_failed(tmp_path):
+    journal = _import_journal_module()
+    journal.stats.DB_PATH = str(tmp_path / "test.db")
+    csv_path = tmp_path / "ids.csv"
+    csv_path.write_text("HorseID\nHK_A\nHK_B\nHK_C\n")
+    horse_ids = ["HK_A", "HK_B", "HK_C"]
+
+    run_id = journal.start_run(str(csv_path))
+    for horse_id in journal.iter_unfinished(run_id, horse_ids):
+        journal.mark_started(run_id, horse_id)
+        if horse_id == "HK_A":
+            journal.mark_done(run_id, horse_id)
+        elif horse_id == "HK_B":
+            journal.mark_failed(run_id, horse_id, "timeout")
+        else:
+            break  # simulated crash while HK_C is in flight
+
+    assert journal.run_summary(run_id) == {"done": 1, "failed": 1, "pending": 1}
+    assert journal.has_unfinished(run_id)
+
+    # Resume over the same file continues the same run
+    assert journal.start_run(str(csv_path), resume=True) == run_id
+    assert list(journal.iter_unfinished(run_id, horse_ids)) == ["HK_B", "HK_C"]
+
+    # Attempts are capped: a horse that always fails is eventually given up
+    assert list(journal.iter_unfinished(run_id, horse_ids, max_attempts=1)) == []
+    assert not journal.has_unfinished(run_id, max_attempts=1)
+
+    # A changed input file starts a fresh run
+    csv_path.write_text("HorseID\nHK_A\n")
+    assert journal.start_run(str(csv_path), resume=True) != run_id
@@ -0,0 +1,64 @@
+import sqlite3
+import time
+
+
+def _import_metrics_module():
+    import _run_metrics_special as run_metrics
+    return run_metrics
+
+
+def test_stages_and_laps_add_up_per_horse():
+    run_metrics = _import_metrics_module()
+    timer = run_metrics.HorseTimer("HK_A")
+
+    for _ in range(2):  # a retried stage accumulates
+        with timer.stage("page_load"):
+            time.sleep(0.01)
+    timer.mark()
+    time.sleep(0.01)
+    timer.lap("upsert")
+    timer.lap("nothing")
+    timer.merge({"parse": 0.5})
+
+    assert 0.02 <= timer.stages["page_load"] < 0.2
+    assert 0.01 <= timer.stages["upsert"] < 0.1
+    assert timer.stages["nothing"] < 0.01
+    assert timer.stages["parse"] == 0.5
+
+    with run_metrics.NULL_TIMER.stage("page_load"):
+        run_metrics.NULL_TIMER.lap("upsert")
+
+
+def test_run_is_stored_and_summarised(tmp_path):
+    run_metrics = _import_metrics_module()
+    run_metrics.stats.DB_PATH = str(tmp_path / "test.db")
+    metrics = run_metrics.RunMetrics()
+    metrics.start("run1")
+
+    slow = metrics.timer("HK_19")  # wall clock starts here
+    time.sleep(0.05)
+    for i in range(20):
+        timer = metrics.timer(f"HK_{i:02d}")
+        timer.add("page_load", float(i))
+        timer.add("parse", 0.1)
+        metrics.finish(f"HK_{i:02d}", "done" if i else "failed")
+    metrics.flush()
+
+    summary = metrics.summary(slowest=1)
+    assert summary["horses"] == 20
+    page_load = summary["stages"]["page_load"]
+    assert (page_load["p50"], page_load["p95"], page_load["max"]) == (10.0, 18.0, 19.0)
+    horse_id, status, total, stage, seconds = summary["slowest"][0]
+    assert (horse_id, status, stage, seconds) == ("HK_19", "done", "page_load", 19.0)
+    assert total >= 0.05 and slow.stages["parse"] == 0.1
+
+    conn = sqlite3.connect(run_metrics.stats.DB_PATH)
+    rows = conn.execute("""
+        SELECT Stage, Seconds, Status FROM run_metrics
+        WHERE RunID = 'run1' AND HorseID = 'HK_00' ORDER BY Stage
+    """).fetchall()
+    count = conn.execute("SELECT COUNT(DISTINCT HorseID) FROM run_metrics").fetchone()[0]
+    conn.close()
+    assert [(stage, status) for stage, _, status in rows] == [
+        ("page_load", "failed"), ("parse", "failed"), ("total", "failed")]
+    assert count == 20
@@ -0,0 +1,80 @@
+import sqlite3
+
+
+def _import_stats_module():
+    import _horse_dynamic_stats_special as hw
+    return hw
+
+
+def _seed_running_positions(hw):
+    hw.create_running_position_table()
+    conn = sqlite3.connect(hw.DB_PATH)
+    rows = [
+        # HorseID, RaceID, Season, RaceCourse, CourseType, DistanceGroup, TurnCount, EarlyPos, FieldSize, Placing
+        ("HK_A", "101", "24/25", "ST", "A", "Mid", 1.0, 1, 14, 1),
+        ("HK_A", "102", "24/25", "ST", "A", "Mid", 1.0, 2, 14, 4),
+        ("HK_A", "103", "24/25", "ST", "A", "Mid", 1.0, 3, 12, 2),
+        ("HK_A", "104", "24/25", "HV", "C", "Short", 1.5, 6, 12, 3),
+        ("HK_A", "105", "23/24", "HV", "C", "Short", 1.5, 12, 12, 9),
+        ("HK_A", "106", "23/24", "", None, None, None, 5, 10, None),
+        ("HK_A", "107", "23/24", "ST", "A", "Mid", 1.0, 4, 0, 1),     # no field size
+        ("HK_A", "108", "23/24", "ST", "A", "Mid", 1.0, None, 14, 1),  # no early pos
+        ("HK_B", "201", "24/25", "ST", "AWT", "Long", 2.0, 9, 14, 1),
+        ("HK_B", "202", "24/25", "ST", "AWT", "Long", 2.0, 10, 14, 2),
+        ("HK_B", "203", "24/25", "ST", "AWT", "Long", 2.0, 14, 14, 3),
+        ("HK_B", "204", "24/25", "ST", "AWT", "Long", 2.0, 1, 1, 5),   # single-runner field
+    ]
+    conn.executemany(
+        """
+        INSERT INTO horse_running_position (
+            HorseID, RaceID, Season, RaceCourse, CourseType, DistanceGroup,
+            TurnCount, EarlyPos, FieldSize, Placing, RaceDate
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '2024-10-01')
+        """,
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def _style_rows(hw):
+    conn = sqlite3.connect(hw.DB_PATH)
+    rows = conn.execute(
+        """
+        SELECT HorseID, Season, RaceCourse, CourseType, DistanceGroup,
+               TurnCount, StyleBucket, Top3Rate, Top3Count, TotalRuns
+        FROM horse_running_style_pref
+        ORDER BY 1, 2, 3, 4, 5, 6, 7
+        """
+    ).fetchall()
+    conn.execute("DELETE FROM horse_running_style_pref")
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def test_sql_rebuild_matches_python_rebuild(tmp_path):
+    hw = _import_stats_module()
+    hw.DB_PATH = str(tmp_path / "test.db")
+    _seed_running_positions(hw)
+
+    py_upserts, py_groups = hw.rebuild_running_style_pref()
+    expected = _style_rows(hw)
+
+    sql_upserts, sql_groups = hw.rebuild_running_style_pref_sql()
+    assert _style_rows(hw) == expected
+    assert (sql_upserts, sql_groups) == (py_upserts, py_groups)
+
+
+def test_sql_rebuild_single_horse_scope(tmp_path):
+    hw = _import_stats_module()
+    hw.DB_PATH = str(tmp_path / "test.db")
+    _seed_running_positions(hw)
+
+    hw.rebuild_running_style_pref("HK_B")
+    expected = _style_rows(hw)
+
+    hw.rebuild_running_style_pref_sql("HK_B")
+    rows = _style_rows(hw)
+    assert rows == expected
+    assert {r[0] for r in rows} == {"HK_B"}
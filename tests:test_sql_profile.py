@@ -0,0 +1,72 @@
+import sqlite3
+
+
+def _import_scraper_module():
+    import _scrape_horses_dynamic_data_special2 as scraper
+    import _sql_profile_special as sql_profile
+    return scraper, sql_profile
+
+
+def _create_tables(stats):
+    for create in (stats.create_class_jump_pref_table, stats.create_running_style_pref_table,
+                   stats.create_draw_pref_table, stats.create_running_position_table,
+                   stats.create_race_field_size_table):
+        create()
+
+
+def test_statements_are_counted_per_sql_text(tmp_path):
+    scraper, sql_profile = _import_scraper_module()
+    scraper.stats.DB_PATH = str(tmp_path / "test.db")
+    scraper.stats.create_race_field_size_table()
+    sql_profile.PROFILE.reset()
+
+    with sql_profile.profiling(scraper.stats, scraper):
+        conn = scraper.sqlite3.connect(scraper.stats.DB_PATH)
+        conn.executemany(
+            "INSERT INTO race_field_size (RaceDate, RaceNo, RaceCourse, FieldSize) VALUES (?, ?, ?, ?)",
+            [("2024/06/01", "1", "ST", 14), ("2024/06/01", "2", "ST", 12)],
+        )
+        conn.commit()
+        conn.close()
+        assert scraper._cached_field_size("2024/06/01", 1, "ST") == 14
+        assert scraper._cached_field_size("2024/06/01", 9, "ST") is None
+    assert scraper.sqlite3 is sqlite3 and scraper.stats.sqlite3 is sqlite3
+
+    report = {sql: (calls, rows) for sql, calls, rows, _ in sql_profile.PROFILE.report()}
+    assert report[sql_profile.normalize_sql(scraper._FIELD_SIZE_SQL)] == (2, 1)
+    assert report["INSERT INTO race_field_size (RaceDate, RaceNo, RaceCourse, FieldSize) "
+                  "VALUES (?, ?, ?, ?)"] == (1, 2)
+
+
+def test_audit_plans_every_registered_read_query(tmp_path):
+    scraper, sql_profile = _import_scraper_module()
+    scraper.stats.DB_PATH = str(tmp_path / "test.db")
+    _create_tables(scraper.stats)
+
+    results = sql_profile.audit_query_plans()
+    assert {"fetch_class_jump_pref_ordered", "fetch_running_style_pref_ordered",
+            "fetch_draw_pref_ordered", "rebuild_running_style_pref", "race_field_size"} <= set(results)
+    for name, result in results.items():
+        assert result["error"] is None, name
+        assert result["unexpected"] == [], (name, result["plan"])
+    assert results["race_field_size"]["findings"] == []
+
+    conn = sqlite3.connect(scraper.stats.DB_PATH)
+    conn.execute("DROP INDEX idx_horse_draw_pref_horse")
+    conn.close()
+    flagged = sql_profile.audit_query_plans(names=["fetch_draw_pref_ordered"])
+    assert [kind for kind, _ in flagged["fetch_draw_pref_ordered"]["unexpected"]] == ["scan"]
+    assert sql_profile.log_audit(flagged) == 1
+
+
+def test_plan_findings():
+    _, sql_profile = _import_scraper_module()
+    plan = [
+        "SCAN horse_draw_pref",
+        "SCAN horse_running_position USING INDEX sqlite_autoindex_horse_running_position_1",
+        "SEARCH race_field_size USING INDEX sqlite_autoindex_race_field_size_1 (RaceDate=?)",
+        "SCAN (subquery-1)",
+        "USE TEMP B-TREE FOR ORDER BY",
+    ]
+    assert sql_profile.plan_findings(plan) == [
+        ("scan", "SCAN horse_draw_pref"), ("temp_btree", "USE TEMP B-TREE FOR ORDER BY")]
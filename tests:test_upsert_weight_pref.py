@@ -1,32 +1,7 @@
 import sqlite3
-import sys
-import types
 
 
 def test_duplicate_insert_after_update_skipped(capsys, tmp_path):
-    # Stub external dependencies required for module import
-    sys.modules.setdefault("pandas", types.ModuleType("pandas"))
-    bs4 = types.ModuleType("bs4")
-    bs4.BeautifulSoup = object
-    bs4.UnicodeDammit = object
-    sys.modules["bs4"] = bs4
-
-    selenium = types.ModuleType("selenium")
-    webdriver = types.ModuleType("selenium.webdriver")
-    chrome = types.ModuleType("selenium.webdriver.chrome")
-    service = types.ModuleType("selenium.webdriver.chrome.service")
-    webdriver.Chrome = object
-    service.Service = object
-    webdriver.chrome = chrome
-    chrome.service = service
-    selenium.webdriver = webdriver
-    sys.modules["selenium"] = selenium
-    sys.modules["selenium.webdriver"] = webdriver
-    sys.modules["selenium.webdriver.chrome"] = chrome
-    sys.modules["selenium.webdriver.chrome.service"] = service
-
-    sys.modules.setdefault("ftfy", types.ModuleType("ftfy"))
-
     import _horse_dynamic_stats_special as hw
 
     # Setup temporary database with additional unique constraint
@@ -0,0 +1,64 @@
+import subprocess
+import time
+
+import pytest
+
+
+def _import_watchdog_module():
+    import _watchdog_special as watchdog
+    return watchdog
+
+
+def test_call_with_budget_times_out_and_runs_cleanup():
+    watchdog = _import_watchdog_module()
+    cleaned = []
+
+    assert watchdog.call_with_budget(lambda: 42, budget=1) == 42
+    with pytest.raises(ZeroDivisionError):
+        watchdog.call_with_budget(lambda: 1 / 0, budget=1)
+
+    started = time.monotonic()
+    with pytest.raises(watchdog.HorseTimeout):
+        watchdog.call_with_budget(lambda: time.sleep(5), budget=0.2,
+                                  on_timeout=lambda: cleaned.append(True), label="HK_A")
+    assert time.monotonic() - started < 2
+    assert cleaned == [True]
+
+
+def test_kill_process_tree_kills_children():
+    watchdog = _import_watchdog_module()
+    parent = subprocess.Popen(["sh", "-c", "sleep 30 & sleep 30 & wait"])
+    time.sleep(0.3)
+    children = watchdog._descendants(parent.pid, watchdog._process_table())
+    assert len(children) == 2
+
+    assert watchdog.kill_process_tree(parent.pid) == 3
+    parent.wait(timeout=5)
+    time.sleep(0.1)
+    alive = {pid for pid, _, _ in watchdog._process_table()}
+    assert not alive & set(children)
+
+
+def test_browser_started_after_the_budget_is_closed_not_published(monkeypatch):
+    watchdog = _import_watchdog_module()
+    import _scrape_horses_dynamic_data_special2 as scraper
+    closed, used = [], []
+
+    def _slow_start(*args, **kwargs):
+        time.sleep(0.4)
+        return object()
+
+    monkeypatch.setattr(scraper, "new_chrome_driver", _slow_start)
+    monkeypatch.setattr(scraper, "close_driver", lambda driver: driver is not None and closed.append(driver))
+    monkeypatch.setattr(scraper, "fetch_rendered_page", lambda url, driver: used.append(driver))
+    monkeypatch.setattr(scraper, "HORSE_BUDGET_SECONDS", 0.1)
+
+    fetcher = scraper.ChromeFetcher(retries=1)
+    with pytest.raises(watchdog.HorseTimeout):
+        fetcher("HK_2020_A001")
+    with pytest.raises(watchdog.HorseTimeout):
+        scraper.extract_dynamic_stats(scraper.horse_page_url("HK_2020_A002"), budget=0.1, retries=1)
+    time.sleep(0.8)  # let the abandoned threads finish starting Chrome
+
+    assert fetcher.driver is None
+    assert len(closed) == 2 and used == []
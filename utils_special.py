@@ -1,7 +1,9 @@
+import json
 import re
+import sys
+import threading
 import unicodedata
 from datetime import datetime
-import inspect
 
 from pathlib import Path
 
@@ -13,7 +15,10 @@ DB_PATH = str(PROJECT_ROOT / "hkjc_horses_dynamic_special.db")
 
 # --- HKJC date parsing helpers ---
 import re
-from datetime import datetime as _dt
+from datetime import date as _date, datetime as _dt
+from functools import lru_cache
+
+from _buckets_special import DRAW_GROUP, distance_table
 
 _DATE_PATTERNS = [
     "%d/%m/%Y",  # 28/06/2023
@@ -23,11 +28,37 @@ _DATE_PATTERNS = [
     "%d/%m/%y",  # 28/06/23
 ]
 
-def parse_hkjc_date(raw):
-    """Return a date (datetime.date) or None. Cleans stray unicode and supports multiple formats."""
-    if not raw:
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+def _fast_dmy(s):
+    """
+    dd/mm/yy or dd/mm/yyyy (the HKJC table format) without regex or
+    exceptions; None if ``s`` is anything else. Two-digit years follow
+    strptime's %y pivot (69-99 -> 19xx, 00-68 -> 20xx).
+    """
+    n = len(s)
+    if (n != 8 and n != 10) or s[2] != "/" or s[5] != "/":
+        return None
+    d, m, y = s[:2], s[3:5], s[6:]
+    if not (d.isdigit() and m.isdigit() and y.isdigit() and d.isascii() and m.isascii() and y.isascii()):
+        return None
+    day, month, year = int(d), int(m), int(y)
+    if n == 8:
+        year += 1900 if year >= 69 else 2000
+    if not 1 <= month <= 12 or year < 1:
         return None
-    s = str(raw).strip()
+    leap = month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if not 1 <= day <= _DAYS_IN_MONTH[month - 1] + leap:
+        return None
+    return _date(year, month, day)
+
+@lru_cache(maxsize=16384)
+def _parse_hkjc_date_cached(raw):
+    s = raw.strip()
+    parsed = _fast_dmy(s)
+    if parsed is not None:
+        return parsed
+
     # strip hidden LTR/RTL marks & non-digits/sep
     s = s.replace("\u200f", "").replace("\u200e", "")
     s = re.sub(r"[^\d/.\-]", "", s)
@@ -50,26 +81,138 @@ def parse_hkjc_date(raw):
             return None
     return None
 
+def parse_hkjc_date(raw):
+    """Return a date (datetime.date) or None. Cleans stray unicode and supports multiple formats.
+
+    Results are memoized per raw string (builders parse the same dates
+    over and over) and the common dd/mm/yy form skips regex and strptime.
+    """
+    if not raw:
+        return None
+    return _parse_hkjc_date_cached(str(raw))
+
+# --- Logging -----------------------------------------------------------------
+# Levels: OFF < INFO < DEBUG < TRACE. Anything else (WARNING, ERROR) is
+# always printed. A module's level is its ``DEBUG_LEVEL`` global.
+_LOG_LEVELS = {"OFF": 0, "INFO": 1, "DEBUG": 2, "TRACE": 3}
+
+# Optional JSON-lines copy of every printed message (set_json_log)
+_json_log = {"fh": None}
+_json_log_lock = threading.Lock()
+
+def set_json_log(path):
+    """Also write every emitted message to ``path`` as JSON lines (None = stop)."""
+    with _json_log_lock:
+        if _json_log["fh"] is not None:
+            _json_log["fh"].close()
+        _json_log["fh"] = open(path, "a", encoding="utf-8") if path else None
+
+def _emit(level, logger_name, args, kwargs):
+    print(f"[{level}]", *args, **kwargs)
+    fh = _json_log["fh"]
+    if fh is not None:
+        record = {
+            "ts": _dt.now().isoformat(timespec="milliseconds"),
+            "level": level,
+            "logger": logger_name,
+            "msg": kwargs.get("sep", " ").join(str(a) for a in args),
+        }
+        with _json_log_lock:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            fh.flush()
+
 def log(level, *args, **kwargs):
     """Simple logging helper with module-level debug control.
 
     Uses the caller's ``DEBUG_LEVEL`` variable if present (defaults to
     ``"INFO"``). Levels: ``OFF`` < ``INFO`` < ``DEBUG`` < ``TRACE``.
+    Arguments are formatted by the caller even when filtered out; in loops
+    use a module Logger (get_logger) instead.
+    """
+    caller_globals = sys._getframe(1).f_globals
+    current_level = _LOG_LEVELS.get(caller_globals.get("DEBUG_LEVEL", "INFO"), 1)
+    if _LOG_LEVELS.get(level, 0) <= current_level:
+        _emit(level, caller_globals.get("__name__"), args, kwargs)
+
+class Logger:
+    """
+    Per-module logging facade. The module's globals are resolved once; each
+    check is a dict lookup on its ``DEBUG_LEVEL`` (so changing it at runtime
+    still works), and messages are %-formatted only when emitted:
+
+        logger = get_logger(__name__)
+        logger.debug("BWR = %s -> %s", bwr, group)
+        if logger.isEnabledFor("TRACE"):
+            ...expensive dump...
     """
-    levels = {"OFF": 0, "INFO": 1, "DEBUG": 2, "TRACE": 3}
-    caller_frame = inspect.currentframe().f_back
-    debug_level = caller_frame.f_globals.get("DEBUG_LEVEL", "INFO")
-    current_level = levels.get(debug_level, 1)
-    msg_level = levels.get(level, 0)
-    if msg_level <= current_level:
-        print(f"[{level}]", *args, **kwargs)
+
+    __slots__ = ("name", "_globals", "_setting", "_level")
+
+    def __init__(self, name):
+        self.name = name
+        self._globals = None
+        self._setting = None
+        self._level = 1
+
+    def _current_level(self):
+        module_globals = self._globals
+        if module_globals is None:
+            # Resolved on first use: the module may still be importing at get_logger()
+            module = sys.modules.get(self.name)
+            if module is None:
+                return 1
+            module_globals = self._globals = vars(module)
+        setting = module_globals.get("DEBUG_LEVEL", "INFO")
+        if setting is not self._setting:
+            self._setting = setting
+            self._level = _LOG_LEVELS.get(setting, 1)
+        return self._level
+
+    def isEnabledFor(self, level):
+        return _LOG_LEVELS.get(level, 0) <= self._current_level()
+
+    def log(self, level, msg, *args):
+        if _LOG_LEVELS.get(level, 0) <= self._current_level():
+            _emit(level, self.name, (msg % args if args else msg,), {})
+
+    # Hot-path shortcuts: one level check, no formatting unless emitted
+    def debug(self, msg, *args):
+        if self._current_level() >= 2:
+            _emit("DEBUG", self.name, (msg % args if args else msg,), {})
+
+    def trace(self, msg, *args):
+        if self._current_level() >= 3:
+            _emit("TRACE", self.name, (msg % args if args else msg,), {})
+
+    def info(self, msg, *args):
+        self.log("INFO", msg, *args)
+
+    def warning(self, msg, *args):
+        self.log("WARNING", msg, *args)
+
+    def error(self, msg, *args):
+        self.log("ERROR", msg, *args)
+
+_loggers = {}
+
+def get_logger(name):
+    """Shared Logger for module ``name`` (pass ``__name__``)."""
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers.setdefault(name, Logger(name))
+    return logger
+
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7F]+')
 
 def sanitize_text(text):
     if not text:
         return ""
     try:
         text = str(text)
-        text = re.sub(r'[^\x00-\x7F]+', '', text)
+        if text.isascii():
+            # Fast path: parsed cells are already clean, skip the regex
+            return text.strip()
+        text = _NON_ASCII_RE.sub('', text)
         return text.strip()
     except:
         return ""
@@ -123,53 +266,21 @@ def parse_lbw(lbw_str, placing):
     except:
         return None
 
-def get_season_code(date_obj):
-    if date_obj.month >= 9:
-        return f"{date_obj.year%100:02d}/{(date_obj.year+1)%100:02d}"
+@lru_cache(maxsize=None)
+def _season_code(year, starts_season):
+    if starts_season:
+        return f"{year%100:02d}/{(year+1)%100:02d}"
     else:
-        return f"{(date_obj.year-1)%100:02d}/{date_obj.year%100:02d}"
+        return f"{(year-1)%100:02d}/{year%100:02d}"
+
+def get_season_code(date_obj):
+    # HK season starts in September; one cached string per (year, half)
+    return _season_code(date_obj.year, date_obj.month >= 9)
 
 def get_distance_group(race_course, course_type, distance):
-    course_type = course_type.upper()
-    race_course = race_course.upper()
-
-    if race_course == "ST":
-        if course_type == "AWT":
-            if distance <= 1000:
-                return "Sprint"
-            if distance <= 1200:
-                return "Short"
-            elif distance <= 1400:
-                return "Short"
-            elif distance <= 1650:
-                return "Mid"
-            elif distance <= 2000:
-                return "Long"
-            else:
-                return "Endurance"
-        else:
-            if distance <= 1000:
-                return "Sprint"
-            elif distance <= 1400:
-                return "Short"
-            elif distance <= 1800:
-                return "Mid"
-            elif distance <= 2200:
-                return "Long"
-            else:
-                return "Endurance"
-    elif race_course == "HV":
-        if distance <= 1000:
-            return "Sprint"
-        elif distance <= 1200:
-            return "Short"
-        elif distance <= 1800:
-            return "Mid"
-        elif distance <= 2200:
-            return "Long"
-        else:
-            return "Endurance"
-    return "Unknown"
+    # ST AWT / ST turf / HV ladders live in _buckets_special.DISTANCE_GROUPS
+    table = distance_table(race_course, course_type)
+    return table.lookup(distance) if table is not None else "Unknown"
 
 def get_distance_group_from_row(course_info, distance_str):
     try:
@@ -187,6 +298,7 @@ def get_distance_group_from_row(course_info, distance_str):
 
 # --- Turn geometry (CountTurn) helpers ---------------------------------------
 
+@lru_cache(maxsize=256)
 def _norm_course(course: str) -> str:
     """Normalize race course to canonical short code: 'ST' or 'HV'."""
     t = (course or "").strip().upper()
@@ -196,6 +308,7 @@ def _norm_course(course: str) -> str:
         return "HV"
     return t  # leave unknowns as-is
 
+@lru_cache(maxsize=256)
 def _norm_surface(surface: str) -> str:
     """Normalize surface to canonical: 'TURF' or 'AWT'."""
     t = (surface or "").strip().upper()
@@ -267,17 +380,7 @@ def get_draw_group(draw_number, field_size=None):
     except (ValueError, TypeError):
         return None
 
-    if 1 <= d <= 3:
-        return "Inside"
-    if 4 <= d <= 6:
-        return "InnerMid"
-    if 7 <= d <= 9:
-        return "OuterMid"
-    if 10 <= d <= 12:
-        return "Wide"
-    if d >= 13:
-        return "Outer"
-    return None
+    return DRAW_GROUP.lookup(d)
 
 def get_jump_type(previous_class, current_class):
     try:
@@ -296,6 +399,8 @@ def get_jump_type(previous_class, current_class):
 __all__ = [
     "DB_PATH",
     "log",
+    "get_logger",
+    "set_json_log",
     "sanitize_text",
     "clean_placing",
     "convert_finish_time",